@@ -0,0 +1,43 @@
+"""Benchmark of the compiled and the array based coordinate transformations.
+
+:func:`get_C_trajectory` and :func:`get_X_trajectory` loop over
+frames and atoms in compiled code, while :func:`get_C_batched` and
+:func:`get_X_batched` transform all frames at once with array operations.
+Run with ``python dev/benchmark_batched.py``.
+"""
+from __future__ import print_function
+
+import os
+import timeit
+
+import numpy as np
+
+import chemcoord as cc
+from chemcoord.cartesian_coordinates._cart_transformation import (
+    get_C_batched, get_C_trajectory)
+from chemcoord.internal_coordinates._zmat_transformation import (
+    get_X_batched, get_X_trajectory)
+
+STRUCTURES = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                          '..', 'tests', 'structures')
+
+for name in ['water.xyz', 'MIL53_small.xyz']:
+    molecule = cc.Cartesian.read_xyz(os.path.join(STRUCTURES, name))
+    zmolecule = molecule.get_zmat()
+    c_table = zmolecule._give_positional_c_table()
+    X = molecule.loc[zmolecule.index, ['x', 'y', 'z']].values.T
+    C = zmolecule.loc[:, ['bond', 'angle', 'dihedral']].values.astype('f8').T
+    C[[1, 2], :] = np.radians(C[[1, 2], :])
+    for n_frames in [1, 100, 10000]:
+        X_frames = np.repeat(X[None], n_frames, axis=0)
+        C_frames = np.repeat(C[None], n_frames, axis=0)
+        for f_name, f, arg in [
+                ('get_C_trajectory', get_C_trajectory, X_frames),
+                ('get_C_batched', get_C_batched, X_frames),
+                ('get_X_trajectory', get_X_trajectory, C_frames),
+                ('get_X_batched', get_X_batched, C_frames)]:
+            f(arg, c_table)
+            t = min(timeit.repeat(lambda: f(arg, c_table), number=5,
+                                  repeat=3)) / 5
+            print('{:<16} {:>6} frames {:<17} {:10.3f} ms'.format(
+                name, n_frames, f_name, t * 1e3))
@@ -0,0 +1,38 @@
+"""Micro-benchmark of the derivatives of the local basis.
+
+:func:`get_grad_B` is called for every atom by the gradients of both
+coordinate transformations.
+It is compared with the fully expanded expressions of
+``grad_B_expanded.py``, which it replaced.
+Run with ``python dev/benchmark_grad_B.py``.
+"""
+from __future__ import print_function
+
+import timeit
+
+import numpy as np
+
+from chemcoord.cartesian_coordinates._cart_transformation import (
+    get_B, get_grad_B)
+from grad_B_expanded import get_grad_B_expanded, give_random_geometries
+
+X = np.random.RandomState(0).normal(size=(3, 4))
+c_table = np.array([[1], [2], [3]])
+get_B(X, c_table, 0)
+get_grad_B(X, c_table, 0)
+get_grad_B_expanded(X, c_table, 0)
+
+n = 100000
+for name, f in [('get_B', get_B), ('get_grad_B', get_grad_B),
+                ('expanded', get_grad_B_expanded)]:
+    t = min(timeit.repeat(lambda: f(X, c_table, 0), number=n, repeat=5))
+    print('{:<12} {:8.3f} us'.format(name, t / n * 1e6))
+
+geometries = give_random_geometries(1000, seed=1)
+new = np.array([get_grad_B(x, c_table, 0) for x in geometries])
+old = np.array([get_grad_B_expanded(x, c_table, 0) for x in geometries])
+scale = np.abs(old).max(axis=(1, 2, 3, 4))[:, None, None, None, None]
+print('max deviation relative to the largest entry: {:.1e}'.format(
+    (np.abs(new - old) / scale).max()))
+print('bitwise equal results: {} of {}'.format(
+    (new == old).all(axis=(1, 2, 3, 4)).sum(), len(geometries)))
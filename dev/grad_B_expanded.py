@@ -0,0 +1,898 @@
+"""The fully expanded derivatives of the local basis.
+
+This is the implementation of
+:func:`chemcoord.cartesian_coordinates._cart_transformation.get_grad_B`
+before it was rewritten with common subexpressions.
+It is kept as reference for ``benchmark_grad_B.py`` and to regenerate
+the reference values of the regression test with
+``python dev/grad_B_expanded.py``.
+"""
+from __future__ import print_function
+
+import os
+
+import numpy as np
+from numba import jit
+
+from chemcoord.cartesian_coordinates._cart_transformation import get_ref_pos
+from chemcoord.cartesian_coordinates.xyz_functions import _jit_cross
+
+REFERENCE = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..',
+                         'tests', 'structures', 'grad_B_reference.npz')
+
+
+@jit(nopython=True, cache=True)
+def get_grad_B_expanded(X, c_table, j):
+    grad_B = np.empty((3, 3, 3, 3))
+    ref_pos = get_ref_pos(X, c_table[:, j])
+    v_b, v_a, v_d = ref_pos[:, 0], ref_pos[:, 1], ref_pos[:, 2]
+    x_b, y_b, z_b = v_b
+    x_a, y_a, z_a = v_a
+    x_d, y_d, z_d = v_d
+    BA, AD = v_a - v_b, v_d - v_a
+    norm_AD_cross_BA = np.linalg.norm(_jit_cross(AD, BA))
+    norm_BA = np.linalg.norm(BA)
+    grad_B[0, 0, 0, 0] = (
+        ((x_a - x_b)
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((y_a - y_b) * (y_a - y_d) + (z_a - z_b) * (z_a - z_d))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * ((y_a - y_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[0, 0, 0, 1] = (
+        ((y_a - y_b)
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((-x_a + x_b) * (y_a - y_d) + (2*x_a - 2*x_d) * (y_a - y_b))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[0, 0, 0, 2] = (
+        ((z_a - z_b)
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((-x_a + x_b) * (z_a - z_d) + (2*x_a - 2*x_d) * (z_a - z_b))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[0, 0, 1, 0] = (
+        ((-x_a + x_b)
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((y_a - y_b) * (y_b - y_d) + (z_a - z_b) * (z_b - z_d))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * ((y_b - y_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_b - z_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[0, 0, 1, 1] = (
+        ((-y_a + y_b)
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_b - x_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_b - z_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         + ((x_a - x_b) * (y_a - y_d)
+            - (x_a - x_d) * (y_a - y_b)
+            - (x_b - x_d) * (y_a - y_b))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[0, 0, 1, 2] = (
+        ((-z_a + z_b)
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_b - x_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_b - y_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         + ((x_a - x_b) * (z_a - z_d)
+            - (x_a - x_d) * (z_a - z_b)
+            - (x_b - x_d) * (z_a - z_b))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[0, 0, 2, 0] = (
+        (-((y_a - y_b)
+           * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+           + (z_a - z_b)
+           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))**2
+         + ((y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
+        / (norm_AD_cross_BA**3 * norm_BA))
+    grad_B[0, 0, 2, 1] = (
+        ((-x_a + x_b) * (y_a - y_b)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
+        / (norm_AD_cross_BA**3 * norm_BA))
+    grad_B[0, 0, 2, 2] = (
+        ((-x_a + x_b) * (z_a - z_b)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
+        / (norm_AD_cross_BA**3 * norm_BA))
+    grad_B[0, 1, 0, 0] = (
+        ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))
+        * ((y_a - y_d)
+           * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+           + (z_a - z_d)
+           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+        / norm_AD_cross_BA**3)
+    grad_B[0, 1, 0, 1] = (
+        ((-z_a + z_d)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+        / norm_AD_cross_BA**3)
+    grad_B[0, 1, 0, 2] = (
+        ((y_a - y_d)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+        / norm_AD_cross_BA**3)
+    grad_B[0, 1, 1, 0] = (
+        (-(y_a - y_b) * (z_a - z_d) + (y_a - y_d) * (z_a - z_b))
+        * ((y_b - y_d)
+           * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+           + (z_b - z_d)
+           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+        / norm_AD_cross_BA**3)
+    grad_B[0, 1, 1, 1] = (
+        ((z_b - z_d)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_b - x_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_b - z_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+        / norm_AD_cross_BA**3)
+    grad_B[0, 1, 1, 2] = (
+        ((-y_b + y_d)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_b - x_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_b - y_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+        / norm_AD_cross_BA**3)
+    grad_B[0, 1, 2, 0] = (
+        (-(y_a - y_b) * (z_a - z_d) + (y_a - y_d) * (z_a - z_b))
+        * ((y_a - y_b)
+           * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+           + (z_a - z_b)
+           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+        / norm_AD_cross_BA**3)
+    grad_B[0, 1, 2, 1] = (
+        ((z_a - z_b)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+        / norm_AD_cross_BA**3)
+    grad_B[0, 1, 2, 2] = (
+        ((-y_a + y_b)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+        / norm_AD_cross_BA**3)
+    grad_B[0, 2, 0, 0] = ((y_a - y_b)**2 + (z_a - z_b)**2) / norm_BA**3
+    grad_B[0, 2, 0, 1] = (-x_a + x_b) * (y_a - y_b) / norm_BA**3
+    grad_B[0, 2, 0, 2] = (-x_a + x_b) * (z_a - z_b) / norm_BA**3
+    grad_B[0, 2, 1, 0] = (-(y_a - y_b)**2 - (z_a - z_b)**2) / norm_BA**3
+    grad_B[0, 2, 1, 1] = (x_a - x_b) * (y_a - y_b) / norm_BA**3
+    grad_B[0, 2, 1, 2] = (x_a - x_b) * (z_a - z_b) / norm_BA**3
+    grad_B[0, 2, 2, 0] = 0.
+    grad_B[0, 2, 2, 1] = 0.
+    grad_B[0, 2, 2, 2] = 0.
+    grad_B[1, 0, 0, 0] = (
+        ((-x_a + x_b)
+         * ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         + (-(x_a - x_d) * (y_a - y_b) + (2*x_a - 2*x_b) * (y_a - y_d))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[1, 0, 0, 1] = (
+        ((-y_a + y_b)
+         * ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b) * (x_a - x_d) + (z_a - z_b) * (z_a - z_d))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_a - x_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[1, 0, 0, 2] = (
+        ((-z_a + z_b)
+         * ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_a - x_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         + ((-y_a + y_b) * (z_a - z_d) + (2*y_a - 2*y_d) * (z_a - z_b))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[1, 0, 1, 0] = (
+        ((x_a - x_b)
+         * ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d)
+               - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_b - y_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_b - z_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         + ((-x_a + x_b) * (y_a - y_d)
+            - (x_a - x_b) * (y_b - y_d)
+            + (x_a - x_d) * (y_a - y_b))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2
+            + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[1, 0, 1, 1] = (
+        ((y_a - y_b)
+         * ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b) * (x_b - x_d) + (z_a - z_b) * (z_b - z_d))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_b - x_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_b - z_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[1, 0, 1, 2] = (
+        ((z_a - z_b)
+         * ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_b - x_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_b - y_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         + ((y_a - y_b) * (z_a - z_d)
+            - (y_a - y_d) * (z_a - z_b)
+            - (y_b - y_d) * (z_a - z_b))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[1, 0, 2, 0] = (
+        ((-x_a + x_b) * (y_a - y_b)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
+        / (norm_AD_cross_BA**3 * norm_BA))
+    grad_B[1, 0, 2, 1] = (
+        (-((x_a - x_b)
+           * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+           - (z_a - z_b)
+           * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))**2
+         + ((x_a - x_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
+        / (norm_AD_cross_BA**3 * norm_BA))
+    grad_B[1, 0, 2, 2] = (
+        (-(y_a - y_b) * (z_a - z_b)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
+        / (norm_AD_cross_BA**3 * norm_BA))
+    grad_B[1, 1, 0, 0] = (
+        ((z_a - z_d)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+         * ((y_a - y_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
+        / norm_AD_cross_BA**3)
+    grad_B[1, 1, 0, 1] = (
+        ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+        * ((x_a - x_d)
+           * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+           - (z_a - z_d)
+           * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+        / norm_AD_cross_BA**3)
+    grad_B[1, 1, 0, 2] = (
+        ((-x_a + x_d) *
+         (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+          + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+          + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+         * ((x_a - x_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
+        / norm_AD_cross_BA**3)
+    grad_B[1, 1, 1, 0] = (
+        ((-z_b + z_d)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+         * ((y_b - y_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_b - z_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
+        / norm_AD_cross_BA**3)
+    grad_B[1, 1, 1, 1] = (
+        ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+        * ((-x_b + x_d)
+           * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+           + (z_b - z_d)
+           * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+        / norm_AD_cross_BA**3)
+    grad_B[1, 1, 1, 2] = (
+        ((x_b - x_d)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+         * ((x_b - x_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_b - y_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
+        / norm_AD_cross_BA**3)
+    grad_B[1, 1, 2, 0] = (
+        ((-z_a + z_b)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b) * (z_a - z_d)
+            - (x_a - x_d) * (z_a - z_b))
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
+        / norm_AD_cross_BA**3)
+    grad_B[1, 1, 2, 1] = (
+        ((-x_a + x_b)
+         * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+         + (z_a - z_b)
+         * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+        * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+        / norm_AD_cross_BA**3)
+    grad_B[1, 1, 2, 2] = (
+        ((x_a - x_b)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+         * ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
+        / norm_AD_cross_BA**3)
+    grad_B[1, 2, 0, 0] = (-x_a + x_b) * (y_a - y_b) / norm_BA**3
+    grad_B[1, 2, 0, 1] = ((x_a - x_b)**2 + (z_a - z_b)**2) / norm_BA**3
+    grad_B[1, 2, 0, 2] = (-y_a + y_b) * (z_a - z_b) / norm_BA**3
+    grad_B[1, 2, 1, 0] = (x_a - x_b) * (y_a - y_b) / norm_BA**3
+    grad_B[1, 2, 1, 1] = (-(x_a - x_b)**2 - (z_a - z_b)**2) / norm_BA**3
+    grad_B[1, 2, 1, 2] = (y_a - y_b) * (z_a - z_b) / norm_BA**3
+    grad_B[1, 2, 2, 0] = 0.
+    grad_B[1, 2, 2, 1] = 0.
+    grad_B[1, 2, 2, 2] = 0.
+    grad_B[2, 0, 0, 0] = (
+        ((-x_a + x_b)
+         * ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         + (-(x_a - x_d) * (z_a - z_b) + (2*x_a - 2*x_b) * (z_a - z_d))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[2, 0, 0, 1] = (
+        ((-y_a + y_b)
+         * ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_a - x_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         + (-(y_a - y_d) * (z_a - z_b) + (2*y_a - 2*y_b) * (z_a - z_d))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[2, 0, 0, 2] = (
+        ((-z_a + z_b)
+         * ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b) * (x_a - x_d) + (y_a - y_b) * (y_a - y_d))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_a - x_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[2, 0, 1, 0] = (
+        ((x_a - x_b) *
+         ((x_a - x_b)
+          * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+          + (y_a - y_b)
+          * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_b - y_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_b - z_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         + ((-x_a + x_b) * (z_a - z_d)
+            - (x_a - x_b) * (z_b - z_d)
+            + (x_a - x_d) * (z_a - z_b))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[2, 0, 1, 1] = (
+        ((y_a - y_b)
+         * ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_b - x_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_b - z_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         + ((-y_a + y_b) * (z_a - z_d)
+            - (y_a - y_b) * (z_b - z_d)
+            + (y_a - y_d) * (z_a - z_b))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[2, 0, 1, 2] = (
+        ((z_a - z_b)
+         * ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d)
+               - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b) * (x_b - x_d) + (y_a - y_b) * (y_b - y_d))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_b - x_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_b - y_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
+        / (norm_AD_cross_BA**3 * norm_BA**3))
+    grad_B[2, 0, 2, 0] = (
+        ((-x_a + x_b) * (z_a - z_b)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
+        / (norm_AD_cross_BA**3 * norm_BA))
+    grad_B[2, 0, 2, 1] = (
+        (-(y_a - y_b) * (z_a - z_b)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+         * ((x_a - x_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+            + (y_a - y_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
+        / (norm_AD_cross_BA**3 * norm_BA))
+    grad_B[2, 0, 2, 2] = (
+        (-((x_a - x_b)
+           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+           + (y_a - y_b)
+           * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))**2
+         + ((x_a - x_b)**2 + (y_a - y_b)**2)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
+        / (norm_AD_cross_BA**3 * norm_BA))
+    grad_B[2, 1, 0, 0] = (
+        ((-y_a + y_d)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+         * ((y_a - y_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
+        / norm_AD_cross_BA**3)
+    grad_B[2, 1, 0, 1] = (
+        ((x_a - x_d)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+         * ((x_a - x_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
+        / norm_AD_cross_BA**3)
+    grad_B[2, 1, 0, 2] = (
+        (-(x_a - x_b) * (y_a - y_d) + (x_a - x_d) * (y_a - y_b))
+        * ((x_a - x_d)
+           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+           + (y_a - y_d)
+           * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+        / norm_AD_cross_BA**3)
+    grad_B[2, 1, 1, 0] = (
+        ((y_b - y_d)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+         * ((y_b - y_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_b - z_d)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
+        / norm_AD_cross_BA**3)
+    grad_B[2, 1, 1, 1] = (
+        ((-x_b + x_d)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+         * ((x_b - x_d)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_b - z_d)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
+        / norm_AD_cross_BA**3)
+    grad_B[2, 1, 1, 2] = (
+        ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+        * ((x_b - x_d)
+           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+           + (y_b - y_d)
+           * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+        / norm_AD_cross_BA**3)
+    grad_B[2, 1, 2, 0] = (
+        ((y_a - y_b)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         - ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+         * ((y_a - y_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            + (z_a - z_b)
+            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
+        / norm_AD_cross_BA**3)
+    grad_B[2, 1, 2, 1] = (
+        ((-x_a + x_b)
+         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
+            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
+            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
+         + ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+         * ((x_a - x_b)
+            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+            - (z_a - z_b)
+            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
+        / norm_AD_cross_BA**3)
+    grad_B[2, 1, 2, 2] = (
+        ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
+        * ((x_a - x_b)
+           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
+           + (y_a - y_b)
+           * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
+        / norm_AD_cross_BA**3)
+    grad_B[2, 2, 0, 0] = (-x_a + x_b) * (z_a - z_b) / norm_BA**3
+    grad_B[2, 2, 0, 1] = (-y_a + y_b) * (z_a - z_b) / norm_BA**3
+    grad_B[2, 2, 0, 2] = ((x_a - x_b)**2 + (y_a - y_b)**2) / norm_BA**3
+    grad_B[2, 2, 1, 0] = (x_a - x_b) * (z_a - z_b) / norm_BA**3
+    grad_B[2, 2, 1, 1] = (y_a - y_b) * (z_a - z_b) / norm_BA**3
+    grad_B[2, 2, 1, 2] = (-(x_a - x_b)**2 - (y_a - y_b)**2) / norm_BA**3
+    grad_B[2, 2, 2, 0] = 0.
+    grad_B[2, 2, 2, 1] = 0.
+    grad_B[2, 2, 2, 2] = 0.
+    return grad_B
+
+
+def give_random_geometries(n, seed=0):
+    """Return ``n`` random positions of an atom and its three references."""
+    return np.random.RandomState(seed).normal(scale=2., size=(n, 3, 4))
+
+
+if __name__ == '__main__':
+    c_table = np.array([[1], [2], [3]])
+    X = give_random_geometries(100)
+    grad_B = np.array([get_grad_B_expanded(x, c_table, 0) for x in X])
+    np.savez_compressed(REFERENCE, X=X, grad_B=grad_B)
+    print('Wrote', os.path.normpath(REFERENCE))
@@ -56,868 +56,163 @@ def get_B(X, c_table, j):
 
 @jit(nopython=True, cache=True)
 def get_grad_B(X, c_table, j):
+    """Return the derivatives of :func:`get_B` for the references.
+
+    ``grad_B[i, k, m, l]`` is the derivative of ``B[i, k]`` for
+    the l-th component of the position of ``(b, a, d)[m]``.
+
+    The columns of ``B`` are ``e0 = e1 x e2``,
+    ``e1 = N / |N|`` with ``N = AD x BA`` and ``e2 = -BA / |BA|``.
+    With the derivative ``P(v) = (1 - v v^T / |v|^2) / |v|`` of
+    ``v / |v|`` the chain rule gives for the rows
+    ``p = P(N)[i, :]`` and the columns ``g_k = grad_B[:, k, m, l]``::
+
+        d e2 / d(b, a, d) = (P(BA), -P(BA), 0)
+        d e1[i] / d(b, a, d) = (-p x AD, p x (BA + AD), -p x BA)
+        g_0 = e1 x g_2 - e2 x g_1
+
+    Every subexpression is calculated only once.
+    """
     grad_B = np.empty((3, 3, 3, 3))
     ref_pos = get_ref_pos(X, c_table[:, j])
-    v_b, v_a, v_d = ref_pos[:, 0], ref_pos[:, 1], ref_pos[:, 2]
-    x_b, y_b, z_b = v_b
-    x_a, y_a, z_a = v_a
-    x_d, y_d, z_d = v_d
-    BA, AD = v_a - v_b, v_d - v_a
-    norm_AD_cross_BA = np.linalg.norm(_jit_cross(AD, BA))
-    norm_BA = np.linalg.norm(BA)
-    grad_B[0, 0, 0, 0] = (
-        ((x_a - x_b)
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((y_a - y_b) * (y_a - y_d) + (z_a - z_b) * (z_a - z_d))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * ((y_a - y_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[0, 0, 0, 1] = (
-        ((y_a - y_b)
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((-x_a + x_b) * (y_a - y_d) + (2*x_a - 2*x_d) * (y_a - y_b))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[0, 0, 0, 2] = (
-        ((z_a - z_b)
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((-x_a + x_b) * (z_a - z_d) + (2*x_a - 2*x_d) * (z_a - z_b))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[0, 0, 1, 0] = (
-        ((-x_a + x_b)
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((y_a - y_b) * (y_b - y_d) + (z_a - z_b) * (z_b - z_d))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * ((y_b - y_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_b - z_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[0, 0, 1, 1] = (
-        ((-y_a + y_b)
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_b - x_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_b - z_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         + ((x_a - x_b) * (y_a - y_d)
-            - (x_a - x_d) * (y_a - y_b)
-            - (x_b - x_d) * (y_a - y_b))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[0, 0, 1, 2] = (
-        ((-z_a + z_b)
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_b - x_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_b - y_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         + ((x_a - x_b) * (z_a - z_d)
-            - (x_a - x_d) * (z_a - z_b)
-            - (x_b - x_d) * (z_a - z_b))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[0, 0, 2, 0] = (
-        (-((y_a - y_b)
-           * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-           + (z_a - z_b)
-           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))**2
-         + ((y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
-        / (norm_AD_cross_BA**3 * norm_BA))
-    grad_B[0, 0, 2, 1] = (
-        ((-x_a + x_b) * (y_a - y_b)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
-        / (norm_AD_cross_BA**3 * norm_BA))
-    grad_B[0, 0, 2, 2] = (
-        ((-x_a + x_b) * (z_a - z_b)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
-        / (norm_AD_cross_BA**3 * norm_BA))
-    grad_B[0, 1, 0, 0] = (
-        ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))
-        * ((y_a - y_d)
-           * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-           + (z_a - z_d)
-           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-        / norm_AD_cross_BA**3)
-    grad_B[0, 1, 0, 1] = (
-        ((-z_a + z_d)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-        / norm_AD_cross_BA**3)
-    grad_B[0, 1, 0, 2] = (
-        ((y_a - y_d)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-        / norm_AD_cross_BA**3)
-    grad_B[0, 1, 1, 0] = (
-        (-(y_a - y_b) * (z_a - z_d) + (y_a - y_d) * (z_a - z_b))
-        * ((y_b - y_d)
-           * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-           + (z_b - z_d)
-           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-        / norm_AD_cross_BA**3)
-    grad_B[0, 1, 1, 1] = (
-        ((z_b - z_d)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_b - x_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_b - z_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-        / norm_AD_cross_BA**3)
-    grad_B[0, 1, 1, 2] = (
-        ((-y_b + y_d)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_b - x_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_b - y_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-        / norm_AD_cross_BA**3)
-    grad_B[0, 1, 2, 0] = (
-        (-(y_a - y_b) * (z_a - z_d) + (y_a - y_d) * (z_a - z_b))
-        * ((y_a - y_b)
-           * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-           + (z_a - z_b)
-           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-        / norm_AD_cross_BA**3)
-    grad_B[0, 1, 2, 1] = (
-        ((z_a - z_b)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-        / norm_AD_cross_BA**3)
-    grad_B[0, 1, 2, 2] = (
-        ((-y_a + y_b)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-        / norm_AD_cross_BA**3)
-    grad_B[0, 2, 0, 0] = ((y_a - y_b)**2 + (z_a - z_b)**2) / norm_BA**3
-    grad_B[0, 2, 0, 1] = (-x_a + x_b) * (y_a - y_b) / norm_BA**3
-    grad_B[0, 2, 0, 2] = (-x_a + x_b) * (z_a - z_b) / norm_BA**3
-    grad_B[0, 2, 1, 0] = (-(y_a - y_b)**2 - (z_a - z_b)**2) / norm_BA**3
-    grad_B[0, 2, 1, 1] = (x_a - x_b) * (y_a - y_b) / norm_BA**3
-    grad_B[0, 2, 1, 2] = (x_a - x_b) * (z_a - z_b) / norm_BA**3
-    grad_B[0, 2, 2, 0] = 0.
-    grad_B[0, 2, 2, 1] = 0.
-    grad_B[0, 2, 2, 2] = 0.
-    grad_B[1, 0, 0, 0] = (
-        ((-x_a + x_b)
-         * ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         + (-(x_a - x_d) * (y_a - y_b) + (2*x_a - 2*x_b) * (y_a - y_d))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[1, 0, 0, 1] = (
-        ((-y_a + y_b)
-         * ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b) * (x_a - x_d) + (z_a - z_b) * (z_a - z_d))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_a - x_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[1, 0, 0, 2] = (
-        ((-z_a + z_b)
-         * ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_a - x_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         + ((-y_a + y_b) * (z_a - z_d) + (2*y_a - 2*y_d) * (z_a - z_b))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[1, 0, 1, 0] = (
-        ((x_a - x_b)
-         * ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d)
-               - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_b - y_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_b - z_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         + ((-x_a + x_b) * (y_a - y_d)
-            - (x_a - x_b) * (y_b - y_d)
-            + (x_a - x_d) * (y_a - y_b))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2
-            + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[1, 0, 1, 1] = (
-        ((y_a - y_b)
-         * ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b) * (x_b - x_d) + (z_a - z_b) * (z_b - z_d))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_b - x_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_b - z_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[1, 0, 1, 2] = (
-        ((z_a - z_b)
-         * ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_b - x_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_b - y_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         + ((y_a - y_b) * (z_a - z_d)
-            - (y_a - y_d) * (z_a - z_b)
-            - (y_b - y_d) * (z_a - z_b))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[1, 0, 2, 0] = (
-        ((-x_a + x_b) * (y_a - y_b)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
-        / (norm_AD_cross_BA**3 * norm_BA))
-    grad_B[1, 0, 2, 1] = (
-        (-((x_a - x_b)
-           * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-           - (z_a - z_b)
-           * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))**2
-         + ((x_a - x_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
-        / (norm_AD_cross_BA**3 * norm_BA))
-    grad_B[1, 0, 2, 2] = (
-        (-(y_a - y_b) * (z_a - z_b)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
-        / (norm_AD_cross_BA**3 * norm_BA))
-    grad_B[1, 1, 0, 0] = (
-        ((z_a - z_d)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-         * ((y_a - y_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
-        / norm_AD_cross_BA**3)
-    grad_B[1, 1, 0, 1] = (
-        ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-        * ((x_a - x_d)
-           * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-           - (z_a - z_d)
-           * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-        / norm_AD_cross_BA**3)
-    grad_B[1, 1, 0, 2] = (
-        ((-x_a + x_d) *
-         (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-          + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-          + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-         * ((x_a - x_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
-        / norm_AD_cross_BA**3)
-    grad_B[1, 1, 1, 0] = (
-        ((-z_b + z_d)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-         * ((y_b - y_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_b - z_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
-        / norm_AD_cross_BA**3)
-    grad_B[1, 1, 1, 1] = (
-        ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-        * ((-x_b + x_d)
-           * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-           + (z_b - z_d)
-           * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-        / norm_AD_cross_BA**3)
-    grad_B[1, 1, 1, 2] = (
-        ((x_b - x_d)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-         * ((x_b - x_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_b - y_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
-        / norm_AD_cross_BA**3)
-    grad_B[1, 1, 2, 0] = (
-        ((-z_a + z_b)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b) * (z_a - z_d)
-            - (x_a - x_d) * (z_a - z_b))
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
-        / norm_AD_cross_BA**3)
-    grad_B[1, 1, 2, 1] = (
-        ((-x_a + x_b)
-         * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-         + (z_a - z_b)
-         * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-        * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-        / norm_AD_cross_BA**3)
-    grad_B[1, 1, 2, 2] = (
-        ((x_a - x_b)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-         * ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
-        / norm_AD_cross_BA**3)
-    grad_B[1, 2, 0, 0] = (-x_a + x_b) * (y_a - y_b) / norm_BA**3
-    grad_B[1, 2, 0, 1] = ((x_a - x_b)**2 + (z_a - z_b)**2) / norm_BA**3
-    grad_B[1, 2, 0, 2] = (-y_a + y_b) * (z_a - z_b) / norm_BA**3
-    grad_B[1, 2, 1, 0] = (x_a - x_b) * (y_a - y_b) / norm_BA**3
-    grad_B[1, 2, 1, 1] = (-(x_a - x_b)**2 - (z_a - z_b)**2) / norm_BA**3
-    grad_B[1, 2, 1, 2] = (y_a - y_b) * (z_a - z_b) / norm_BA**3
-    grad_B[1, 2, 2, 0] = 0.
-    grad_B[1, 2, 2, 1] = 0.
-    grad_B[1, 2, 2, 2] = 0.
-    grad_B[2, 0, 0, 0] = (
-        ((-x_a + x_b)
-         * ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         + (-(x_a - x_d) * (z_a - z_b) + (2*x_a - 2*x_b) * (z_a - z_d))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[2, 0, 0, 1] = (
-        ((-y_a + y_b)
-         * ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_a - x_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         + (-(y_a - y_d) * (z_a - z_b) + (2*y_a - 2*y_b) * (z_a - z_d))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[2, 0, 0, 2] = (
-        ((-z_a + z_b)
-         * ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b) * (x_a - x_d) + (y_a - y_b) * (y_a - y_d))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_a - x_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[2, 0, 1, 0] = (
-        ((x_a - x_b) *
-         ((x_a - x_b)
-          * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-          + (y_a - y_b)
-          * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_b - y_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_b - z_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         + ((-x_a + x_b) * (z_a - z_d)
-            - (x_a - x_b) * (z_b - z_d)
-            + (x_a - x_d) * (z_a - z_b))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[2, 0, 1, 1] = (
-        ((y_a - y_b)
-         * ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_b - x_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_b - z_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         + ((-y_a + y_b) * (z_a - z_d)
-            - (y_a - y_b) * (z_b - z_d)
-            + (y_a - y_d) * (z_a - z_b))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[2, 0, 1, 2] = (
-        ((z_a - z_b)
-         * ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d)
-               - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b) * (x_b - x_d) + (y_a - y_b) * (y_b - y_d))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_b - x_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_b - y_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_a - x_b)**2 + (y_a - y_b)**2 + (z_a - z_b)**2))
-        / (norm_AD_cross_BA**3 * norm_BA**3))
-    grad_B[2, 0, 2, 0] = (
-        ((-x_a + x_b) * (z_a - z_b)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
-        / (norm_AD_cross_BA**3 * norm_BA))
-    grad_B[2, 0, 2, 1] = (
-        (-(y_a - y_b) * (z_a - z_b)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-         * ((x_a - x_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-            + (y_a - y_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
-        / (norm_AD_cross_BA**3 * norm_BA))
-    grad_B[2, 0, 2, 2] = (
-        (-((x_a - x_b)
-           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-           + (y_a - y_b)
-           * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))**2
-         + ((x_a - x_b)**2 + (y_a - y_b)**2)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2))
-        / (norm_AD_cross_BA**3 * norm_BA))
-    grad_B[2, 1, 0, 0] = (
-        ((-y_a + y_d)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-         * ((y_a - y_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
-        / norm_AD_cross_BA**3)
-    grad_B[2, 1, 0, 1] = (
-        ((x_a - x_d)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-         * ((x_a - x_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
-        / norm_AD_cross_BA**3)
-    grad_B[2, 1, 0, 2] = (
-        (-(x_a - x_b) * (y_a - y_d) + (x_a - x_d) * (y_a - y_b))
-        * ((x_a - x_d)
-           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-           + (y_a - y_d)
-           * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-        / norm_AD_cross_BA**3)
-    grad_B[2, 1, 1, 0] = (
-        ((y_b - y_d)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-         * ((y_b - y_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_b - z_d)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
-        / norm_AD_cross_BA**3)
-    grad_B[2, 1, 1, 1] = (
-        ((-x_b + x_d)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-         * ((x_b - x_d)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_b - z_d)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
-        / norm_AD_cross_BA**3)
-    grad_B[2, 1, 1, 2] = (
-        ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-        * ((x_b - x_d)
-           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-           + (y_b - y_d)
-           * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-        / norm_AD_cross_BA**3)
-    grad_B[2, 1, 2, 0] = (
-        ((y_a - y_b)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         - ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-         * ((y_a - y_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            + (z_a - z_b)
-            * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))))
-        / norm_AD_cross_BA**3)
-    grad_B[2, 1, 2, 1] = (
-        ((-x_a + x_b)
-         * (((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))**2
-            + ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))**2
-            + ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))**2)
-         + ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-         * ((x_a - x_b)
-            * ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-            - (z_a - z_b)
-            * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b))))
-        / norm_AD_cross_BA**3)
-    grad_B[2, 1, 2, 2] = (
-        ((x_a - x_b) * (y_a - y_d) - (x_a - x_d) * (y_a - y_b))
-        * ((x_a - x_b)
-           * ((x_a - x_b) * (z_a - z_d) - (x_a - x_d) * (z_a - z_b))
-           + (y_a - y_b)
-           * ((y_a - y_b) * (z_a - z_d) - (y_a - y_d) * (z_a - z_b)))
-        / norm_AD_cross_BA**3)
-    grad_B[2, 2, 0, 0] = (-x_a + x_b) * (z_a - z_b) / norm_BA**3
-    grad_B[2, 2, 0, 1] = (-y_a + y_b) * (z_a - z_b) / norm_BA**3
-    grad_B[2, 2, 0, 2] = ((x_a - x_b)**2 + (y_a - y_b)**2) / norm_BA**3
-    grad_B[2, 2, 1, 0] = (x_a - x_b) * (z_a - z_b) / norm_BA**3
-    grad_B[2, 2, 1, 1] = (y_a - y_b) * (z_a - z_b) / norm_BA**3
-    grad_B[2, 2, 1, 2] = (-(x_a - x_b)**2 - (y_a - y_b)**2) / norm_BA**3
-    grad_B[2, 2, 2, 0] = 0.
-    grad_B[2, 2, 2, 1] = 0.
-    grad_B[2, 2, 2, 2] = 0.
+    BA = ref_pos[:, 1] - ref_pos[:, 0]
+    AD = ref_pos[:, 2] - ref_pos[:, 1]
+    BD = BA + AD
+    N = _jit_cross(AD, BA)
+    norm_BA = sqrt(BA[0]**2 + BA[1]**2 + BA[2]**2)
+    norm_N = sqrt(N[0]**2 + N[1]**2 + N[2]**2)
+    e1 = N / norm_N
+    e2 = -BA / norm_BA
+
+    for i in range(3):
+        for l in range(3):
+            P_BA = -BA[i] * BA[l] / norm_BA**3
+            P_N = -N[i] * N[l] / norm_N**3
+            if i == l:
+                P_BA += 1. / norm_BA
+                P_N += 1. / norm_N
+            grad_B[i, 2, 0, l] = P_BA
+            grad_B[i, 2, 1, l] = -P_BA
+            grad_B[i, 2, 2, l] = 0.
+            # P(N)[i, l] is used as component l of the row p
+            grad_B[i, 1, 2, l] = P_N
+    for i in range(3):
+        p0, p1, p2 = grad_B[i, 1, 2, 0], grad_B[i, 1, 2, 1], grad_B[i, 1, 2, 2]
+        # p x v for v = -AD, BD, -BA
+        grad_B[i, 1, 0, 0] = -(p1 * AD[2] - p2 * AD[1])
+        grad_B[i, 1, 0, 1] = -(p2 * AD[0] - p0 * AD[2])
+        grad_B[i, 1, 0, 2] = -(p0 * AD[1] - p1 * AD[0])
+        grad_B[i, 1, 1, 0] = p1 * BD[2] - p2 * BD[1]
+        grad_B[i, 1, 1, 1] = p2 * BD[0] - p0 * BD[2]
+        grad_B[i, 1, 1, 2] = p0 * BD[1] - p1 * BD[0]
+        grad_B[i, 1, 2, 0] = -(p1 * BA[2] - p2 * BA[1])
+        grad_B[i, 1, 2, 1] = -(p2 * BA[0] - p0 * BA[2])
+        grad_B[i, 1, 2, 2] = -(p0 * BA[1] - p1 * BA[0])
+    for m in range(3):
+        for l in range(3):
+            g1 = grad_B[:, 1, m, l]
+            g2 = grad_B[:, 2, m, l]
+            grad_B[0, 0, m, l] = (e1[1] * g2[2] - e1[2] * g2[1]
+                                  - e2[1] * g1[2] + e2[2] * g1[1])
+            grad_B[1, 0, m, l] = (e1[2] * g2[0] - e1[0] * g2[2]
+                                  - e2[2] * g1[0] + e2[0] * g1[2])
+            grad_B[2, 0, m, l] = (e1[0] * g2[1] - e1[1] * g2[0]
+                                  - e2[0] * g1[1] + e2[1] * g1[0])
     return grad_B
 
 
+@jit(nopython=True, cache=True)
+def _jit_levi_civita(i, j, k):
+    return (i - j) * (j - k) * (k - i) / 2
+
+
+@jit(nopython=True, cache=True)
+def get_hess_normalize(v):
+    """Return the first and second derivatives of ``v / |v|``.
+
+    ``P[i, k]`` is the derivative of the i-th component for ``v[k]``
+    and ``Q[i, k, l]`` the second derivative for ``v[k]`` and ``v[l]``.
+    """
+    r = sqrt(v[0]**2 + v[1]**2 + v[2]**2)
+    n = v / r
+    P = np.empty((3, 3))
+    Q = np.empty((3, 3, 3))
+    for i in range(3):
+        for k in range(3):
+            P[i, k] = ((1. if i == k else 0.) - n[i] * n[k]) / r
+    for i in range(3):
+        for k in range(3):
+            for l in range(3):
+                Q[i, k, l] = -(P[i, l] * n[k] + P[k, l] * n[i]
+                               + P[i, k] * n[l]) / r
+    return P, Q
+
+
+@jit(nopython=True, cache=True)
+def get_hess_B(X, c_table, j):
+    """Return the second derivatives of :func:`get_B` for the references.
+
+    ``hess_B[i, k, m, l, m_2, l_2]`` is the derivative of
+    ``grad_B[i, k, m, l]`` of :func:`get_grad_B` for
+    the l_2-th component of the position of ``(b, a, d)[m_2]``.
+
+    With ``AD = d - a``, ``BA = a - b`` the normal ``N = AD x BA``
+    is bilinear in the positions and has the constant second
+    derivatives ``eps[k, l, l_2] * (alpha[m] beta[m_2] - alpha[m_2] beta[m])``
+    with ``alpha = (0, -1, 1)`` and ``beta = (-1, 1, 0)``.
+    The second derivatives of the normalised columns follow from
+    :func:`get_hess_normalize` and ``e0 = e1 x e2`` from the product rule.
+    """
+    hess_B = np.zeros((3, 3, 3, 3, 3, 3))
+    grad_B = get_grad_B(X, c_table, j)
+    ref_pos = get_ref_pos(X, c_table[:, j])
+    BA = ref_pos[:, 1] - ref_pos[:, 0]
+    AD = ref_pos[:, 2] - ref_pos[:, 1]
+    N = _jit_cross(AD, BA)
+    e1 = _jit_normalize(N)
+    e2 = -_jit_normalize(BA)
+    P_N, Q_N = get_hess_normalize(N)
+    Q_BA = get_hess_normalize(-BA)[1]
+    alpha = np.array([0., -1., 1.])
+    beta = np.array([-1., 1., 0.])
+    sign = np.array([1., -1., 0.])
+
+    grad_N = np.zeros((3, 3, 3))
+    for k in range(3):
+        for m in range(3):
+            for l in range(3):
+                for p in range(3):
+                    grad_N[k, m, l] += (
+                        _jit_levi_civita(k, l, p) * alpha[m] * BA[p]
+                        + _jit_levi_civita(k, p, l) * beta[m] * AD[p])
+
+    for m in range(3):
+        for l in range(3):
+            for m_2 in range(3):
+                for l_2 in range(3):
+                    for i in range(3):
+                        hess_B[i, 2, m, l, m_2, l_2] = (
+                            sign[m] * sign[m_2] * Q_BA[i, l, l_2])
+                        value = 0.
+                        for k in range(3):
+                            value += P_N[i, k] * _jit_levi_civita(k, l, l_2) \
+                                * (alpha[m] * beta[m_2]
+                                   - alpha[m_2] * beta[m])
+                            for k_2 in range(3):
+                                value += (Q_N[i, k, k_2] * grad_N[k, m, l]
+                                          * grad_N[k_2, m_2, l_2])
+                        hess_B[i, 1, m, l, m_2, l_2] = value
+                    h_1 = hess_B[:, 1, m, l, m_2, l_2]
+                    h_2 = hess_B[:, 2, m, l, m_2, l_2]
+                    hess_B[:, 0, m, l, m_2, l_2] = (
+                        _jit_cross(h_1, e2) + _jit_cross(e1, h_2)
+                        + _jit_cross(grad_B[:, 1, m, l],
+                                     grad_B[:, 2, m_2, l_2])
+                        + _jit_cross(grad_B[:, 1, m_2, l_2],
+                                     grad_B[:, 2, m, l]))
+    return hess_B
+
+
 @jit(nb.f8[:](nb.f8[:]), nopython=True)
 def get_S_inv(v):
     x, y, z = v
@@ -960,6 +255,43 @@ def get_grad_S_inv(v):
     return grad_S_inv
 
 
+@jit(nopython=True, cache=True)
+def get_hess_S_inv(v):
+    """Return the second derivatives of :func:`get_S_inv`.
+
+    ``hess_S_inv[i, k, l]`` is the derivative of ``grad_S_inv[i, k]``
+    for ``v[l]``.
+    The angles are not differentiable on the z axis, where their
+    second derivatives are set to zero.
+    """
+    x, y, z = v
+    hess_S_inv = np.zeros((3, 3, 3))
+
+    r = np.linalg.norm(v)
+    if _jit_isclose(r, 0):
+        return hess_S_inv
+    for k in range(3):
+        for l in range(3):
+            hess_S_inv[0, k, l] = (
+                (1. if k == l else 0.) - v[k] * v[l] / r**2) / r
+    rho = sqrt(x**2 + y**2)
+    if _jit_isclose(rho, 0):
+        return hess_S_inv
+    for k in range(2):
+        for l in range(2):
+            hess_S_inv[1, k, l] = z * (
+                v[k] * v[l] * (2 * rho**2 + r**2)
+                - (r**2 * rho**2 if k == l else 0.)) / (r**4 * rho**3)
+        hess_S_inv[1, k, 2] = -v[k] * (rho**2 - z**2) / (r**4 * rho)
+        hess_S_inv[1, 2, k] = hess_S_inv[1, k, 2]
+    hess_S_inv[1, 2, 2] = -2 * rho * z / r**4
+    hess_S_inv[2, 0, 0] = -2 * x * y / rho**4
+    hess_S_inv[2, 0, 1] = (x**2 - y**2) / rho**4
+    hess_S_inv[2, 1, 0] = hess_S_inv[2, 0, 1]
+    hess_S_inv[2, 1, 1] = 2 * x * y / rho**4
+    return hess_S_inv
+
+
 @jit(nopython=True, cache=True)
 def get_T(X, c_table, j):
     err, B = get_B(X, c_table, j)
@@ -984,40 +316,321 @@ def get_C(X, c_table):
     return (ERR_CODE_OK, C)
 
 
+@jit(nopython=True, parallel=True, cache=True)
+def get_C_trajectory(X, c_table):
+    """Apply :func:`get_C` to each frame of ``X``.
+
+    ``X`` has the shape ``(n_frames, 3, n_atoms)``.
+    Returns an error code for each frame and the internal coordinates
+    of shape ``(n_frames, 3, c_table.shape[1])``.
+    """
+    n_frames = X.shape[0]
+    err = np.empty(n_frames, dtype=nb.int64)
+    C = np.empty((n_frames, 3, c_table.shape[1]))
+    for frame in nb.prange(n_frames):
+        frame_err, frame_C = get_C(X[frame], c_table)
+        err[frame] = frame_err
+        C[frame] = frame_C
+    return err, C
+
+
+@jit(nopython=True, cache=True)
+def get_grad_C_block(X, c_table, j):
+    """Return the derivatives of ``C[:, j]``.
+
+    The internal coordinates of the j-th atom depend only on the
+    positions of the atom itself and its references b, a and d.
+    ``block[:, k, :]`` contains the derivatives for the position of
+    ``(j, b, a, d)[k]`` with the index layout of :func:`get_grad_C`.
+    Blocks for absolute references are zero.
+    """
+    block = np.zeros((3, 4, 3))
+    IB = (X[:, j] - get_ref_pos(X, c_table[0, j])).reshape((3, 1, 1))
+    grad_S_inv = get_grad_S_inv(get_T(X, c_table, j)[1])
+    err, B = get_B(X, c_table, j)
+    if err == ERR_CODE_InvalidReference:
+        return (err, block)
+    grad_B = get_grad_B(X, c_table, j)
+
+    # Derive for j
+    block[:, 0, :] = np.dot(grad_S_inv, B.T)
+
+    # Derive for b(j)
+    if c_table[0, j] > constants.keys_below_are_abs_refs:
+        A = np.sum(grad_B[:, :, 0, :] * IB, axis=0)
+        block[:, 1, :] = np.dot(grad_S_inv, A - B.T)
+
+    # Derive for a(j) and d(j)
+    for k in range(1, 3):
+        if c_table[k, j] > constants.keys_below_are_abs_refs:
+            A = np.sum(grad_B[:, :, k, :] * IB, axis=0)
+            block[:, k + 1, :] = np.dot(grad_S_inv, A)
+    return (ERR_CODE_OK, block)
+
+
+@jit(nopython=True, cache=True)
+def get_grad_C_blocks(X, c_table):
+    """Return the nonzero blocks of the gradient of :func:`get_C`.
+
+    ``blocks[j]`` is the result of :func:`get_grad_C_block`.
+    """
+    n_atoms = c_table.shape[1]
+    blocks = np.zeros((n_atoms, 3, 4, 3))
+    for j in range(n_atoms):
+        err, block = get_grad_C_block(X, c_table, j)
+        if err == ERR_CODE_InvalidReference:
+            return (err, j, blocks)
+        blocks[j] = block
+    return (ERR_CODE_OK, j, blocks)  # pylint:disable=undefined-loop-variable
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_grad_C_blocks_parallel(X, c_table):
+    """Parallel version of :func:`get_grad_C_blocks`.
+
+    The atoms are distributed over the threads set by
+    :func:`numba.set_num_threads`.
+    Every atom writes only into its own block, so no locking is required.
+    """
+    n_atoms = c_table.shape[1]
+    err = np.empty(n_atoms, dtype=nb.int64)
+    blocks = np.zeros((n_atoms, 3, 4, 3))
+    for j in nb.prange(n_atoms):
+        atom_err, block = get_grad_C_block(X, c_table, j)
+        err[j] = atom_err
+        blocks[j] = block
+    for j in range(n_atoms):
+        if err[j] == ERR_CODE_InvalidReference:
+            return (err[j], j, blocks)
+    return (ERR_CODE_OK, n_atoms - 1, blocks)
+
+
+@jit(nopython=True, cache=True)
+def get_hess_C_block(X, c_table, j):
+    """Return the second derivatives of ``C[:, j]``.
+
+    ``block[i, k, l, k_2, l_2]`` is the derivative of ``C[i, j]``
+    for the l-th component of the position of ``(j, b, a, d)[k]``
+    and the l_2-th component of the position of ``(j, b, a, d)[k_2]``.
+    With ``v = B.T (X[:, j] - b)`` and ``C[:, j] = S_inv(v)`` the
+    chain rule gives
+    ``grad_S_inv . hess_v + grad_v.T . hess_S_inv . grad_v``.
+    Blocks for absolute references are zero.
+    """
+    block = np.zeros((3, 4, 3, 4, 3))
+    err, B = get_B(X, c_table, j)
+    if err == ERR_CODE_InvalidReference:
+        return (err, block)
+    IB = X[:, j] - get_ref_pos(X, c_table[0, j])
+    grad_B = get_grad_B(X, c_table, j)
+    hess_B = get_hess_B(X, c_table, j)
+    v = np.dot(B.T, IB)
+    grad_S_inv = get_grad_S_inv(v)
+    hess_S_inv = get_hess_S_inv(v)
+    sign = np.array([1., -1., 0., 0.])
+    is_relative = np.empty(4, dtype=nb.boolean)
+    is_relative[0] = True
+    for k in range(3):
+        is_relative[k + 1] = c_table[k, j] > constants.keys_below_are_abs_refs
+
+    # The derivatives of v
+    grad_v = np.zeros((3, 4, 3))
+    hess_v = np.zeros((3, 4, 3, 4, 3))
+    for n in range(3):
+        for l in range(3):
+            grad_v[n, 0, l] = B[l, n]
+            grad_v[n, 1, l] = -B[l, n]
+            for m in range(3):
+                for i in range(3):
+                    grad_v[n, m + 1, l] += grad_B[i, n, m, l] * IB[i]
+    for n in range(3):
+        for k in range(4):
+            for l in range(3):
+                for k_2 in range(4):
+                    for l_2 in range(3):
+                        value = 0.
+                        if k > 0:
+                            value += sign[k_2] * grad_B[l_2, n, k - 1, l]
+                        if k_2 > 0:
+                            value += sign[k] * grad_B[l, n, k_2 - 1, l_2]
+                        if k > 0 and k_2 > 0:
+                            for i in range(3):
+                                value += (hess_B[i, n, k - 1, l, k_2 - 1, l_2]
+                                          * IB[i])
+                        hess_v[n, k, l, k_2, l_2] = value
+
+    for c in range(3):
+        for k in range(4):
+            if not is_relative[k]:
+                continue
+            for l in range(3):
+                for k_2 in range(4):
+                    if not is_relative[k_2]:
+                        continue
+                    for l_2 in range(3):
+                        value = 0.
+                        for n in range(3):
+                            value += (grad_S_inv[c, n]
+                                      * hess_v[n, k, l, k_2, l_2])
+                            for n_2 in range(3):
+                                value += (hess_S_inv[c, n, n_2]
+                                          * grad_v[n, k, l]
+                                          * grad_v[n_2, k_2, l_2])
+                        block[c, k, l, k_2, l_2] = value
+    return (ERR_CODE_OK, block)
+
+
+@jit(nopython=True, cache=True)
+def get_hess_C_blocks(X, c_table):
+    """Return the nonzero blocks of the second derivatives of :func:`get_C`.
+
+    ``blocks[j]`` is the result of :func:`get_hess_C_block`.
+    """
+    n_atoms = c_table.shape[1]
+    blocks = np.zeros((n_atoms, 3, 4, 3, 4, 3))
+    for j in range(n_atoms):
+        err, block = get_hess_C_block(X, c_table, j)
+        if err == ERR_CODE_InvalidReference:
+            return (err, j, blocks)
+        blocks[j] = block
+    return (ERR_CODE_OK, j, blocks)  # pylint:disable=undefined-loop-variable
+
+
+@jit(nopython=True, cache=True)
+def apply_grad_C(X, c_table, X_dist):
+    """Apply the gradient of :func:`get_C` onto ``X_dist``.
+
+    The blocks of the gradient are used one by one without storing them.
+    """
+    n_atoms = c_table.shape[1]
+    C_dist = np.zeros((3, n_atoms))
+    for j in range(n_atoms):
+        err, block = get_grad_C_block(X, c_table, j)
+        if err == ERR_CODE_InvalidReference:
+            return (err, j, C_dist)
+        for k in range(4):
+            r = j if k == 0 else c_table[k - 1, j]
+            if r > constants.keys_below_are_abs_refs:
+                for m in range(3):
+                    for n in range(3):
+                        C_dist[m, j] += block[m, k, n] * X_dist[n, r]
+    return (ERR_CODE_OK, j, C_dist)  # pylint:disable=undefined-loop-variable
+
+
+@jit(nopython=True, cache=True)
+def apply_grad_C_transpose(X, c_table, C_grad):
+    """Apply the transposed gradient of :func:`get_C` onto ``C_grad``.
+
+    The blocks of the gradient are used one by one without storing them.
+    """
+    n_atoms = c_table.shape[1]
+    X_grad = np.zeros((3, X.shape[1]))
+    for j in range(n_atoms):
+        err, block = get_grad_C_block(X, c_table, j)
+        if err == ERR_CODE_InvalidReference:
+            return (err, j, X_grad)
+        for k in range(4):
+            r = j if k == 0 else c_table[k - 1, j]
+            if r > constants.keys_below_are_abs_refs:
+                for m in range(3):
+                    for n in range(3):
+                        X_grad[n, r] += block[m, k, n] * C_grad[m, j]
+    return (ERR_CODE_OK, j, X_grad)  # pylint:disable=undefined-loop-variable
+
+
+@jit(nopython=True, cache=True)
+def get_grad_C_from_blocks(blocks, c_table, n_atoms):
+    """Scatter the blocks of :func:`get_grad_C_blocks` into the
+    dense tensor of :func:`get_grad_C`.
+    """
+    grad_C = np.zeros((3, n_atoms, n_atoms, 3))
+    for j in range(c_table.shape[1]):
+        grad_C[:, j, j, :] = blocks[j, :, 0, :]
+        for k in range(3):
+            if c_table[k, j] > constants.keys_below_are_abs_refs:
+                grad_C[:, j, c_table[k, j], :] = blocks[j, :, k + 1, :]
+    return grad_C
+
+
 @jit(nopython=True, cache=True)
 def get_grad_C(X, c_table):
     n_atoms = X.shape[1]
-    grad_C = np.zeros((3, n_atoms, n_atoms, 3))
+    err, j, blocks = get_grad_C_blocks(X, c_table)
+    if err == ERR_CODE_InvalidReference:
+        return (err, j, np.zeros((3, n_atoms, n_atoms, 3)))
+    return (ERR_CODE_OK, j, get_grad_C_from_blocks(blocks, c_table, n_atoms))
 
-    for j in range(X.shape[1]):
-        IB = (X[:, j] - get_ref_pos(X, c_table[0, j])).reshape((3, 1, 1))
-        grad_S_inv = get_grad_S_inv(get_T(X, c_table, j)[1])
-        err, B = get_B(X, c_table, j)
-        if err == ERR_CODE_InvalidReference:
-            return (err, j, grad_C)
-        grad_B = get_grad_B(X, c_table, j)
 
-        # Derive for j
-        grad_C[:, j, j, :] = np.dot(grad_S_inv, B.T)
+@jit(nopython=True, cache=True)
+def get_grad_C_parallel(X, c_table):
+    """Parallel version of :func:`get_grad_C`.
 
-        # Derive for b(j)
-        if c_table[0, j] > constants.keys_below_are_abs_refs:
-            A = np.sum(grad_B[:, :, 0, :] * IB, axis=0)
-            grad_C[:, j, c_table[0, j], :] = np.dot(grad_S_inv, A - B.T)
-        else:
-            grad_C[:, j, c_table[0, j], :] = 0.
+    The blocks are calculated by :func:`get_grad_C_blocks_parallel`.
+    """
+    n_atoms = X.shape[1]
+    err, j, blocks = get_grad_C_blocks_parallel(X, c_table)
+    if err == ERR_CODE_InvalidReference:
+        return (err, j, np.zeros((3, n_atoms, n_atoms, 3)))
+    return (ERR_CODE_OK, j, get_grad_C_from_blocks(blocks, c_table, n_atoms))
 
-        # Derive for a(j)
-        if c_table[1, j] > constants.keys_below_are_abs_refs:
-            A = np.sum(grad_B[:, :, 1, :] * IB, axis=0)
-            grad_C[:, j, c_table[1, j], :] = np.dot(grad_S_inv, A)
-        else:
-            grad_C[:, j, c_table[1, j], :] = 0.
 
-        # Derive for d(j)
-        if c_table[2, j] > constants.keys_below_are_abs_refs:
-            A = np.sum(grad_B[:, :, 2, :] * IB, axis=0)
-            grad_C[:, j, c_table[2, j], :] = np.dot(grad_S_inv, A)
-        else:
-            grad_C[:, j, c_table[2, j], :] = 0.
-    return (ERR_CODE_OK, j, grad_C)  # pylint:disable=undefined-loop-variable
+def get_ref_pos_batched(X, indices):
+    """Array version of :func:`get_ref_pos`.
+
+    ``X`` has the shape ``(..., 3, n_atoms)`` and the result
+    ``(..., 3, len(indices))``.
+    """
+    indices = np.asarray(indices)
+    is_abs_ref = indices < constants.keys_below_are_abs_refs
+    ref_pos = X[..., np.where(is_abs_ref, 0, indices)]
+    if is_abs_ref.any():
+        origin = constants.int_label['origin']
+        abs_refs = np.array([
+            constants.absolute_refs[constants.string_repr[origin + k]]
+            for k in range(len(constants.int_label))]).T
+        ref_pos[..., is_abs_ref] = abs_refs[:, indices[is_abs_ref] - origin]
+    return ref_pos
+
+
+def get_B_batched(b, a, d):
+    """Array version of :func:`get_B`.
+
+    ``b``, ``a`` and ``d`` are the positions of the references with
+    shape ``(..., 3, n)``.
+    Returns the bases of shape ``(..., 3, 3, n)``, where
+    ``B[..., :, k, j]`` is the k-th column of the basis of the j-th atom,
+    and a boolean array of shape ``(..., n)``, which marks invalid
+    references.
+    """
+    BA = a - b
+    AD = d - a
+    N = np.cross(AD, BA, axis=-2)
+    invalid = (np.isclose(BA, 0., atol=1e-5, rtol=1e-8).all(axis=-2)
+               | np.isclose(N, 0., atol=1e-5, rtol=1e-8).all(axis=-2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        e2 = -BA / np.linalg.norm(BA, axis=-2, keepdims=True)
+        e1 = N / np.linalg.norm(N, axis=-2, keepdims=True)
+    e0 = np.cross(e1, e2, axis=-2)
+    return np.stack([e0, e1, e2], axis=-2), invalid
+
+
+def get_C_batched(X, c_table):
+    """Array version of :func:`get_C` for a batch of structures.
+
+    ``X`` has the shape ``(..., 3, n_atoms)``. All atoms of all
+    structures are transformed at once with array operations.
+    Returns an error code for each structure and the internal
+    coordinates of shape ``(..., 3, c_table.shape[1])``.
+    """
+    n_atoms = c_table.shape[1]
+    b, a, d = [get_ref_pos_batched(X, c_table[k]) for k in range(3)]
+    B, invalid = get_B_batched(b, a, d)
+    v = np.einsum('...ikj,...ij->...kj', B, X[..., :n_atoms] - b)
+    x, y, z = v[..., 0, :], v[..., 1, :], v[..., 2, :]
+    r = np.linalg.norm(v, axis=-2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        alpha = np.where(r == 0, 0., np.arccos(-z / r))
+        delta = np.where(r == 0, 0., np.arctan2(-y / r, x / r))
+    err = np.where(invalid.any(axis=-1),
+                   ERR_CODE_InvalidReference, ERR_CODE_OK)
+    return err, np.stack([r, alpha, delta], axis=-2)
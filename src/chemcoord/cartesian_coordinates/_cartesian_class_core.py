@@ -4,24 +4,38 @@ from __future__ import (absolute_import, division, print_function,
 
 import collections
 import copy
+import hashlib
 import itertools
 from functools import partial
 from itertools import product
+from multiprocessing.pool import ThreadPool
 
 import numba as nb
 import numpy as np
 import pandas as pd
 from numba import jit
-from sortedcontainers import SortedSet
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
 
 import chemcoord.cartesian_coordinates.xyz_functions as xyz_functions
 import chemcoord.constants as constants
 from chemcoord._generic_classes.generic_core import GenericCore
 from chemcoord.cartesian_coordinates._cartesian_class_pandas_wrapper import \
     PandasWrapper
+from chemcoord.cartesian_coordinates.connectivity import (Connectivity,
+                                                          _gather_rows)
 from chemcoord.cartesian_coordinates.xyz_functions import dot
 from chemcoord.configuration import settings
 from chemcoord.exceptions import IllegalArgumentCombination, PhysicalMeaning
+
+try:
+    from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+except ImportError:
+    # Requires scipy>=1.6, which is not available for python<3.7
+    min_weight_full_bipartite_matching = None
+from chemcoord.utilities._parallel import get_n_jobs, numba_threads
 from six.moves import zip  # pylint:disable=redefined-builtin
 
 
@@ -78,6 +92,51 @@ class CartesianCore(PandasWrapper, GenericCore):
             self._metadata = {}
         else:
             self._metadata = copy.deepcopy(_metadata)
+        self._new_generation()
+
+    def _get_lookup(self, key, parameters=None):
+        """Return a cached value, if it is valid for the current generation.
+
+        Args:
+            key (str): The key in ``self._metadata``.
+            parameters (tuple): The parameters the value had to be
+                calculated with.
+
+        Returns:
+            The cached value or None.
+        """
+        stamps = self._metadata.get('lookup_stamps', {})
+        if stamps.get(key) == (self._generation, parameters):
+            return self._metadata.get(key)
+        return None
+
+    def _set_lookup(self, key, value, parameters=None):
+        """Cache a value for the current generation."""
+        self._metadata[key] = value
+        stamps = self._metadata.setdefault('lookup_stamps', {})
+        stamps[key] = (self._generation, parameters)
+
+    def _give_metadata_without_lookups(self):
+        """Return ``self._metadata`` without the cached values.
+
+        A new instance starts with a new generation, so the lookups
+        would be invalid anyway and are not worth copying.
+        """
+        stamps = self._metadata.get('lookup_stamps', {})
+        return {key: value for key, value in self._metadata.items()
+                if key not in stamps and key != 'lookup_stamps'}
+
+    @staticmethod
+    def _give_bond_parameters(self_bonding_allowed=False,
+                              atomic_radius_data=None,
+                              modified_properties=None):
+        """Return the parameters that change the result of get_bonds."""
+        if atomic_radius_data is None:
+            atomic_radius_data = settings['defaults']['atomic_radius_data']
+        if modified_properties is not None:
+            modified_properties = tuple(sorted(modified_properties.items()))
+        return (bool(self_bonding_allowed), atomic_radius_data,
+                modified_properties)
 
     def _return_appropiate_type(self, selected):
         if isinstance(selected, pd.Series):
@@ -91,7 +150,8 @@ class CartesianCore(PandasWrapper, GenericCore):
                 and self._required_cols <= set(selected.columns)):
             molecule = self.__class__(selected)
             molecule.metadata = self.metadata.copy()
-            molecule._metadata = copy.deepcopy(self._metadata)
+            molecule._metadata = copy.deepcopy(
+                self._give_metadata_without_lookups())
             return molecule
         else:
             return selected
@@ -246,6 +306,7 @@ class CartesianCore(PandasWrapper, GenericCore):
         molecule = self.__class__(self._frame)
         molecule.metadata = self.metadata.copy()
         molecule._metadata = copy.deepcopy(self._metadata)
+        molecule._generation = self._generation
         return molecule
 
     def subs(self, *args):
@@ -294,7 +355,7 @@ class CartesianCore(PandasWrapper, GenericCore):
         return out
 
     @staticmethod
-    @jit(nopython=True, cache=True)
+    @jit(nopython=True, cache=True, nogil=True)
     def _jit_give_bond_array(pos, bond_radii, self_bonding_allowed=False):
         """Calculate a boolean array where ``A[i,j] is True`` indicates a
         bond between the i-th and j-th atom.
@@ -315,35 +376,130 @@ class CartesianCore(PandasWrapper, GenericCore):
                 bond_array[i, i] = False
         return bond_array
 
-    def _update_bond_dict(self, fragment_indices,
-                          positions,
-                          bond_radii,
-                          bond_dict=None,
-                          self_bonding_allowed=False,
-                          convert_index=None):
-        """If bond_dict is provided, this function is not side effect free
-        bond_dict has to be a collections.defaultdict(set)
+    @staticmethod
+    @jit(nopython=True, cache=True, parallel=True)
+    def _jit_cell_list_bonds(pos, bond_radii, cell_size, query,
+                             self_bonding_allowed=False):
+        """Calculate the bonds using a cell list.
+
+        The space is divided into cubic cells with an edge of ``cell_size``,
+        which has to be at least the largest possible bond length.
+        Only atoms in the same or in adjacent cells are compared.
+        Only the bonds of the atoms at the positions given by ``query``
+        are calculated.
+        The result is returned in compressed sparse row format
+        ``(indptr, indices)``, where the neighbours of the atom
+        ``query[q]`` are ``indices[indptr[q]:indptr[q + 1]]``.
+
+        The atoms are distributed over the threads set by
+        :func:`numba.set_num_threads`. Every atom writes only into its own
+        row, so no locking is required.
         """
-        assert (isinstance(bond_dict, collections.defaultdict)
-                or bond_dict is None)
-        fragment_indices = list(fragment_indices)
-        if convert_index is None:
-            convert_index = dict(enumerate(fragment_indices))
-        if bond_dict is None:
-            bond_dict = collections.defaultdict(set)
+        n = pos.shape[0]
+        cells = np.empty((n, 3), dtype=np.int64)
+        shape = np.empty(3, dtype=np.int64)
+        for h in range(3):
+            lowest = pos[0, h]
+            for i in range(n):
+                lowest = min(lowest, pos[i, h])
+            highest = 0
+            for i in range(n):
+                # Shift by one, to keep the adjacent cells non negative.
+                cells[i, h] = int((pos[i, h] - lowest) // cell_size) + 1
+                highest = max(highest, cells[i, h])
+            shape[h] = highest + 2
 
-        frag_pos = positions[fragment_indices, :]
-        frag_bond_radii = bond_radii[fragment_indices]
+        keys = np.empty(n, dtype=np.int64)
+        for i in range(n):
+            keys[i] = (cells[i, 0] * shape[1] + cells[i, 1]) * shape[2] \
+                + cells[i, 2]
+        order = np.argsort(keys)
+        sorted_keys = keys[order]
+
+        adjacent = np.empty(27, dtype=np.int64)
+        m = 0
+        for dx in range(-1, 2):
+            for dy in range(-1, 2):
+                for dz in range(-1, 2):
+                    adjacent[m] = (dx * shape[1] + dy) * shape[2] + dz
+                    m += 1
+
+        n_query = len(query)
+        indptr = np.zeros(n_query + 1, dtype=np.int64)
+        indices = np.empty(0, dtype=np.int64)
+        # The first pass counts, the second pass fills the bonds.
+        for fill in range(2):
+            if fill:
+                for q in range(n_query):
+                    indptr[q + 1] += indptr[q]
+                indices = np.empty(indptr[n_query], dtype=np.int64)
+            for q in nb.prange(n_query):
+                i = query[q]
+                k = indptr[q] if fill else 0
+                for m in range(27):
+                    key = keys[i] + adjacent[m]
+                    start = np.searchsorted(sorted_keys, key)
+                    end = np.searchsorted(sorted_keys, key, side='right')
+                    for j in order[start:end]:
+                        if i == j and not self_bonding_allowed:
+                            continue
+                        D = 0.
+                        for h in range(3):
+                            D += (pos[i, h] - pos[j, h])**2
+                        B = (bond_radii[i] + bond_radii[j])**2
+                        if (B - D) >= 0:
+                            if fill:
+                                indices[k] = j
+                            k += 1
+                if fill:
+                    indices[indptr[q]:k] = np.sort(indices[indptr[q]:k])
+                else:
+                    indptr[q + 1] = k
+        return indptr, indices
+
+    def _give_cell_list_bonds(self, positions, bond_radii, query,
+                              self_bonding_allowed=False):
+        cell_size = 2 * np.nanmax(bond_radii) if len(bond_radii) else 1.
+        if not cell_size > 0:
+            cell_size = 1.
+        return self._jit_cell_list_bonds(
+            positions, bond_radii, cell_size, query.astype('i8'),
+            self_bonding_allowed=self_bonding_allowed)
 
+    def _give_bond_radii(self, atomic_radius_data, modified_properties=None,
+                         rows=None):
+        """Return the bond radii as array.
+
+        The keys of ``modified_properties`` are positions.
+        If ``rows`` is given, only the bond radii of the atoms at these
+        positions are returned.
+        """
+        if rows is None:
+            data = self.add_data(atomic_radius_data)
+            bond_radii = pd.Series(data[atomic_radius_data].values)
+        else:
+            atoms = self._frame['atom'].values[rows]
+            bond_radii = pd.Series(
+                constants.elements.loc[atoms, atomic_radius_data].values,
+                index=rows)
+        if modified_properties is not None:
+            bond_radii.update(pd.Series(modified_properties))
+        return bond_radii.values.astype('f8')
+
+    def _give_block_bonds(self, fragment_indices, positions, bond_radii,
+                          self_bonding_allowed=False):
+        """Return the bonds within a block of atoms.
+
+        Returns:
+            tuple: Two integer arrays ``(a, b)`` of positions, where
+            ``a[k]`` is bonded to ``b[k]``.
+        """
+        fragment_indices = np.array(sorted(fragment_indices), dtype='i8')
         bond_array = self._jit_give_bond_array(
-            frag_pos, frag_bond_radii,
+            positions[fragment_indices, :], bond_radii[fragment_indices],
             self_bonding_allowed=self_bonding_allowed)
         a, b = bond_array.nonzero()
-        a, b = [convert_index[i] for i in a], [convert_index[i] for i in b]
-        for row, index in enumerate(a):
-            # bond_dict is a collections.defaultdict(set)
-            bond_dict[index].add(b[row])
-        return bond_dict
+        return fragment_indices[a], fragment_indices[b]
 
     def _divide_et_impera(self, n_atoms_per_set=500, offset=3):
         coords = ['x', 'y', 'z']
@@ -385,7 +541,9 @@ class CartesianCore(PandasWrapper, GenericCore):
                   modified_properties=None,
                   use_lookup=False,
                   set_lookup=True,
-                  atomic_radius_data=None
+                  atomic_radius_data=None,
+                  engine=None,
+                  n_jobs=None
                   ):
         """Return a dictionary representing the bonds.
 
@@ -396,19 +554,19 @@ class CartesianCore(PandasWrapper, GenericCore):
 
         ``.get_bonds()`` will use or not use a lookup
         depending on ``use_lookup``. Greatly increases performance if
-        True, but could introduce bugs in certain situations.
-
-        Just imagine a situation where the :class:`~Cartesian` is
-        changed manually. If you apply lateron a method e.g.
-        :meth:`~get_zmat()` that makes use of :meth:`~get_bonds()`
-        the dictionary of the bonds
-        may not represent the actual situation anymore.
-
-        You have two possibilities to cope with this problem.
-        Either you just re-execute ``get_bonds`` on your specific instance,
-        or you change the ``internally_use_lookup`` option in the settings.
-        Please note that the internal use of the lookup variable
-        greatly improves performance.
+        True.
+
+        The lookup is only used, if it was calculated with the same
+        ``self_bonding_allowed``, ``atomic_radius_data`` and
+        ``modified_properties`` and if the :class:`~Cartesian` was not
+        changed in place since it was set, e.g. by assigning to
+        :meth:`~chemcoord.Cartesian.loc` or to the index.
+        If only positions or atoms changed, the bonds of the
+        affected atoms are recalculated with
+        :meth:`~chemcoord.Cartesian.update_connectivity`,
+        otherwise a complete calculation is done.
+        Changes that bypass the :class:`~Cartesian`, e.g. writing into
+        the array returned by ``.values``, can not be detected.
 
         Args:
             modified_properties (dic): If you want to change the van der
@@ -418,7 +576,8 @@ class CartesianCore(PandasWrapper, GenericCore):
                     modified_properties = {index1: 1.5}
 
                 For global changes use the constants module.
-            offset (float):
+            offset (float): Overlap of the blocks used by the
+                ``'blocks'`` engine.
             use_lookup (bool):
             set_lookup (bool):
             self_bonding_allowed (bool):
@@ -427,73 +586,326 @@ class CartesianCore(PandasWrapper, GenericCore):
                 ``atomic_radius_cc`` and can be changed with
                 :attr:`settings['defaults']['atomic_radius_data']`.
                 Compare with :func:`add_data`.
+            engine (str): Defines how candidate pairs of atoms are found.
+                Possible values are:
+
+                ``'cell_list'``: The space is divided into cells with an edge
+                of ``2 * max(bond_radii)`` and only atoms in adjacent cells
+                are compared. This scales linearly with the number of atoms.
+
+                ``'blocks'``: The molecule is divided into overlapping cubic
+                blocks, within which all pairs of atoms are compared.
+
+                The default is specified in
+                ``settings['defaults']['bond_engine']``.
+            n_jobs (int): The number of threads used for the calculation.
+                The ``'cell_list'`` engine distributes the atoms,
+                the ``'blocks'`` engine the blocks over the threads.
+                Negative values count backwards from the number of
+                available cores, i.e. ``-1`` uses all cores.
+                The default is specified in
+                ``settings['defaults']['n_jobs']``.
 
         Returns:
             dict: Dictionary mapping from an atom index to the set of
             indices of atoms bonded to.
+            Use :meth:`~chemcoord.Cartesian.get_connectivity` to get
+            the bonds in a compact array representation.
+        """
+        def complete_calculation():
+            return self.get_connectivity(
+                self_bonding_allowed=self_bonding_allowed, offset=offset,
+                modified_properties=modified_properties, use_lookup=False,
+                set_lookup=set_lookup, atomic_radius_data=atomic_radius_data,
+                engine=engine, n_jobs=n_jobs).to_bond_dict()
+
+        parameters = self._give_bond_parameters(
+            self_bonding_allowed, atomic_radius_data, modified_properties)
+        bond_dict = None
+        if use_lookup:
+            bond_dict = self._get_lookup('bond_dict', parameters)
+            if (bond_dict is None
+                    and self._has_updatable_connectivity(parameters)):
+                connectivity = self.update_connectivity(
+                    set_lookup=set_lookup, n_jobs=n_jobs)
+                if set_lookup:
+                    bond_dict = self._metadata['bond_dict']
+                else:
+                    bond_dict = connectivity.to_bond_dict()
+        if bond_dict is None:
+            bond_dict = complete_calculation()
+
+        if set_lookup:
+            self._set_lookup('bond_dict', bond_dict, parameters)
+        return bond_dict
+
+    def get_connectivity(self,
+                         self_bonding_allowed=False,
+                         offset=3,
+                         modified_properties=None,
+                         use_lookup=False,
+                         set_lookup=True,
+                         atomic_radius_data=None,
+                         engine=None,
+                         n_jobs=None
+                         ):
+        """Return the bonds as :class:`~chemcoord.Connectivity`.
+
+        The connectivity stores the bonds in compressed sparse row
+        arrays and behaves like a read only version of the dictionary
+        returned by :meth:`~chemcoord.Cartesian.get_bonds`.
+
+        .. warning:: This function is **not sideeffect free**, since it
+            assigns the output to a variable
+            ``self._metadata['connectivity']`` if
+            ``set_lookup`` is ``True`` (which is the default).
+
+        Args:
+            The arguments have the same meaning as in
+            :meth:`~chemcoord.Cartesian.get_bonds`.
+
+        Returns:
+            Connectivity:
         """
         if atomic_radius_data is None:
             atomic_radius_data = settings['defaults']['atomic_radius_data']
+        if engine is None:
+            engine = settings['defaults']['bond_engine']
+        n_jobs = get_n_jobs(n_jobs)
 
-        def complete_calculation():
-            old_index = self.index
-            self.index = range(len(self))
+        def blocks_calculation(positions, bond_radii):
             fragments = self._divide_et_impera(offset=offset)
-            positions = np.array(self.loc[:, ['x', 'y', 'z']], order='F')
-            data = self.add_data([atomic_radius_data, 'valency'])
-            bond_radii = data[atomic_radius_data]
-            if modified_properties is not None:
-                bond_radii.update(pd.Series(modified_properties))
-            bond_radii = bond_radii.values
-            bond_dict = collections.defaultdict(set)
-            for i, j, k in product(*[range(x) for x in fragments.shape]):
-                # The following call is not side effect free and changes
-                # bond_dict
-                self._update_bond_dict(
-                    fragments[i, j, k], positions, bond_radii,
-                    bond_dict=bond_dict,
-                    self_bonding_allowed=self_bonding_allowed)
+            position_of = dict(zip(self.index, range(len(self))))
+            blocks = [[position_of[i] for i in fragment]
+                      for fragment in fragments.flat]
 
-            for i in set(self.index) - set(bond_dict.keys()):
-                bond_dict[i] = {}
+            def give_block_bonds(block):
+                return self._give_block_bonds(
+                    block, positions, bond_radii,
+                    self_bonding_allowed=self_bonding_allowed)
 
-            self.index = old_index
-            rename = dict(enumerate(self.index))
-            bond_dict = {rename[key]: {rename[i] for i in bond_dict[key]}
-                         for key in bond_dict}
-            return bond_dict
+            if n_jobs > 1 and len(blocks) > 1:
+                # The numba kernel releases the GIL
+                pool = ThreadPool(min(n_jobs, len(blocks)))
+                try:
+                    pairs = pool.map(give_block_bonds, blocks)
+                finally:
+                    pool.close()
+            else:
+                pairs = [give_block_bonds(block) for block in blocks]
+            return Connectivity.from_edges(
+                self.index,
+                np.concatenate([a for a, _ in pairs] + [np.empty(0, 'i8')]),
+                np.concatenate([b for _, b in pairs] + [np.empty(0, 'i8')]))
 
+        def complete_calculation():
+            positions = self.loc[:, ['x', 'y', 'z']].values.astype('f8')
+            bond_radii = self._give_bond_radii(atomic_radius_data,
+                                               modified_properties)
+            if engine == 'cell_list':
+                with numba_threads(n_jobs):
+                    indptr, indices = self._give_cell_list_bonds(
+                        positions, bond_radii, np.arange(len(self)),
+                        self_bonding_allowed=self_bonding_allowed)
+                connectivity = Connectivity(self.index, indptr, indices)
+            elif engine == 'blocks':
+                connectivity = blocks_calculation(positions, bond_radii)
+            else:
+                raise ValueError('engine has to be one of '
+                                 "'cell_list' or 'blocks'")
+            # Remember the input for update_connectivity
+            connectivity._snapshot = {
+                'positions': positions, 'bond_radii': bond_radii,
+                'atoms': self._frame['atom'].values.copy(),
+                'parameters': parameters,
+                'self_bonding_allowed': self_bonding_allowed,
+                'atomic_radius_data': atomic_radius_data,
+                'modified_properties': modified_properties}
+            return connectivity
+
+        parameters = self._give_bond_parameters(
+            self_bonding_allowed, atomic_radius_data, modified_properties)
+        connectivity = None
         if use_lookup:
-            try:
-                bond_dict = self._metadata['bond_dict']
-            except KeyError:
-                bond_dict = complete_calculation()
-        else:
-            bond_dict = complete_calculation()
+            connectivity = self._get_lookup('connectivity', parameters)
+            bond_dict = self._get_lookup('bond_dict', parameters)
+            if connectivity is not None:
+                pass
+            elif bond_dict is not None:
+                connectivity = Connectivity.from_bond_dict(bond_dict,
+                                                           index=self.index)
+            elif self._has_updatable_connectivity(parameters):
+                connectivity = self.update_connectivity(
+                    set_lookup=set_lookup, n_jobs=n_jobs)
+        if connectivity is None:
+            connectivity = complete_calculation()
 
         if set_lookup:
-            self._metadata['bond_dict'] = bond_dict
-        return bond_dict
+            self._set_lookup('connectivity', connectivity, parameters)
+        return connectivity
 
-    def _give_val_sorted_bond_dict(self, use_lookup):
-        def complete_calculation():
-            bond_dict = self.get_bonds(use_lookup=use_lookup)
-            valency = dict(zip(self.index,
-                               self.add_data('valency')['valency']))
-            val_bond_dict = {key:
-                             SortedSet([i for i in bond_dict[key]],
-                                       key=lambda x: -valency[x])
-                             for key in bond_dict}
-            return val_bond_dict
-        if use_lookup:
-            try:
-                val_bond_dict = self._metadata['val_bond_dict']
-            except KeyError:
-                val_bond_dict = complete_calculation()
+    def update_connectivity(self, atol=0., set_lookup=True, n_jobs=None):
+        """Update the cached connectivity after atoms were moved.
+
+        The positions and bond radii are compared with the ones, that were
+        used for the cached :class:`~chemcoord.Connectivity`.
+        Only the bonds of atoms that moved more than ``atol`` in any
+        direction, or whose element changed, are recalculated.
+        This is much cheaper than
+        :meth:`~chemcoord.Cartesian.get_connectivity`
+        if only a few atoms moved and avoids the use of a stale lookup.
+
+        If there is no cached connectivity for the current index,
+        a complete calculation with default arguments is done.
+
+        .. warning:: This function is **not sideeffect free**, since it
+            assigns the output to ``self._metadata['connectivity']`` and
+            updates ``self._metadata['bond_dict']``
+            if ``set_lookup`` is ``True`` (which is the default).
+
+        Lookups of :meth:`~chemcoord.Cartesian.get_bonds` call this method
+        automatically, if the :class:`~chemcoord.Cartesian` was changed.
+
+        Args:
+            atol (float): Displacements below this threshold are ignored.
+            set_lookup (bool):
+            n_jobs (int): Look into :meth:`~chemcoord.Cartesian.get_bonds`.
+
+        Returns:
+            Connectivity:
+        """
+        if self._has_updatable_connectivity():
+            connectivity, changed = self._update_connectivity(
+                self._metadata['connectivity'], atol=atol, n_jobs=n_jobs)
         else:
-            val_bond_dict = complete_calculation()
-        self._metadata['val_bond_dict'] = val_bond_dict
-        return val_bond_dict
+            connectivity = self.get_connectivity(set_lookup=False,
+                                                 n_jobs=n_jobs)
+            changed = None
+
+        if set_lookup:
+            stamps = self._metadata.get('lookup_stamps', {})
+            bond_dict = self._metadata.get('bond_dict')
+            if (changed is None or bond_dict is None
+                    or stamps.get('bond_dict') != stamps.get('connectivity')):
+                bond_dict = connectivity.to_bond_dict()
+            elif len(changed):
+                bond_dict = dict(bond_dict)
+                for i in changed:
+                    key = connectivity._labels[i]
+                    bond_dict[key] = set(connectivity[key])
+            parameters = connectivity._snapshot['parameters']
+            self._set_lookup('connectivity', connectivity, parameters)
+            self._set_lookup('bond_dict', bond_dict, parameters)
+        return connectivity
+
+    def _has_updatable_connectivity(self, parameters=None):
+        """Check if the cached connectivity can be updated incrementally.
+
+        If ``parameters`` is given, the cached connectivity has to be
+        calculated with the same parameters.
+        """
+        old = self._metadata.get('connectivity')
+        return (old is not None and old._snapshot is not None
+                and old.index.equals(self.index)
+                and (parameters is None
+                     or old._snapshot['parameters'] == parameters))
+
+    def _update_connectivity(self, old, atol=0., n_jobs=None):
+        """Return the updated connectivity and the changed positions.
+
+        The new bonds of the moved atoms are searched with a KD-tree over
+        the positions of an earlier snapshot, which is cached and
+        reused by later updates.
+        Atoms that moved since the tree was built are searched in a
+        second tree, which contains only them.
+        The tree is rebuilt, if more than an eighth of the atoms moved.
+        Only the rows of the moved atoms and of their old and new
+        neighbours are replaced in the CSR arrays.
+        ``n_jobs`` is accepted for compatibility; the search is serial.
+        """
+        snapshot = old._snapshot
+        positions = self._frame.loc[:, ['x', 'y', 'z']].values.astype('f8')
+        atoms = self._frame['atom'].values
+        bond_radii = snapshot['bond_radii']
+        changed_atoms = (atoms != snapshot['atoms']).nonzero()[0]
+        if len(changed_atoms):
+            bond_radii = bond_radii.copy()
+            bond_radii[changed_atoms] = self._give_bond_radii(
+                snapshot['atomic_radius_data'],
+                snapshot['modified_properties'], rows=changed_atoms)
+        moved = ~(np.abs(positions - snapshot['positions']) <= atol).all(
+            axis=1)
+        moved |= ~(bond_radii == snapshot['bond_radii'])
+        query = moved.nonzero()[0]
+        if not len(query):
+            return old, query
+
+        tree, tree_positions = snapshot.get('tree', (None, None))
+        stale = (None if tree is None else
+                 (~(positions == tree_positions).all(axis=1)).nonzero()[0])
+        if tree is None or 8 * len(stale) > len(self):
+            tree, tree_positions = cKDTree(positions), positions
+            stale = np.empty(0, dtype='i8')
+        a, b = self._give_kd_tree_bonds(
+            tree, stale, positions, bond_radii, query,
+            self_bonding_allowed=snapshot['self_bonding_allowed'])
+
+        old_rows = old.get_row_indices()
+        lost = moved[old_rows] & ~moved[old.indices]
+        affected = np.unique(np.concatenate([query, b, old.indices[lost]]))
+        # Bonds between two unmoved atoms stay as they are
+        positions_in_old, lengths = _gather_rows(old.indptr, affected)
+        kept_rows = np.repeat(affected, lengths)
+        kept = old.indices[positions_in_old]
+        keep = ~(moved[kept_rows] | moved[kept])
+        n = len(self)
+        keys = np.unique(np.concatenate([
+            kept_rows[keep] * n + kept[keep], a * n + b, b * n + a]))
+        rows, row_indices = np.divmod(keys, n)
+        row_ptr = np.append(np.searchsorted(rows, affected), len(rows))
+        connectivity = old.replace_rows(affected, row_ptr, row_indices)
+        connectivity._snapshot = dict(
+            snapshot, positions=positions, bond_radii=bond_radii,
+            atoms=atoms.copy(), tree=(tree, tree_positions))
+        return connectivity, affected
+
+    @staticmethod
+    def _give_kd_tree_bonds(tree, stale, positions, bond_radii, query,
+                            self_bonding_allowed=False):
+        """Return the bonds of the atoms at the positions ``query``.
+
+        ``tree`` is a :class:`scipy.spatial.cKDTree` over old positions,
+        which are still valid for all atoms except ``stale``.
+
+        Returns:
+            tuple: Two integer arrays ``(a, b)`` of positions, where
+            ``a[k]`` from ``query`` is bonded to ``b[k]``.
+        """
+        def give_candidates(tree, points, radius):
+            neighbours = tree.query_ball_point(points, radius)
+            lengths = [len(x) for x in neighbours]
+            return (np.repeat(query, lengths),
+                    np.fromiter(itertools.chain.from_iterable(neighbours),
+                                dtype='i8', count=sum(lengths)))
+
+        radius = 2 * np.nanmax(bond_radii)
+        moved = np.union1d(stale, query)
+        is_moved = np.zeros(len(positions), dtype=bool)
+        is_moved[moved] = True
+        a, b = give_candidates(tree, positions[query], radius)
+        a, b = a[~is_moved[b]], b[~is_moved[b]]
+        a_moved, b_moved = give_candidates(cKDTree(positions[moved]),
+                                           positions[query], radius)
+        a = np.concatenate([a, a_moved])
+        b = np.concatenate([b, moved[b_moved]])
+        if not self_bonding_allowed:
+            a, b = a[a != b], b[a != b]
+        # The same expression as in _jit_cell_list_bonds
+        d = positions[a] - positions[b]
+        D = d[:, 0]**2 + d[:, 1]**2 + d[:, 2]**2
+        B = (bond_radii[a] + bond_radii[b])**2
+        bonded = (B - D) >= 0
+        return a[bonded], b[bonded]
 
     def get_coordination_sphere(
             self, index_of_atom, n_sphere=1, give_only_index=False,
@@ -519,40 +931,56 @@ class CartesianCore(PandasWrapper, GenericCore):
         Returns:
             A set of indices or a new Cartesian instance.
         """
-        if use_lookup is None:
-            use_lookup = settings['defaults']['use_lookup']
-        exclude = set() if exclude is None else exclude
-        bond_dict = self.get_bonds(use_lookup=use_lookup)
-        i = index_of_atom
-        if n_sphere != 0:
-            visited = set([i]) | exclude
-            try:
-                tmp_bond_dict = {j: (bond_dict[j] - visited)
-                                 for j in bond_dict[i]}
-            except KeyError:
-                tmp_bond_dict = {}
-            n = 0
-            while tmp_bond_dict and (n + 1) < n_sphere:
-                new_tmp_bond_dict = {}
-                for i in tmp_bond_dict:
-                    if i in visited:
-                        continue
-                    visited.add(i)
-                    for j in tmp_bond_dict[i]:
-                        new_tmp_bond_dict[j] = bond_dict[j] - visited
-                tmp_bond_dict = new_tmp_bond_dict
-                n += 1
-            if only_surface:
-                index_out = set(tmp_bond_dict.keys())
-            else:
-                index_out = visited | set(tmp_bond_dict.keys())
-        else:
-            index_out = {i}
-
+        sphere_ptr, spheres = self.get_coordination_spheres(
+            [index_of_atom], n_sphere=n_sphere, only_surface=only_surface,
+            exclude=exclude, use_lookup=use_lookup)
+        index_out = set(spheres)
         if give_only_index:
-            return index_out - exclude
+            return index_out
         else:
-            return self.loc[index_out - exclude]
+            return self.loc[index_out]
+
+    def get_coordination_spheres(
+            self, indices, n_sphere=1, only_surface=True, exclude=None,
+            use_lookup=None):
+        """Return the coordination spheres of many atoms at once.
+
+        This is the vectorised version of
+        :meth:`~chemcoord.Cartesian.get_coordination_sphere`.
+        All spheres are found in one pass with
+        :meth:`~chemcoord.Connectivity.get_spheres`.
+
+        Args:
+            indices (sequence): The indices of the centre atoms.
+            n_sphere (int): Determines the number of the coordination sphere.
+            only_surface (bool): Return only the surface of the coordination
+                sphere.
+            exclude (set): A set of indices that should be ignored
+                for the path finding.
+            use_lookup (bool): Use a lookup variable for
+                :meth:`~chemcoord.Cartesian.get_bonds`. The default is
+                specified in ``settings['defaults']['use_lookup']``
+
+        Returns:
+            tuple: A ragged array ``(sphere_ptr, spheres)``.
+            The indices of the atoms in the sphere of ``indices[k]`` are
+            ``spheres[sphere_ptr[k]:sphere_ptr[k + 1]]`` sorted by their
+            distance to the centre.
+        """
+        if use_lookup is None:
+            use_lookup = settings['defaults']['use_lookup']
+        connectivity = self._give_lookup_connectivity(use_lookup)
+        rows = self.index.get_indexer(list(indices))
+        if (rows == -1).any():
+            raise KeyError('indices contains atoms that are not in '
+                           'self.index')
+        if exclude is not None:
+            exclude = self.index.get_indexer(list(exclude))
+            exclude = exclude[exclude != -1]
+        sphere_ptr, spheres = connectivity.get_spheres(
+            rows, n_sphere=n_sphere, only_surface=only_surface,
+            exclude=exclude)
+        return sphere_ptr, self.index.values[spheres]
 
     def _preserve_bonds(self, sliced_cartesian,
                         use_lookup=None):
@@ -577,28 +1005,12 @@ class CartesianCore(PandasWrapper, GenericCore):
         if use_lookup is None:
             use_lookup = settings['defaults']['use_lookup']
 
-        included_atoms_set = set(sliced_cartesian.index)
-        assert included_atoms_set.issubset(set(self.index)), \
+        assert sliced_cartesian.index.isin(self.index).all(), \
             'The sliced Cartesian has to be a subset of the bigger frame'
-        bond_dic = self.get_bonds(use_lookup=use_lookup)
-        new_atoms = set([])
-        for atom in included_atoms_set:
-            new_atoms = new_atoms | bond_dic[atom]
-        new_atoms = new_atoms - included_atoms_set
-        while not new_atoms == set([]):
-            index_of_interest = new_atoms.pop()
-            included_atoms_set = (
-                included_atoms_set |
-                self.get_coordination_sphere(
-                    index_of_interest,
-                    n_sphere=float('inf'),
-                    only_surface=False,
-                    exclude=included_atoms_set,
-                    give_only_index=True,
-                    use_lookup=use_lookup))
-            new_atoms = new_atoms - included_atoms_set
-        molecule = self.loc[included_atoms_set, :]
-        return molecule
+        connectivity = self._give_lookup_connectivity(use_lookup)
+        mask = connectivity.get_bond_preserving_mask(
+            self.index.isin(sliced_cartesian.index))
+        return self[mask]
 
     def cut_sphere(
             self,
@@ -638,6 +1050,64 @@ class CartesianCore(PandasWrapper, GenericCore):
 
         return molecule
 
+    def cut_spheres(
+            self,
+            radius=15.,
+            origins=None,
+            outside_sliced=True,
+            preserve_bonds=False):
+        """Cut many spheres of same radius at once.
+
+        This is the vectorised version of :meth:`~Cartesian.cut_sphere`,
+        e.g. to carve out the surroundings of every adsorbate on a surface.
+        The distance of each atom to its nearest origin is found with
+        a KD-tree, so the cost grows only logarithmically with the
+        number of origins.
+
+        Args:
+            radius (float):
+            origins (sequence): A two dimensional array of shape
+                ``(n, 3)`` is read as the positions of the origins.
+                A one dimensional float array of length three is read
+                as the position of a single origin, like the ``origin``
+                of :meth:`~Cartesian.cut_sphere`.
+                Any other one dimensional sequence is read as indices,
+                whose atoms are taken as origins.
+            outside_sliced (bool): Atoms outside/inside all spheres
+                are cut out.
+            preserve_bonds (bool): Do not cut covalent bonds.
+
+        Returns:
+            Cartesian: The atoms in the union of all spheres, if
+            ``outside_sliced`` is True.
+        """
+        if origins is None:
+            origins = np.zeros((1, 3))
+        else:
+            origins = np.asarray(origins)
+            if origins.ndim == 1:
+                if (len(origins) == 3
+                        and pd.api.types.infer_dtype(origins) == 'floating'):
+                    origins = origins[None, :]
+                else:
+                    origins = self.loc[origins, ['x', 'y', 'z']]
+            elif origins.ndim != 2 or origins.shape[1] != 3:
+                raise ValueError('origins has to be a sequence of indices '
+                                 'or an array of shape (n, 3).')
+        origins = np.asarray(origins, dtype='f8').reshape((-1, 3))
+
+        pos = self.loc[:, ['x', 'y', 'z']].values.astype('f8')
+        distance = cKDTree(origins).query(pos,
+                                          distance_upper_bound=radius)[0]
+        if outside_sliced:
+            molecule = self[distance < radius]
+        else:
+            molecule = self[distance > radius]
+
+        if preserve_bonds:
+            molecule = self._preserve_bonds(molecule)
+        return molecule
+
     def cut_cuboid(
             self,
             a=20,
@@ -854,32 +1324,57 @@ class CartesianCore(PandasWrapper, GenericCore):
 
         Returns:
             list: A list of sets of indices or new Cartesian instances.
+            The fragments are in the order of their first atom in self.
         """
         if use_lookup is None:
             use_lookup = settings['defaults']['use_lookup']
+        return self._give_fragments(self._give_lookup_connectivity(use_lookup),
+                                    give_only_index=give_only_index)
 
+    def _give_lookup_connectivity(self, use_lookup):
+        """Return the connectivity of the cached bonds of self.
+
+        The bonds are calculated with :meth:`get_bonds` and the default
+        parameters.
+        """
+        bond_dict = self.get_bonds(use_lookup=use_lookup)
+        connectivity = self._get_lookup('connectivity',
+                                        self._give_bond_parameters())
+        if connectivity is None:
+            connectivity = Connectivity.from_bond_dict(bond_dict,
+                                                       index=self.index)
+        return connectivity
+
+    def _give_fragments(self, connectivity, give_only_index=False):
+        """Split the atoms of ``connectivity`` into bonded fragments.
+
+        The atoms are labelled with
+        :meth:`~chemcoord.Connectivity.get_fragment_labels` and all
+        fragments are created by one groupby.
+        The bonds of the fragments are cached for the default parameters
+        of :meth:`get_bonds`.
+        """
+        if not len(connectivity):
+            return []
+        labels = connectivity.get_fragment_labels()
+        if give_only_index:
+            order = np.argsort(labels, kind='mergesort')
+            ends = np.cumsum(np.bincount(labels))[:-1]
+            return [set(atoms) for atoms in
+                    np.split(connectivity.index.values[order], ends)]
+        parameters = self._give_bond_parameters()
+        _metadata = self._give_metadata_without_lookups()
+        frames = self._frame.loc[connectivity.index].groupby(labels,
+                                                              sort=True)
         fragments = []
-        pending = set(self.index)
-        self.get_bonds(use_lookup=use_lookup)
-
-        while pending:
-            index = self.get_coordination_sphere(
-                pending.pop(), use_lookup=True, n_sphere=float('inf'),
-                only_surface=False, give_only_index=True)
-            pending = pending - index
-            if give_only_index:
-                fragments.append(index)
-            else:
-                fragment = self.loc[index]
-                fragment._metadata['bond_dict'] = fragment.restrict_bond_dict(
-                    self._metadata['bond_dict'])
-                try:
-                    fragment._metadata['val_bond_dict'] = (
-                        fragment.restrict_bond_dict(
-                            self._metadata['val_bond_dict']))
-                except KeyError:
-                    pass
-                fragments.append(fragment)
+        for (_, frame), sub_connectivity in zip(frames,
+                                                connectivity.split(labels)):
+            fragment = self.__class__(frame, metadata=self.metadata,
+                                      _metadata=_metadata)
+            fragment._set_lookup('connectivity', sub_connectivity, parameters)
+            fragment._set_lookup('bond_dict', sub_connectivity.to_bond_dict(),
+                                 parameters)
+            fragments.append(fragment)
         return fragments
 
     def restrict_bond_dict(self, bond_dict):
@@ -953,8 +1448,9 @@ class CartesianCore(PandasWrapper, GenericCore):
                     index_of_all_fragments = fragment.index
         else:
             index_of_all_fragments = fragments.index
-        missing_part = self.loc[self.index.difference(index_of_all_fragments)]
-        missing_part = missing_part.fragmentate(use_lookup=use_lookup)
+        connectivity = self._give_lookup_connectivity(use_lookup)
+        missing_part = self._give_fragments(connectivity.subgraph(
+            self.index.difference(index_of_all_fragments)))
         return sorted(missing_part, key=len, reverse=True)
 
     @staticmethod
@@ -1098,9 +1594,7 @@ class CartesianCore(PandasWrapper, GenericCore):
             return dot(np.dot(np.linalg.inv(new_basis), old_basis), self)
 
     def _get_positions(self, indices):
-        old_index = self.index
-        self.index = range(len(self))
-        rename = {j: i for i, j in enumerate(old_index)}
+        rename = {j: i for i, j in enumerate(self.index)}
 
         pos = self.loc[:, ['x', 'y', 'z']].values.astype('f8')
         out = np.empty((len(indices), 3))
@@ -1111,8 +1605,6 @@ class CartesianCore(PandasWrapper, GenericCore):
 
         for row, i in zip(np.nonzero(~normal), indices[~normal]):
             out[row] = constants.absolute_refs[i]
-
-        self.index = old_index
         return out
 
     def get_distance_to(self, origin=None, other_atoms=None, sort=False):
@@ -1156,7 +1648,7 @@ class CartesianCore(PandasWrapper, GenericCore):
             return output
 
     def partition_chem_env(self, n_sphere=4,
-                           use_lookup=None):
+                           use_lookup=None, engine='spheres'):
         """This function partitions the molecule into subsets of the
         same chemical environment.
 
@@ -1186,12 +1678,23 @@ class CartesianCore(PandasWrapper, GenericCore):
         stop after ``n_sphere`` or after reaching the end of
         branches.
 
+        For large systems ``engine='hash'`` describes the chemical
+        environment instead by an integer hash, which is calculated for
+        all atoms together with
+        :meth:`~chemcoord.Connectivity.get_environment_hashes`.
+        It distinguishes atoms by the elements along all paths
+        of up to ``n_sphere`` bonds, so the partition is not
+        necessarily the same as for ``engine='spheres'``.
+        The hashes are equal for equivalent atoms in different molecules.
+
 
         Args:
             n_sphere (int):
             use_lookup (bool): Use a lookup variable for
                 :meth:`~chemcoord.Cartesian.get_bonds`. The default is
                 specified in ``settings['defaults']['use_lookup']``
+            engine (str): Either ``'spheres'``, which counts the atoms
+                of each coordination sphere, or ``'hash'``.
 
         Returns:
             dict: The output will look like this::
@@ -1200,24 +1703,49 @@ class CartesianCore(PandasWrapper, GenericCore):
 
                 A dictionary mapping from a chemical environment to
                 the set of indices of atoms in this environment.
+                For ``engine='hash'`` the keys are
+                ``(element_symbol, int)``.
         """
         if use_lookup is None:
             use_lookup = settings['defaults']['use_lookup']
-
-        def get_chem_env(self, i, n_sphere):
-            env_index = self.get_coordination_sphere(
-                i, n_sphere=n_sphere, only_surface=False,
-                give_only_index=True, use_lookup=use_lookup)
-            env_index.remove(i)
-            atoms = self.loc[env_index, 'atom']
-            environment = frozenset(collections.Counter(atoms).most_common())
-            return (self.loc[i, 'atom'], environment)
-
+        if engine == 'hash':
+            return self._partition_chem_env_hashed(n_sphere, use_lookup)
+        elif engine != 'spheres':
+            raise ValueError("engine has to be one of 'spheres', 'hash'")
+
+        sphere_ptr, spheres = self.get_coordination_spheres(
+            self.index, n_sphere=n_sphere, only_surface=False,
+            use_lookup=use_lookup)
+        atoms = self['atom'].values
+        rows = self.index.get_indexer(spheres)
         chemical_environments = collections.defaultdict(set)
-        for i in self.index:
-            chemical_environments[get_chem_env(self, i, n_sphere)].add(i)
+        for k, i in enumerate(self.index):
+            # The first atom of each sphere is the centre itself
+            env_atoms = atoms[rows[sphere_ptr[k] + 1:sphere_ptr[k + 1]]]
+            environment = frozenset(
+                collections.Counter(env_atoms).most_common())
+            chemical_environments[(atoms[k], environment)].add(i)
         return dict(chemical_environments)
 
+    def _partition_chem_env_hashed(self, n_sphere, use_lookup):
+        connectivity = self._give_lookup_connectivity(use_lookup)
+        elements, codes = np.unique(self['atom'].values.astype('U'),
+                                    return_inverse=True)
+        # The codes have to be independent of the other elements present
+        # and of the numpy version, hence the plain string is hashed.
+        element_hashes = np.array(
+            [int(hashlib.sha1(str(element).encode()).hexdigest()[:16], 16)
+             for element in elements], dtype='u8')
+        hashes = connectivity.get_environment_hashes(
+            element_hashes[codes], n_sphere=n_sphere)
+        keys, inverse = np.unique(hashes, return_inverse=True)
+        order = np.argsort(inverse, kind='mergesort')
+        bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+        index = self.index.values[order]
+        atoms = self['atom'].values[order]
+        return {(atoms[start], int(key)): set(index[start:end])
+                for key, start, end in zip(keys, bounds[:-1], bounds[1:])}
+
     def align(self, other, indices=None, ignore_hydrogens=False):
         """Align two Cartesians.
 
@@ -1270,7 +1798,8 @@ class CartesianCore(PandasWrapper, GenericCore):
         m2 = dot(xyz_functions.get_kabsch_rotation(pos1, pos2), m2)
         return m1, m2
 
-    def reindex_similar(self, other, n_sphere=4):
+    def reindex_similar(self, other, n_sphere=4, engine='hash',
+                        assignment='optimal'):
         """Reindex ``other`` to be similarly indexed as ``self``.
 
         Returns a reindexed copy of ``other`` that minimizes the
@@ -1279,6 +1808,19 @@ class CartesianCore(PandasWrapper, GenericCore):
         Read more about the definition of the chemical environment in
         :func:`Cartesian.partition_chem_env`
 
+        With ``assignment='optimal'`` the atoms of each chemical environment
+        are matched such that the sum of the distances is minimal.
+        If the nearest neighbours found with a KD-tree are already a one
+        to one mapping, they are used directly; otherwise the assignment
+        problem is solved with
+        :func:`scipy.sparse.csgraph.min_weight_full_bipartite_matching`
+        on the pairs closer than a cutoff.
+        The cutoff starts at the distance to the eighth nearest neighbour
+        and is doubled until every atom can be matched.
+        For scipy<1.6 :func:`scipy.optimize.linear_sum_assignment`
+        is used on the full distance matrix.
+        ``assignment='greedy'`` matches the atoms one after the other.
+
         .. note:: It is necessary to align ``self`` and other before
             applying this method.
             This can be done via :meth:`~Cartesian.align`.
@@ -1290,6 +1832,9 @@ class CartesianCore(PandasWrapper, GenericCore):
             other (Cartesian):
             n_sphere (int): Wrapper around the argument for
                 :meth:`~Cartesian.partition_chem_env`.
+            engine (str): Wrapper around the argument for
+                :meth:`~Cartesian.partition_chem_env`.
+            assignment (str): Either ``'optimal'`` or ``'greedy'``.
 
         Returns:
             Cartesian: Reindexed version of other
@@ -1324,19 +1869,64 @@ class CartesianCore(PandasWrapper, GenericCore):
                         found = True
             return index_dct
 
+        def match_subset_optimal(m1, subset1, m2, subset2, index_dct):
+            """Changes index_dct INPLACE"""
+            coords = ['x', 'y', 'z']
+            index1, index2 = list(subset1), list(subset2)
+            pos1 = m1.loc[index1, coords].values.astype('f8')
+            pos2 = m2.loc[index2, coords].values.astype('f8')
+            tree1, tree2 = cKDTree(pos1), cKDTree(pos2)
+            nearest = tree2.query(pos1)[1]
+            if len(np.unique(nearest)) == len(index1):
+                # Every distance is minimal, so the sum is minimal as well
+                rows, cols = np.arange(len(index1)), nearest
+            elif min_weight_full_bipartite_matching is None:
+                rows, cols = linear_sum_assignment(cdist(pos1, pos2))
+            else:
+                k = min(len(index1), 8)
+                # The cutoff has to be positive to be doubled,
+                # even if the atoms are at the same positions.
+                max_distance = max(tree2.query(pos1, k=k)[0].max(), 1e-8)
+                while True:
+                    pairs = tree1.sparse_distance_matrix(
+                        tree2, max_distance, output_type='ndarray')
+                    # Atoms at the same position must not be a missing edge
+                    distances = csr_matrix(
+                        (pairs['v'] + np.finfo('f8').tiny,
+                         (pairs['i'], pairs['j'])),
+                        shape=(len(index1), len(index2)))
+                    try:
+                        rows, cols = min_weight_full_bipartite_matching(
+                            distances)
+                        break
+                    except ValueError:
+                        # No full matching among the candidates
+                        max_distance *= 2
+            for row, col in zip(rows, cols):
+                index_dct[index2[col]] = index1[row]
+            return index_dct
+
+        if assignment == 'optimal':
+            match_subset = match_subset_optimal
+        elif assignment == 'greedy':
+            match_subset = make_subset_similar
+        else:
+            raise ValueError("assignment has to be one of "
+                             "'optimal', 'greedy'")
+
         molecule1 = self.copy()
         molecule2 = other.copy()
 
-        partition1 = molecule1.partition_chem_env(n_sphere)
-        partition2 = molecule2.partition_chem_env(n_sphere)
+        partition1 = molecule1.partition_chem_env(n_sphere, engine=engine)
+        partition2 = molecule2.partition_chem_env(n_sphere, engine=engine)
 
         index_dct = {}
         for key in partition1:
             message = ('You have chemically different molecules, regarding '
                        'the topology of their connectivity.')
             assert len(partition1[key]) == len(partition2[key]), message
-            index_dct = make_subset_similar(molecule1, partition1[key],
-                                            molecule2, partition2[key],
-                                            index_dct)
+            index_dct = match_subset(molecule1, partition1[key],
+                                     molecule2, partition2[key],
+                                     index_dct)
         molecule2.index = [index_dct[i] for i in molecule2.index]
         return molecule2.loc[molecule1.index]
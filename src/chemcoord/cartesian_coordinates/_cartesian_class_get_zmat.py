@@ -3,22 +3,148 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals, with_statement)
 
 import warnings
-from collections import OrderedDict
 from functools import partial
 from itertools import permutations
 
 import numpy as np
 import pandas as pd
+from numba import jit
+from scipy.sparse import bsr_matrix
 
 import chemcoord.cartesian_coordinates._cart_transformation as transformation
 import chemcoord.cartesian_coordinates.xyz_functions as xyz_functions
 import chemcoord.constants as constants
 from chemcoord.cartesian_coordinates._cartesian_class_core import CartesianCore
+from chemcoord.cartesian_coordinates.connectivity import (Connectivity,
+                                                          _gather_rows)
+from chemcoord.cartesian_coordinates.zmat_plan import ZmatPlan
 from chemcoord.configuration import settings
 from chemcoord.exceptions import (ERR_CODE_OK, ERR_CODE_InvalidReference,
                                   IllegalArgumentCombination, InvalidReference,
                                   UndefinedCoordinateSystem)
 from chemcoord.internal_coordinates.zmat_class_main import Zmat
+from chemcoord.utilities._cache import give_array_key
+from chemcoord.utilities._parallel import get_n_jobs, numba_threads
+from chemcoord.utilities._set_order import (copy_order, difference_order,
+                                            give_hashes, set_order)
+
+_E_X, _E_Z = constants.int_label['e_x'], constants.int_label['e_z']
+
+
+@jit(nopython=True, cache=True)
+def _val_sorted(atoms, valency):
+    """Sort ``atoms`` by descending valency and keep the order of ties."""
+    return atoms[np.argsort(-valency[atoms], kind='mergesort')]
+
+
+@jit(nopython=True, cache=True)
+def _give_set_ordered_rows(indptr, indices, position_hashes, hashes,
+                           restricted):
+    """Order the bonded atoms of each atom like the former bond sets.
+
+    :meth:`~Cartesian.get_bonds` created sets of positions,
+    that were renamed to sets of indices and copied into
+    a :class:`sortedcontainers.SortedSet` sorted by valency.
+    The bonds of fragments from :meth:`~Cartesian.fragmentate`
+    were restricted to them, if ``restricted``.
+
+    Returns:
+        tuple: The ordered ``indices`` and the table size of each set.
+    """
+    ordered = np.empty_like(indices)
+    sizes = np.empty(len(indptr) - 1, dtype=np.int64)
+    for i in range(len(indptr) - 1):
+        bonded = set_order(indices[indptr[i]:indptr[i + 1]],
+                           position_hashes)[0]
+        bonded = set_order(bonded, hashes)[0]
+        bonded, size = set_order(bonded, hashes)
+        bonded, size = copy_order(bonded, size, hashes)
+        if restricted:
+            bonded, size = set_order(bonded, hashes)
+        ordered[indptr[i]:indptr[i + 1]] = bonded
+        sizes[i] = size
+    return ordered, sizes
+
+
+@jit(nopython=True, cache=True)
+def _first_defined(indptr, indices, valency, hashes, order, n_defined,
+                   defined, i, exclude1, exclude2):
+    """Return the already defined atom bonded to ``i`` of highest valency.
+
+    Ties are broken like ``(bonded[i] & set(order_of_def)) - {b, a}``
+    in the former implementation, where the last difference is only taken
+    if ``exclude1 != -1``.
+    Returns -1 if there is none.
+    """
+    bonded = indices[indptr[i]:indptr[i + 1]]
+    if n_defined > len(bonded):
+        common = bonded[defined[bonded] != -1]
+    else:
+        # The intersection iterates over the smaller set.
+        common = set_order(order[:n_defined], hashes)[0]
+        is_bonded = np.zeros(len(common), dtype=np.bool_)
+        for k in range(len(common)):
+            for j in bonded:
+                if j == common[k]:
+                    is_bonded[k] = True
+        common = common[is_bonded]
+    common, size = set_order(common, hashes)
+    if exclude1 != -1:
+        common = difference_order(
+            common, size, (common != exclude1) & (common != exclude2),
+            1 if exclude1 == exclude2 else 2, hashes)[0]
+    if len(common) == 0:
+        return -1
+    return _val_sorted(common, valency)[0]
+
+
+@jit(nopython=True, cache=True)
+def _give_first_candidates(indptr, indices, sizes, valency, hashes,
+                           row, problem_row, n_table, b, a, d):
+    """Return the bonded atoms of ``a``, that may replace ``d``.
+
+    The candidates of each problematic atom are ordered like
+    ``bonded[a] - {b, a, d} - set(c_table.index[problem_row:])``
+    in the former implementation.
+
+    Returns:
+        tuple: ``(problem, candidate)``
+    """
+    n_entries = 0
+    for k in range(len(a)):
+        n_entries += indptr[a[k] + 1] - indptr[a[k]]
+    problem = np.empty(n_entries, dtype=np.int64)
+    candidate = np.empty(n_entries, dtype=np.int64)
+    n = 0
+    for k in range(len(a)):
+        bonded = indices[indptr[a[k]]:indptr[a[k] + 1]]
+        bonded, size = difference_order(
+            bonded, sizes[a[k]],
+            (bonded != b[k]) & (bonded != a[k]) & (bonded != d[k]),
+            3, hashes)
+        is_later = np.zeros(len(bonded), dtype=np.bool_)
+        for j in range(len(bonded)):
+            is_later[j] = row[bonded[j]] >= problem_row[k]
+        bonded = _val_sorted(difference_order(
+            bonded, size, ~is_later, n_table - problem_row[k], hashes)[0],
+            valency)
+        problem[n:n + len(bonded)] = k
+        candidate[n:n + len(bonded)] = bonded
+        n += len(bonded)
+    return problem[:n], candidate[:n]
+
+
+def _give_angles_degrees(positions, i, b, a):
+    """Return the angles in degrees between the atoms ``i, b, a``.
+
+    The atoms are given by their positions in ``positions``.
+    Compare with :meth:`~Cartesian.get_angle_degrees`.
+    """
+    BI, BA = positions[i] - positions[b], positions[a] - positions[b]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        bi, ba = [v / np.linalg.norm(v, axis=1)[:, None] for v in (BI, BA)]
+    dot_product = np.clip(np.sum(bi * ba, axis=1), -1, 1)
+    return np.degrees(np.arccos(dot_product))
 
 
 class CartesianGetZmat(CartesianCore):
@@ -45,8 +171,172 @@ class CartesianGetZmat(CartesianCore):
                 if not reference.isin(c_table.index[:row]).all():
                     raise UndefinedCoordinateSystem(give_message(i=i))
 
+    @staticmethod
+    @jit(nopython=True, cache=True)
+    def _jit_frag_constr_table(indptr, indices, sizes, valency, hashes,
+                               order_of_def, user_rank, predefined):
+        """Create a construction table by a breadth first search.
+
+        The atoms are given by their positions and the bonds in compressed
+        sparse row format, see
+        :meth:`~Cartesian._give_val_sorted_connectivity`.
+        Bonded atoms are visited by descending valency.
+        The rows of ``predefined`` for the atoms in ``order_of_def``
+        contain the already defined part of the construction table.
+        Absolute references are encoded with :attr:`constants.int_label`,
+        references to atoms outside of the fragment with positions
+        larger than the number of atoms.
+
+        Returns:
+            tuple: ``(err, order_of_def, table)``. ``table[i]`` contains
+            the references of the atom at position ``i``.
+        """
+        n = len(indptr) - 1
+        table = predefined.copy()
+        order = np.empty(n, dtype=np.int64)
+        # The position of an atom in order_of_def or -1.
+        defined = np.full(n, -1, dtype=np.int64)
+        for k in range(len(order_of_def)):
+            order[k] = order_of_def[k]
+            defined[order_of_def[k]] = k
+        n_defined = len(order_of_def)
+        parent = np.full(n, -1, dtype=np.int64)
+        # Instead of copying the unvisited bonded atoms for every atom of
+        # the BFS frontier, the time of their visit is stored. A frontier
+        # entry only remembers when its bonded atoms were looked up.
+        visit_time = np.full(n, -1, dtype=np.int64)
+        clock = 0
+        visit_time[order[0]] = clock
+
+        frontier = np.empty(n, dtype=np.int64)
+        frontier_time = np.empty(n, dtype=np.int64)
+        new_frontier = np.empty(n, dtype=np.int64)
+        new_frontier_time = np.empty(n, dtype=np.int64)
+        position_in_new = np.full(n, -1, dtype=np.int64)
+        n_frontier = 0
+        if n > 1:
+            i = order[0]
+            for j in _val_sorted(indices[indptr[i]:indptr[i + 1]], valency):
+                parent[j] = i
+                frontier[n_frontier] = j
+                frontier_time[n_frontier] = clock
+                n_frontier += 1
+
+        while n_frontier:
+            # User defined atoms are processed first.
+            user_first = np.argsort(np.where(
+                user_rank[frontier[:n_frontier]] == -1, n,
+                user_rank[frontier[:n_frontier]]), kind='mergesort')
+            frontier[:n_frontier] = frontier[:n_frontier][user_first]
+            frontier_time[:n_frontier] = frontier_time[:n_frontier][
+                user_first]
+
+            n_new = 0
+            for entry in range(n_frontier):
+                i = frontier[entry]
+                if visit_time[i] != -1:
+                    continue
+                if user_rank[i] == -1:
+                    b = parent[i]
+                    if defined[b] < 3:
+                        if n_defined == 1:
+                            a, d = _E_Z, _E_X
+                        elif n_defined == 2:
+                            a = _first_defined(
+                                indptr, indices, valency, hashes, order,
+                                n_defined, defined, b, -1, -1)
+                            if a == -1:
+                                return ERR_CODE_InvalidReference, order, table
+                            d = _E_X
+                        else:
+                            a = parent[b]
+                            if a == -1:
+                                a = _first_defined(
+                                    indptr, indices, valency, hashes, order,
+                                    n_defined, defined, b, -1, -1)
+                                if a == -1:
+                                    return (ERR_CODE_InvalidReference,
+                                            order, table)
+                            d = parent[a]
+                            if d == -1 or d == b or d == a:
+                                d = _first_defined(
+                                    indptr, indices, valency, hashes, order,
+                                    n_defined, defined, a, b, a)
+                                if d == -1:
+                                    d = _first_defined(
+                                        indptr, indices, valency, hashes,
+                                        order, n_defined, defined, b, b, a)
+                                if d == -1:
+                                    return (ERR_CODE_InvalidReference,
+                                            order, table)
+                    else:
+                        a, d = table[b, 0], table[b, 1]
+                    table[i, 0], table[i, 1], table[i, 2] = b, a, d
+                    order[n_defined] = i
+                    defined[i] = n_defined
+                    n_defined += 1
+
+                clock += 1
+                visit_time[i] = clock
+                # The bonded atoms, that were not visited when i entered
+                # the frontier, in the order of the former set difference.
+                bonded = indices[indptr[i]:indptr[i + 1]]
+                time = frontier_time[entry]
+                bonded = _val_sorted(difference_order(
+                    bonded, sizes[i],
+                    (visit_time[bonded] == -1) | (visit_time[bonded] > time),
+                    time + 1, hashes)[0], valency)
+                for j in bonded:
+                    if position_in_new[j] == -1:
+                        position_in_new[j] = n_new
+                        new_frontier[n_new] = j
+                        n_new += 1
+                    new_frontier_time[position_in_new[j]] = clock
+                    parent[j] = i
+
+            for entry in range(n_new):
+                position_in_new[new_frontier[entry]] = -1
+            frontier, new_frontier = new_frontier, frontier
+            frontier_time, new_frontier_time = (new_frontier_time,
+                                                frontier_time)
+            n_frontier = n_new
+        return ERR_CODE_OK, order[:n_defined], table
+
+    def _give_val_sorted_connectivity(self, use_lookup, bond_dict=None,
+                                      parent=None):
+        """Return the bonds in CSR format and the valency of each atom.
+
+        The bonded atoms of each atom are in the iteration order of the
+        former bond sets, so ties between atoms of equal valency are broken
+        as before. Look into :func:`_give_set_ordered_rows`.
+
+        Args:
+            parent (Cartesian): The molecule, that was split by
+                :meth:`~Cartesian.fragmentate` into fragments
+                containing ``self``.
+
+        Returns:
+            tuple: ``(indptr, indices, sizes, valency, hashes)``
+        """
+        if bond_dict is None:
+            connectivity = self.get_connectivity(use_lookup=use_lookup)
+        else:
+            connectivity = Connectivity.from_bond_dict(bond_dict,
+                                                       index=self.index)
+        valency = self.add_data('valency')['valency'].values
+        hashes = give_hashes(self.index)
+        if parent is None:
+            positions = np.arange(len(self))
+        else:
+            positions = parent.index.get_indexer(self.index)
+        indices, sizes = _give_set_ordered_rows(
+            connectivity.indptr, connectivity.indices,
+            positions.astype('i8').view('u8'), hashes, parent is not None)
+        return connectivity.indptr, indices, sizes, valency, hashes
+
     def _get_frag_constr_table(self, start_atom=None, predefined_table=None,
-                               use_lookup=None, bond_dict=None):
+                               use_lookup=None, bond_dict=None,
+                               parent=None):
         """Create a construction table for a Zmatrix.
 
         A construction table is basically a Zmatrix without the values
@@ -74,117 +364,60 @@ class CartesianGetZmat(CartesianCore):
         if use_lookup is None:
             use_lookup = settings['defaults']['use_lookup']
 
-        def modify_priority(bond_dict, user_defined):
-            def move_to_start(dct, key):
-                "Due to PY27 compatibility"
-                keys = dct.keys()
-                if key in keys and key != keys[0]:
-                    root = dct._OrderedDict__root
-                    first = root[1]
-                    link = dct._OrderedDict__map[key]
-                    link_prev, link_next, _ = link
-                    link_prev[1] = link_next
-                    link_next[0] = link_prev
-                    link[0] = root
-                    link[1] = first
-                    root[1] = first[0] = link
-                else:
-                    raise KeyError
-
-            for j in reversed(user_defined):
-                try:
-                    try:
-                        bond_dict.move_to_end(j, last=False)
-                    except AttributeError:
-                        # No move_to_end method in python 2.x
-                        move_to_start(bond_dict, j)
-                except KeyError:
-                    pass
-
         if start_atom is not None and predefined_table is not None:
             raise IllegalArgumentCombination('Either start_atom or '
                                              'predefined_table has to be None')
-        if bond_dict is None:
-            bond_dict = self._give_val_sorted_bond_dict(use_lookup=use_lookup)
         if predefined_table is not None:
             self._check_construction_table(predefined_table)
-            construction_table = predefined_table.copy()
 
+        index = self.index
+        indptr, indices, sizes, valency, hashes = (
+            self._give_val_sorted_connectivity(
+                use_lookup=use_lookup, bond_dict=bond_dict, parent=parent))
+
+        labels = index
+        predefined = np.zeros((len(index), 3), dtype='i8')
+        user_rank = np.full(len(index), -1, dtype='i8')
         if predefined_table is None:
             if start_atom is None:
-                molecule = self.get_distance_to(self.get_centroid())
-                i = molecule['distance'].idxmin()
+                positions = self.loc[:, ['x', 'y', 'z']].values.astype('f8')
+                distance = np.linalg.norm(
+                    positions - self.get_centroid().values, axis=1)
+                order_of_def = np.array([np.argmin(distance)])
             else:
-                i = start_atom
-            order_of_def = [i]
-            user_defined = []
-            construction_table = {i: {'b': 'origin',
-                                      'a': 'e_z',
-                                      'd': 'e_x'}}
+                order_of_def = index.get_indexer([start_atom])
+            predefined[order_of_def[0]] = [constants.int_label[k]
+                                           for k in ['origin', 'e_z', 'e_x']]
         else:
-            i = construction_table.index[0]
-            order_of_def = list(construction_table.index)
-            user_defined = list(construction_table.index)
-            construction_table = construction_table.to_dict(orient='index')
-
-        visited = {i}
-        if len(self) > 1:
-            parent = {j: i for j in bond_dict[i]}
-            work_bond_dict = OrderedDict(
-                [(j, bond_dict[j] - visited) for j in bond_dict[i]])
-            modify_priority(work_bond_dict, user_defined)
-        else:
-            parent, work_bond_dict = {}, {}
-
-        while work_bond_dict:
-            new_work_bond_dict = OrderedDict()
-            for i in work_bond_dict:
-                if i in visited:
-                    continue
-                if i not in user_defined:
-                    b = parent[i]
-                    if b in order_of_def[:3]:
-                        if len(order_of_def) == 1:
-                            construction_table[i] = {'b': b,
-                                                     'a': 'e_z',
-                                                     'd': 'e_x'}
-                        elif len(order_of_def) == 2:
-                            a = (bond_dict[b] & set(order_of_def))[0]
-                            construction_table[i] = {'b': b, 'a': a,
-                                                     'd': 'e_x'}
-                        else:
-                            try:
-                                a = parent[b]
-                            except KeyError:
-                                a = (bond_dict[b] & set(order_of_def))[0]
-                            try:
-                                d = parent[a]
-                                if d in set([b, a]):
-                                    message = "Don't make self references"
-                                    raise UndefinedCoordinateSystem(message)
-                            except (KeyError, UndefinedCoordinateSystem):
-                                try:
-                                    d = ((bond_dict[a] & set(order_of_def))
-                                         - set([b, a]))[0]
-                                except IndexError:
-                                    d = ((bond_dict[b] & set(order_of_def))
-                                         - set([b, a]))[0]
-                            construction_table[i] = {'b': b, 'a': a, 'd': d}
-                    else:
-                        a, d = [construction_table[b][k] for k in ['b', 'a']]
-                        construction_table[i] = {'b': b, 'a': a, 'd': d}
-                    order_of_def.append(i)
-
-                visited.add(i)
-                for j in work_bond_dict[i]:
-                    new_work_bond_dict[j] = bond_dict[j] - visited
-                    parent[j] = i
-
-            work_bond_dict = new_work_bond_dict
-            modify_priority(work_bond_dict, user_defined)
-        output = pd.DataFrame.from_dict(construction_table, orient='index')
-        output = output.loc[order_of_def, ['b', 'a', 'd']]
-        return output
+            order_of_def = index.get_indexer(predefined_table.index)
+            user_rank[order_of_def] = np.arange(len(order_of_def))
+            references = predefined_table.loc[:, ['b', 'a', 'd']].replace(
+                constants.int_label).values
+            is_abs_ref = (references < constants.keys_below_are_abs_refs)
+            # Predefined atoms may reference atoms outside of this fragment.
+            outside = pd.Index(references[~is_abs_ref]).difference(index)
+            labels = labels.append(outside)
+            predefined[order_of_def] = np.where(
+                is_abs_ref, references,
+                labels.get_indexer(references.ravel()).reshape(
+                    references.shape))
+
+        err, order_of_def, table = self._jit_frag_constr_table(
+            indptr, indices, sizes, valency, hashes,
+            order_of_def.astype('i8'), user_rank, predefined)
+        if err == ERR_CODE_InvalidReference:
+            raise UndefinedCoordinateSystem(
+                'There are not enough bonded atoms to define references.')
+
+        labels = labels.values.astype('O')
+        table = table[order_of_def]
+        output = np.empty(table.shape, dtype='O')
+        is_abs_ref = table < constants.keys_below_are_abs_refs
+        output[~is_abs_ref] = labels[table[~is_abs_ref]]
+        output[is_abs_ref] = [constants.string_repr[k]
+                              for k in table[is_abs_ref]]
+        return pd.DataFrame(output, index=index[order_of_def],
+                            columns=['b', 'a', 'd']).infer_objects()
 
     def get_construction_table(self, fragment_list=None,
                                use_lookup=None,
@@ -233,6 +466,8 @@ class CartesianGetZmat(CartesianCore):
                 is done automatically. The fragments are then sorted by
                 their number of atoms, in order to use the largest fragment
                 as reference for the other ones.
+                Fragments of the same size are in the order of their
+                first atom.
 
             use_lookup (bool): Use a lookup variable for
                 :meth:`~chemcoord.Cartesian.get_bonds`. The default is
@@ -247,9 +482,10 @@ class CartesianGetZmat(CartesianCore):
         if use_lookup is None:
             use_lookup = settings['defaults']['use_lookup']
 
+        parent = None
         if fragment_list is None:
+            parent = self
             self.get_bonds(use_lookup=use_lookup)
-            self._give_val_sorted_bond_dict(use_lookup=use_lookup)
             fragments = sorted(self.fragmentate(use_lookup=use_lookup),
                                key=len, reverse=True)
             # During function execution the bonding situation does not change,
@@ -285,7 +521,8 @@ class CartesianGetZmat(CartesianCore):
                 use_lookup=use_lookup, predefined_table=references)
         else:
             fragment = fragments[0]
-            full_table = fragment._get_frag_constr_table(use_lookup=use_lookup)
+            full_table = fragment._get_frag_constr_table(
+                use_lookup=use_lookup, parent=parent)
 
         for fragment in fragments[1:]:
             finished_part = self.loc[full_table.index]
@@ -300,7 +537,7 @@ class CartesianGetZmat(CartesianCore):
             else:
                 i, b = fragment.get_shortest_distance(finished_part)[:2]
                 constr_table = fragment._get_frag_constr_table(
-                    start_atom=i, use_lookup=use_lookup)
+                    start_atom=i, use_lookup=use_lookup, parent=parent)
                 if len(full_table) == 1:
                     a, d = 'e_z', 'e_x'
                 elif len(full_table) == 2:
@@ -375,49 +612,79 @@ class CartesianGetZmat(CartesianCore):
             use_lookup = settings['defaults']['use_lookup']
 
         problem_index = self.check_dihedral(construction_table)
-        bond_dict = self._give_val_sorted_bond_dict(use_lookup=use_lookup)
         c_table = construction_table.copy()
-        for i in problem_index:
-            loc_i = c_table.index.get_loc(i)
-            b, a, problem_d = c_table.loc[i, ['b', 'a', 'd']]
-            try:
-                c_table.loc[i, 'd'] = (bond_dict[a] - {b, a, problem_d}
-                                       - set(c_table.index[loc_i:]))[0]
-            except IndexError:
-                visited = set(c_table.index[loc_i:]) | {b, a, problem_d}
-                tmp_bond_dict = OrderedDict([(j, bond_dict[j] - visited)
-                                             for j in bond_dict[problem_d]])
-                found = False
-                while tmp_bond_dict and not found:
-                    new_tmp_bond_dict = OrderedDict()
-                    for new_d in tmp_bond_dict:
-                        if new_d in visited:
-                            continue
-                        angle = self.get_angle_degrees([b, a, new_d])[0]
-                        if 5 < angle < 175:
-                            found = True
-                            c_table.loc[i, 'd'] = new_d
-                        else:
-                            visited.add(new_d)
-                            for j in tmp_bond_dict[new_d]:
-                                new_tmp_bond_dict[j] = bond_dict[j] - visited
-                    tmp_bond_dict = new_tmp_bond_dict
-                if not found:
-                    other_atoms = c_table.index[:loc_i].difference({b, a})
-                    molecule = self.get_distance_to(origin=i, sort=True,
-                                                    other_atoms=other_atoms)
-                    k = 0
-                    while not found and k < len(molecule):
-                        new_d = molecule.index[k]
-                        angle = self.get_angle_degrees([b, a, new_d])[0]
-                        if 5 < angle < 175:
-                            found = True
-                            c_table.loc[i, 'd'] = new_d
-                        k = k + 1
-                    if not found:
-                        message = ('The atom with index {} has no possibility '
-                                   'to get nonlinear reference atoms'.format)
-                        raise UndefinedCoordinateSystem(message(i))
+        if not problem_index:
+            return c_table
+        indptr, indices, sizes, valency, hashes = (
+            self._give_val_sorted_connectivity(use_lookup))
+        positions = self.loc[:, ['x', 'y', 'z']].values.astype('f8')
+        n_atoms, n_problems = len(self), len(problem_index)
+        rows = np.repeat(np.arange(n_atoms), np.diff(indptr))
+        val_sorted = indices[np.lexsort((np.arange(len(indices)),
+                                         -valency[indices], rows))]
+
+        def bonded(problem, atoms):
+            entries, lengths = _gather_rows(indptr, atoms)
+            return np.repeat(problem, lengths), val_sorted[entries]
+
+        # Atoms that are not in the construction table may always be used
+        # as reference, the others only if they are defined before.
+        in_table = self.index.get_indexer(c_table.index)
+        row = np.full(n_atoms, -1, dtype='i8')
+        row[in_table] = np.arange(len(c_table))
+        problem_row = c_table.index.get_indexer(problem_index)
+        i = in_table[problem_row]
+        b, a, d = (self.index.get_indexer(c_table.iloc[problem_row, k])
+                   for k in range(3))
+        new_d = np.full(n_problems, -1, dtype='i8')
+
+        # The bonded atoms of a and of the old d are tried first.
+        # The search continues along the bonds of linear candidates
+        # simultaneously for all problematic atoms.
+        problem, candidate = (np.concatenate(x) for x in zip(
+            _give_first_candidates(indptr, indices, sizes, valency, hashes,
+                                   row, problem_row, len(c_table), b, a, d),
+            bonded(np.arange(n_problems), d)))
+        order = np.argsort(problem, kind='mergesort')
+        problem, candidate = problem[order], candidate[order]
+        visited = np.concatenate([np.arange(n_problems) * n_atoms + x
+                                  for x in (b, a, d)])
+        while len(problem):
+            key = problem * n_atoms + candidate
+            first = np.sort(np.unique(key, return_index=True)[1])
+            problem, candidate, key = (problem[first], candidate[first],
+                                       key[first])
+            new = (~np.isin(key, visited)
+                   & (row[candidate] < problem_row[problem]))
+            problem, candidate = problem[new], candidate[new]
+            visited = np.concatenate([visited, key[new]])
+
+            angles = _give_angles_degrees(positions, b[problem],
+                                          a[problem], candidate)
+            valid = (5 < angles) & (angles < 175)
+            found, first = np.unique(problem[valid], return_index=True)
+            new_d[found] = candidate[valid][first]
+            linear = ~valid & (new_d[problem] == -1)
+            problem, candidate = bonded(problem[linear], candidate[linear])
+
+        # Otherwise the nearest nonlinear atom, that is defined before,
+        # is used.
+        for k in np.nonzero(new_d == -1)[0]:
+            other = in_table[:problem_row[k]]
+            other = other[(other != b[k]) & (other != a[k])]
+            distance = np.linalg.norm(positions[other] - positions[i[k]],
+                                      axis=1)
+            other = other[np.argsort(distance, kind='mergesort')]
+            angles = _give_angles_degrees(
+                positions, np.full_like(other, b[k]),
+                np.full_like(other, a[k]), other)
+            valid = (5 < angles) & (angles < 175)
+            if not valid.any():
+                message = ('The atom with index {} has no possibility '
+                           'to get nonlinear reference atoms'.format)
+                raise UndefinedCoordinateSystem(message(problem_index[k]))
+            new_d[k] = other[np.argmax(valid)]
+        c_table.loc[problem_index, 'd'] = self.index[new_d].values
         return c_table
 
     def _has_valid_abs_ref(self, i, construction_table):
@@ -503,6 +770,32 @@ class CartesianGetZmat(CartesianCore):
                     c_table.iloc[row, row:] = next(order_of_refs)[row:3]
         return c_table
 
+    def _give_positional_c_table(self, construction_table):
+        """Return the construction table with references by position.
+
+        Args:
+            construction_table (pd.DataFrame):
+
+        Returns:
+            tuple: ``(order, c_table)``. ``order`` contains the positions
+            in ``self.index`` of the atoms of the construction table
+            followed by the remaining atoms.
+            ``c_table`` is an integer array of shape
+            ``(3, len(construction_table))``, which references the atoms
+            by their position in ``order``.
+        """
+        c_table = construction_table.replace(constants.int_label).astype('i8')
+        c_table.index = c_table.index.astype('i8')
+        new_index = c_table.index.append(self.index.difference(c_table.index))
+        order = self.index.get_indexer(new_index)
+        references = c_table.values
+        is_abs_ref = references < constants.keys_below_are_abs_refs
+        references = np.where(
+            is_abs_ref, references,
+            new_index.get_indexer(references.ravel()).reshape(
+                references.shape))
+        return order, references.T.copy()
+
     def _calculate_zmat_values(self, construction_table):
         c_table = construction_table
         if not isinstance(c_table, pd.DataFrame):
@@ -515,13 +808,8 @@ class CartesianGetZmat(CartesianCore):
                 c_table = pd.DataFrame(
                     data=c_table[:, 1:], index=c_table[:, 0],
                     columns=['b', 'a', 'd'])
-        c_table = c_table.replace(constants.int_label).astype('i8')
-        c_table.index = c_table.index.astype('i8')
-
-        new_index = c_table.index.append(self.index.difference(c_table.index))
-        X = self.loc[new_index, ['x', 'y', 'z']].values.astype('f8').T
-        c_table = c_table.replace(dict(zip(new_index, range(len(self)))))
-        c_table = c_table.values.T
+        order, c_table = self._give_positional_c_table(c_table)
+        X = self.loc[:, ['x', 'y', 'z']].values.astype('f8')[order].T
 
         err, C = transformation.get_C(X, c_table)
         if err == ERR_CODE_OK:
@@ -622,7 +910,6 @@ class CartesianGetZmat(CartesianCore):
             use_lookup = settings['defaults']['use_lookup']
 
         self.get_bonds(use_lookup=use_lookup)
-        self._give_val_sorted_bond_dict(use_lookup=use_lookup)
         use_lookup = True
         # During function execution the connectivity situation won't change
         # So use_look=True will be used
@@ -634,7 +921,78 @@ class CartesianGetZmat(CartesianCore):
             c_table = construction_table
         return self._build_zmat(c_table)
 
-    def get_grad_zmat(self, construction_table, as_function=True):
+    def get_zmat_plan(self, construction_table=None, use_lookup=None):
+        """Return a plan to transform many structures to internal coordinates.
+
+        If many structures with the same atoms, e.g. the frames of a
+        trajectory, are transformed with the same construction table,
+        the bookkeeping of :meth:`~Cartesian.get_zmat` has to be done
+        only once. Look into :class:`~chemcoord.ZmatPlan` for more
+        information.
+
+        Args:
+            construction_table (pandas.DataFrame): If ``None``,
+                the construction table is created as in
+                :meth:`~Cartesian.get_zmat`.
+            use_lookup (bool): Use a lookup variable for
+                :meth:`~chemcoord.Cartesian.get_bonds`. The default is
+                specified in ``settings['defaults']['use_lookup']``
+
+        Returns:
+            ZmatPlan: A new instance of :class:`~chemcoord.ZmatPlan`.
+        """
+        zmat = self.get_zmat(construction_table, use_lookup=use_lookup)
+        order, c_table = self._give_positional_c_table(
+            zmat.loc[:, ['b', 'a', 'd']])
+        return ZmatPlan(zmat, self.index, order, c_table)
+
+    @staticmethod
+    def _give_sparse_grad_C(blocks, c_table):
+        """Assemble the blocks of ``get_grad_C_blocks`` to a sparse matrix.
+
+        Returns:
+            :class:`scipy.sparse.bsr_matrix`:
+        """
+        n_atoms = len(blocks)
+        columns = np.vstack([np.arange(n_atoms), c_table]).T.astype('i8')
+        is_atom = columns > constants.keys_below_are_abs_refs
+        indptr = np.zeros(n_atoms + 1, dtype='i8')
+        np.cumsum(is_atom.sum(axis=1), out=indptr[1:])
+        data = blocks.transpose(0, 2, 1, 3)[is_atom]
+        grad_C = bsr_matrix((data, columns[is_atom], indptr),
+                            shape=(3 * n_atoms, 3 * n_atoms))
+        grad_C.sort_indices()
+        return grad_C
+
+    def _calculate_grad_C(self, construction_table, X, sparse, n_jobs):
+        """Calculate the gradient of :meth:`get_grad_zmat` without cache."""
+        c_table = construction_table.loc[:, ['b', 'a', 'd']]
+        c_table = c_table.replace(constants.int_label)
+        c_table = c_table.replace({k: v for v, k in enumerate(c_table.index)})
+        c_table = c_table.values.T
+
+        if get_n_jobs(n_jobs) > 1:
+            get_grad_C_blocks = transformation.get_grad_C_blocks_parallel
+            get_grad_C = transformation.get_grad_C_parallel
+        else:
+            get_grad_C_blocks = transformation.get_grad_C_blocks
+            get_grad_C = transformation.get_grad_C
+        with numba_threads(n_jobs):
+            if sparse:
+                err, row, blocks = get_grad_C_blocks(X, c_table)
+            else:
+                err, row, grad_C = get_grad_C(X, c_table)
+        if err == ERR_CODE_InvalidReference:
+            rename = dict(enumerate(self.index))
+            i = rename[row]
+            b, a, d = construction_table.loc[i, ['b', 'a', 'd']]
+            raise InvalidReference(i=i, b=b, a=a, d=d)
+        if sparse:
+            grad_C = self._give_sparse_grad_C(blocks, c_table)
+        return grad_C
+
+    def get_grad_zmat(self, construction_table, as_function=True,
+                      sparse=False, n_jobs=None):
         r"""Return the gradient for the transformation to a Zmatrix.
 
         If ``as_function`` is True, a function is returned that can be directly
@@ -703,11 +1061,45 @@ class CartesianGetZmat(CartesianCore):
             =
             \frac{\partial \mathbf{C}_{i, j}}{\partial \mathbf{X}_{l, k}}
 
+        The internal coordinates of an atom depend only on the position
+        of the atom itself and its three references.
+        Hence most of the tensor is zero and for large molecules
+        ``sparse=True`` should be used. Then a
+        :class:`scipy.sparse.bsr_matrix` of shape ``(3 n, 3 n)``
+        with ``3 x 3`` blocks is returned, where
+
+        .. math::
+
+            \left(
+                \frac{\partial \mathbf{C}}{\partial \mathbf{X}}
+            \right)_{3 j + i, 3 k + l}
+            =
+            \frac{\partial \mathbf{C}_{i, j}}{\partial \mathbf{X}_{l, k}}
+
+        This is the layout for coordinates which are flattened row wise
+        from the ``n * 3`` arrays of a :class:`~Cartesian` or
+        :class:`~chemcoord.Zmat`.
+
+        If ``settings['defaults']['grad_cache_size']`` is positive,
+        the gradients are cached for the positions and the construction
+        table, up to this number of bytes.
+        Repeated calls for the same geometry return the cached gradient,
+        which is read only.
+        Look into :func:`~chemcoord.xyz_functions.get_grad_zmat_cache_info`
+        for the statistics of the cache.
+
         Args:
             construction_table (pandas.DataFrame):
             as_function (bool): Return a tensor or
                 :func:`xyz_functions.apply_grad_zmat_tensor`
                 with partially replaced arguments.
+            sparse (bool): Return a sparse matrix instead of a dense
+                tensor.
+            n_jobs (int): The number of threads used for the calculation.
+                The derivatives of the atoms are independent and
+                calculated in parallel, if more than one thread is used.
+                The default is specified in
+                ``settings['defaults']['n_jobs']``.
 
         Returns:
             (func, np.array): Depending on ``as_function`` return a tensor or
@@ -717,20 +1109,21 @@ class CartesianGetZmat(CartesianCore):
         if (construction_table.index != self.index).any():
             message = "construction_table and self must use the same index"
             raise ValueError(message)
-        c_table = construction_table.loc[:, ['b', 'a', 'd']]
-        c_table = c_table.replace(constants.int_label)
-        c_table = c_table.replace({k: v for v, k in enumerate(c_table.index)})
-        c_table = c_table.values.T
         X = self.loc[:, ['x', 'y', 'z']].values.T
         if X.dtype == np.dtype('i8'):
             X = X.astype('f8')
 
-        err, row, grad_C = transformation.get_grad_C(X, c_table)
-        if err == ERR_CODE_InvalidReference:
-            rename = dict(enumerate(self.index))
-            i = rename[row]
-            b, a, d = construction_table.loc[i, ['b', 'a', 'd']]
-            raise InvalidReference(i=i, b=b, a=a, d=d)
+        cache = xyz_functions._grad_zmat_cache
+        grad_C = None
+        if cache.enabled:
+            key = give_array_key(X, pd.util.hash_pandas_object(
+                construction_table.loc[:, ['b', 'a', 'd']]).values, sparse)
+            grad_C = cache.get(key)
+        if grad_C is None:
+            grad_C = self._calculate_grad_C(construction_table, X, sparse,
+                                            n_jobs)
+            if cache.enabled:
+                cache.set(key, grad_C)
 
         if as_function:
             return partial(xyz_functions.apply_grad_zmat_tensor,
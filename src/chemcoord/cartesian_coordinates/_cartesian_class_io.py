@@ -204,7 +204,8 @@ class CartesianIO(CartesianCore, GenericIO):
         cjson_dict['atoms']['coords']['3d'] = [float(x) for x in coords]
 
         bonds = []
-        bond_dict = self.get_bonds()
+        bond_dict = {i: set(bonded) for i, bonded in
+                     self.get_bonds(use_lookup=True).items()}
         for i in bond_dict:
             for b in bond_dict[i]:
                 bonds += [int(i), int(b)]
@@ -255,13 +256,12 @@ class CartesianIO(CartesianCore, GenericIO):
         try:
             connections = data['bonds']['connections']['index']
         except KeyError:
-            pass
+            connections = None
         else:
             bond_dict = defaultdict(set)
             for i, b in zip(connections[::2], connections[1::2]):
                 bond_dict[i].add(b)
                 bond_dict[b].add(i)
-            _metadata['bond_dict'] = dict(bond_dict)
 
         try:
             metadata.update(data['properties'])
@@ -270,6 +270,9 @@ class CartesianIO(CartesianCore, GenericIO):
 
         out = cls(atoms=elements, coords=coords, _metadata=_metadata,
                   metadata=metadata)
+        if connections is not None:
+            out._set_lookup('bond_dict', {i: bond_dict[i] for i in out.index},
+                            out._give_bond_parameters())
         return out
 
     def view(self, viewer=None, use_curr_dir=False):
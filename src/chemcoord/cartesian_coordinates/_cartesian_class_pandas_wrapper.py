@@ -3,10 +3,13 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals, with_statement)
 
 import copy
+import itertools
 
 import chemcoord.cartesian_coordinates._indexers as indexers
 from chemcoord.exceptions import PhysicalMeaning
 
+_generations = itertools.count()
+
 
 class PandasWrapper(object):
     """This class provides wrappers for :class:`pandas.DataFrame` methods.
@@ -25,7 +28,17 @@ class PandasWrapper(object):
         There are two dictionaris as attributes
         called `metadata` and `_metadata`
         which are passed on when doing slices...
+
+    Generation
+        Every modification in place of the frame assigns a new
+        generation to the instance.
+        Cached values in ``_metadata`` are only valid for the
+        generation they were calculated for.
     """
+    def _new_generation(self):
+        """Mark the frame as modified, which invalidates cached values."""
+        self._generation = next(_generations)
+
     def __len__(self):
         return self.shape[0]
 
@@ -117,6 +130,7 @@ class PandasWrapper(object):
             self._frame[key[0], key[1]] = value
         else:
             self._frame[key] = value
+        self._new_generation()
 
     @property
     def index(self):
@@ -129,6 +143,7 @@ class PandasWrapper(object):
     @index.setter
     def index(self, value):
         self._frame.index = value
+        self._new_generation()
 
     @property
     def columns(self):
@@ -144,6 +159,7 @@ class PandasWrapper(object):
             raise PhysicalMeaning('There are columns missing for a '
                                   'meaningful description of a molecule')
         self._frame.columns = value
+        self._new_generation()
 
     @property
     def shape(self):
@@ -163,6 +179,7 @@ class PandasWrapper(object):
             self._frame.sort_values(
                 by, axis=axis, ascending=ascending,
                 inplace=inplace, kind=kind, na_position=na_position)
+            self._new_generation()
         else:
             new = self.__class__(self._frame.sort_values(
                 by, axis=axis, ascending=ascending, inplace=inplace,
@@ -183,6 +200,7 @@ class PandasWrapper(object):
                 axis=axis, level=level, ascending=ascending, inplace=inplace,
                 kind=kind, na_position=na_position,
                 sort_remaining=sort_remaining, by=by)
+            self._new_generation()
         else:
             new = self.__class__(self._frame.sort_index(
                 axis=axis, level=level, ascending=ascending,
@@ -202,6 +220,7 @@ class PandasWrapper(object):
             self._frame.replace(to_replace=to_replace, value=value,
                                 inplace=inplace, limit=limit, regex=regex,
                                 method=method, axis=axis)
+            self._new_generation()
         else:
             new = self.__class__(self._frame.replace(
                 to_replace=to_replace, value=value, inplace=inplace,
@@ -234,6 +253,7 @@ class PandasWrapper(object):
             self._frame.set_index(keys, drop=drop, append=append,
                                   inplace=inplace,
                                   verify_integrity=verify_integrity)
+            self._new_generation()
         else:
             new = self._frame.set_index(keys, drop=drop, append=append,
                                         inplace=inplace,
@@ -285,6 +305,7 @@ class PandasWrapper(object):
         out = self if inplace else self.copy()
         out._frame.insert(loc, column, value,
                           allow_duplicates=allow_duplicates)
+        out._new_generation()
         if not inplace:
             return out
 
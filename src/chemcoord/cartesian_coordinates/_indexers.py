@@ -23,6 +23,7 @@ class _Loc(_generic_Indexer):
             self.molecule._frame.loc[key[0], key[1]] = value
         else:
             self.molecule._frame.loc[key] = value
+        self.molecule._new_generation()
 
 
 class _ILoc(_generic_Indexer):
@@ -42,3 +43,4 @@ class _ILoc(_generic_Indexer):
             self.molecule._frame.iloc[key[0], key[1]] = value
         else:
             self.molecule._frame.iloc[key] = value
+        self.molecule._new_generation()
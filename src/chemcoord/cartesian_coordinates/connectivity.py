@@ -0,0 +1,507 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, with_statement)
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+import numba as nb
+import numpy as np
+import pandas as pd
+from numba import jit
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+from chemcoord import export
+
+
+def _gather_rows(indptr, rows):
+    """Return the positions in ``indices`` of the given rows.
+
+    Returns:
+        tuple: ``(positions, lengths)`` where ``lengths`` contains the
+        number of entries for each row.
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    offsets = np.zeros(len(rows), dtype='i8')
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    positions = (np.repeat(starts - offsets, lengths)
+                 + np.arange(lengths.sum(), dtype='i8'))
+    return positions, lengths
+
+
+@jit(nopython=True, cache=True)
+def _jit_replace_rows(indptr, indices, rows, row_ptr, row_indices):
+    """Replace the given rows of a CSR structure.
+
+    ``rows`` has to be sorted. The new content of ``rows[k]`` is
+    ``row_indices[row_ptr[k]:row_ptr[k + 1]]``; all other rows are copied.
+    """
+    n_atoms = len(indptr) - 1
+    new_indptr = np.empty(n_atoms + 1, dtype=nb.int64)
+    new_indptr[0] = 0
+    k = 0
+    for i in range(n_atoms):
+        if k < len(rows) and rows[k] == i:
+            length = row_ptr[k + 1] - row_ptr[k]
+            k += 1
+        else:
+            length = indptr[i + 1] - indptr[i]
+        new_indptr[i + 1] = new_indptr[i] + length
+    new_indices = np.empty(new_indptr[n_atoms], dtype=nb.int64)
+    k = 0
+    for i in range(n_atoms):
+        start = new_indptr[i]
+        if k < len(rows) and rows[k] == i:
+            new_indices[start:new_indptr[i + 1]] = \
+                row_indices[row_ptr[k]:row_ptr[k + 1]]
+            k += 1
+        else:
+            new_indices[start:new_indptr[i + 1]] = \
+                indices[indptr[i]:indptr[i + 1]]
+    return new_indptr, new_indices
+
+
+@jit(nopython=True, cache=True)
+def _jit_get_spheres(indptr, indices, sources, n_sphere, only_surface,
+                     excluded):
+    """Breadth first search from each source up to ``n_sphere`` bonds.
+
+    The searches share one array of visit marks, so no memory
+    proportional to the number of atoms is allocated per source.
+    Returns the spheres as ragged array ``(sphere_ptr, spheres)``.
+    """
+    n_atoms = len(indptr) - 1
+    visited_by = np.full(n_atoms, -1, dtype=nb.int64)
+    queue = np.empty(n_atoms, dtype=nb.int64)
+    sphere_ptr = np.zeros(len(sources) + 1, dtype=nb.int64)
+    spheres = np.empty(max(len(sources), 1), dtype=nb.int64)
+    for k in range(len(sources)):
+        queue[0] = sources[k]
+        visited_by[sources[k]] = k
+        head, tail, level_start = 0, 1, 0
+        level = 0
+        while level < n_sphere and head < tail:
+            level_start = tail
+            while head < level_start:
+                i = queue[head]
+                head += 1
+                for j in indices[indptr[i]:indptr[i + 1]]:
+                    if visited_by[j] != k and not excluded[j]:
+                        visited_by[j] = k
+                        queue[tail] = j
+                        tail += 1
+            level += 1
+        if not only_surface:
+            level_start = 0
+        elif level < n_sphere:
+            level_start = tail
+        start = sphere_ptr[k]
+        if start + tail - level_start > len(spheres):
+            new_spheres = np.empty(max(2 * len(spheres),
+                                       start + tail - level_start),
+                                   dtype=nb.int64)
+            new_spheres[:start] = spheres[:start]
+            spheres = new_spheres
+        end = start
+        for q in range(level_start, tail):
+            if not excluded[queue[q]]:
+                spheres[end] = queue[q]
+                end += 1
+        sphere_ptr[k + 1] = end
+    return sphere_ptr, spheres[:sphere_ptr[len(sources)]].copy()
+
+
+# Multipliers of the splitmix64 finaliser
+_MIX_1 = np.uint64(0xbf58476d1ce4e5b9)
+_MIX_2 = np.uint64(0x94d049bb133111eb)
+_NEIGHBOUR_SALT = np.uint64(0x9e3779b97f4a7c15)
+
+
+@jit(nopython=True, cache=True)
+def _mix(x):
+    """Scramble the bits of an unsigned 64 bit integer."""
+    x = (x ^ (x >> np.uint64(30))) * _MIX_1
+    x = (x ^ (x >> np.uint64(27))) * _MIX_2
+    return x ^ (x >> np.uint64(31))
+
+
+@jit(nopython=True, cache=True)
+def _jit_hash_environments(indptr, indices, labels, n_sphere):
+    """Refine the labels of all atoms ``n_sphere`` times.
+
+    In each iteration the new label of an atom is a hash of its own label
+    and the sum of the scrambled labels of its neighbours.
+    The sum does not depend on the order of the neighbours, so equivalent
+    atoms get equal labels.
+    """
+    n_atoms = len(indptr) - 1
+    labels = labels.copy()
+    new_labels = np.empty(n_atoms, dtype=nb.uint64)
+    for _ in range(n_sphere):
+        for i in range(n_atoms):
+            neighbours = np.uint64(0)
+            for j in indices[indptr[i]:indptr[i + 1]]:
+                neighbours += _mix(labels[j] ^ _NEIGHBOUR_SALT)
+            new_labels[i] = _mix(_mix(labels[i]) + neighbours)
+        labels, new_labels = new_labels, labels
+    return labels
+
+
+@export
+class Connectivity(Mapping):
+    """Connectivity of a molecule in compressed sparse row (CSR) format.
+
+    The atoms are addressed by their position ``i`` in ``index``.
+    The positions of the atoms bonded to ``i`` are given by
+    ``indices[indptr[i]:indptr[i + 1]]``.
+    Two integer arrays need much less memory than a dictionary of sets
+    and can be passed directly to vectorised or numba compiled
+    graph algorithms.
+
+    For backwards compatibility a :class:`Connectivity` behaves like a
+    read only bond dictionary, as returned by
+    :meth:`~chemcoord.Cartesian.get_bonds`.
+    It maps the index of an atom to a frozenset with the indices of the
+    bonded atoms.
+
+    Args:
+        index (sequence): The indices of the atoms.
+        indptr (:class:`numpy.ndarray`): Integer array of length
+            ``len(index) + 1``.
+        indices (:class:`numpy.ndarray`): Integer array of the positions
+            of the bonded atoms.
+    """
+    def __init__(self, index, indptr, indices):
+        self.index = index if isinstance(index, pd.Index) else pd.Index(index)
+        self.indptr = np.asarray(indptr, dtype='i8')
+        self.indices = np.asarray(indices, dtype='i8')
+        if len(self.indptr) != len(self.index) + 1:
+            raise ValueError('indptr has to be of length len(index) + 1')
+        self._labels = self.index.values.astype('O')
+        # The input of the bond calculation, which allows
+        # incremental updates with Cartesian.update_connectivity
+        self._snapshot = None
+
+    @classmethod
+    def from_bond_dict(cls, bond_dict, index=None):
+        """Create a :class:`Connectivity` from a bond dictionary.
+
+        Args:
+            bond_dict (dict): Look into
+                :meth:`~chemcoord.Cartesian.get_bonds`,
+                to see examples for a bond_dict.
+            index (sequence): The indices of the atoms.
+                Bonds to atoms that are not in ``index`` are ignored.
+                The default are the keys of ``bond_dict``.
+
+        Returns:
+            Connectivity:
+        """
+        index = pd.Index(list(bond_dict) if index is None else index)
+        indptr = np.zeros(len(index) + 1, dtype='i8')
+        neighbours = []
+        for i, key in enumerate(index):
+            bonded = index.get_indexer(list(bond_dict.get(key, ())))
+            bonded = np.sort(bonded[bonded != -1])
+            neighbours.append(bonded)
+            indptr[i + 1] = indptr[i] + len(bonded)
+        if neighbours:
+            indices = np.concatenate(neighbours).astype('i8')
+        else:
+            indices = np.empty(0, dtype='i8')
+        return cls(index, indptr, indices)
+
+    @classmethod
+    def from_edges(cls, index, a, b):
+        """Create a :class:`Connectivity` from pairs of bonded atoms.
+
+        The bond ``(a[k], b[k])`` is added to the row of ``a[k]``.
+        Duplicate pairs are removed, so the result of overlapping
+        calculations can be simply concatenated.
+
+        Args:
+            index (sequence): The indices of the atoms.
+            a (:class:`numpy.ndarray`): Integer array of positions.
+            b (:class:`numpy.ndarray`): Integer array of positions.
+
+        Returns:
+            Connectivity:
+        """
+        n = len(index)
+        keys = np.unique(np.asarray(a, dtype='i8') * n
+                         + np.asarray(b, dtype='i8'))
+        rows, indices = np.divmod(keys, n) if n else (keys, keys)
+        indptr = np.zeros(n + 1, dtype='i8')
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return cls(index, indptr, indices)
+
+    def __getitem__(self, key):
+        i = self.index.get_loc(key)
+        return frozenset(self._labels[self.get_neighbours(i)])
+
+    def __iter__(self):
+        return iter(self._labels)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __repr__(self):
+        return '{}(n_atoms={}, n_bonds={})'.format(
+            self.__class__.__name__, len(self), self.n_bonds)
+
+    @property
+    def n_bonds(self):
+        """The number of bonds.
+
+        A bond between two atoms is counted once.
+        """
+        n = len(self.indices)
+        loops = np.sum(self.indices == self.get_row_indices())
+        return (n - loops) // 2 + loops
+
+    def get_neighbours(self, i):
+        """Return the positions of the atoms bonded to position ``i``.
+
+        Args:
+            i (int): Position of an atom.
+
+        Returns:
+            :class:`numpy.ndarray`:
+        """
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def get_spheres(self, rows, n_sphere=1, only_surface=True, exclude=None):
+        """Return the coordination spheres of many atoms at once.
+
+        The n-th coordination sphere of an atom contains the atoms,
+        which are ``n`` bonds away.
+        All spheres are found with one compiled breadth first search.
+
+        Args:
+            rows (:class:`numpy.ndarray`): The positions of the centre
+                atoms.
+            n_sphere (int): Determines the number of the coordination
+                sphere. ``float('inf')`` returns all bonded atoms.
+            only_surface (bool): Return only the n-th coordination
+                sphere, otherwise all atoms up to ``n_sphere`` bonds away
+                including the centre.
+            exclude (:class:`numpy.ndarray`): Positions of atoms,
+                which are ignored for the path finding.
+
+        Returns:
+            tuple: A ragged array ``(sphere_ptr, spheres)``.
+            The positions of the atoms in the sphere of ``rows[k]`` are
+            ``spheres[sphere_ptr[k]:sphere_ptr[k + 1]]`` sorted by their
+            distance to the centre.
+        """
+        rows = np.asarray(rows, dtype='i8').reshape(-1)
+        excluded = np.zeros(len(self), dtype=bool)
+        if exclude is not None:
+            excluded[np.asarray(exclude, dtype='i8')] = True
+        n_sphere = min(n_sphere, len(self))
+        return _jit_get_spheres(self.indptr, self.indices, rows,
+                                int(n_sphere), only_surface, excluded)
+
+    def get_environment_hashes(self, labels, n_sphere=4):
+        """Return a hash of the chemical environment of every atom.
+
+        Starting from ``labels`` the label of each atom is combined
+        ``n_sphere`` times with the labels of its neighbours,
+        in the style of the Weisfeiler-Lehman test or Morgan fingerprints.
+        All atoms are refined together, which needs time proportional
+        to ``n_sphere`` times the number of bonds.
+        Atoms with equal hashes have the same elements along all paths of
+        up to ``n_sphere`` bonds, apart from hash collisions.
+
+        Args:
+            labels (:class:`numpy.ndarray`): Integer array of length
+                ``len(self)``, e.g. codes for the elements.
+                Equal labels give equal hashes for equivalent atoms
+                also between different molecules.
+            n_sphere (int): The number of refinements.
+
+        Returns:
+            :class:`numpy.ndarray`: Array of unsigned 64 bit integers.
+        """
+        labels = np.asarray(labels).astype('u8')
+        if len(labels) != len(self):
+            raise ValueError('labels has to be of length len(self)')
+        return _jit_hash_environments(self.indptr, self.indices, labels,
+                                      int(n_sphere))
+
+    def replace_rows(self, rows, row_ptr, row_indices):
+        """Return a copy, where the bonds of some atoms are replaced.
+
+        All other rows are copied without looking at their bonds,
+        so the cost is dominated by a single memory copy.
+        The caller is responsible to keep the bonds symmetric.
+
+        Args:
+            rows (:class:`numpy.ndarray`): Sorted positions of the atoms,
+                whose bonds are replaced.
+            row_ptr (:class:`numpy.ndarray`): Integer array of length
+                ``len(rows) + 1``.
+            row_indices (:class:`numpy.ndarray`): The new bonds of
+                ``rows[k]`` are ``row_indices[row_ptr[k]:row_ptr[k + 1]]``.
+
+        Returns:
+            Connectivity:
+        """
+        indptr, indices = _jit_replace_rows(
+            self.indptr, self.indices, np.asarray(rows, dtype='i8'),
+            np.asarray(row_ptr, dtype='i8'),
+            np.asarray(row_indices, dtype='i8'))
+        return self.__class__(self.index, indptr, indices)
+
+    def get_row_indices(self):
+        """Return for each entry of ``indices`` the position of its atom.
+
+        Returns:
+            :class:`numpy.ndarray`:
+        """
+        return np.repeat(np.arange(len(self), dtype='i8'),
+                         np.diff(self.indptr))
+
+    def get_adjacency_matrix(self):
+        """Return the adjacency matrix.
+
+        Returns:
+            :class:`scipy.sparse.csr_matrix`: A boolean matrix of shape
+            ``(len(self), len(self))``.
+        """
+        return csr_matrix(
+            (np.ones(len(self.indices), dtype=bool), self.indices,
+             self.indptr),
+            shape=(len(self), len(self)))
+
+    def get_fragment_labels(self):
+        """Label every atom with the fragment it belongs to.
+
+        The fragments are the connected components of the bond graph.
+        They are found in one pass over the bonds and numbered in the
+        order of their first atom.
+
+        Returns:
+            :class:`numpy.ndarray`: Integer array of length ``len(self)``.
+        """
+        if not len(self):
+            return np.empty(0, dtype='i8')
+        labels = connected_components(self.get_adjacency_matrix(),
+                                      directed=False)[1]
+        first_atoms = np.unique(labels, return_index=True)[1]
+        renumber = np.empty(len(first_atoms), dtype='i8')
+        renumber[np.argsort(first_atoms)] = np.arange(len(first_atoms))
+        return renumber[labels]
+
+    def get_bond_preserving_mask(self, mask):
+        """Extend a selection of atoms, such that no bonds are cut.
+
+        All atoms, which are bonded directly or indirectly to the
+        selection, are added.
+        The paths are not followed through the selection, so atoms
+        that are connected only via the selected atoms are added too,
+        but nothing else.
+        The fragments outside of the selection are labelled in one pass
+        over the bonds.
+
+        Args:
+            mask (:class:`numpy.ndarray`): Boolean array of length
+                ``len(self)`` for the selected atoms.
+
+        Returns:
+            :class:`numpy.ndarray`: Boolean array of length ``len(self)``.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        rows = self.get_row_indices()
+        outside = ~mask[rows] & ~mask[self.indices]
+        adjacency = csr_matrix(
+            (np.ones(outside.sum(), dtype=bool),
+             (rows[outside], self.indices[outside])),
+            shape=(len(self), len(self)))
+        labels = connected_components(adjacency, directed=False)[1]
+        boundary = self.indices[mask[rows] & ~mask[self.indices]]
+        return mask | np.isin(labels, labels[boundary])
+
+    def split(self, labels):
+        """Split the connectivity into groups of atoms.
+
+        Bonds between atoms of different groups are removed.
+        All groups are built in one pass over the bonds.
+
+        Args:
+            labels (:class:`numpy.ndarray`): Integer array, which assigns
+                each atom to a group, e.g. from
+                :meth:`get_fragment_labels`.
+
+        Returns:
+            list: A :class:`Connectivity` for each group, in the order of
+            the labels. The atoms keep their order within a group.
+        """
+        labels = np.asarray(labels, dtype='i8')
+        order = np.argsort(labels, kind='mergesort')
+        sizes = np.bincount(labels, minlength=labels.max() + 1
+                            if len(labels) else 0)
+        starts = np.zeros(len(sizes) + 1, dtype='i8')
+        np.cumsum(sizes, out=starts[1:])
+        new_position = np.empty(len(self), dtype='i8')
+        new_position[order] = (np.arange(len(self), dtype='i8')
+                               - starts[labels[order]])
+
+        positions, lengths = _gather_rows(self.indptr, order)
+        indices = self.indices[positions]
+        keep = labels[indices] == np.repeat(labels[order], lengths)
+        row_of_entry = np.repeat(np.arange(len(self), dtype='i8'), lengths)
+        indptr = np.zeros(len(self) + 1, dtype='i8')
+        np.cumsum(np.bincount(row_of_entry[keep], minlength=len(self)),
+                  out=indptr[1:])
+        indices = new_position[indices[keep]]
+        index = self.index[order]
+        return [self.__class__(index[start:end],
+                               indptr[start:end + 1] - indptr[start],
+                               indices[indptr[start]:indptr[end]])
+                for start, end in zip(starts[:-1], starts[1:])]
+
+    def to_bond_dict(self):
+        """Return a bond dictionary.
+
+        Returns:
+            dict: Dictionary mapping from an atom index to the set of
+            indices of atoms bonded to.
+            This is the format returned by
+            :meth:`~chemcoord.Cartesian.get_bonds`.
+        """
+        bonded = self._labels[self.indices]
+        return {key: set(bonded[self.indptr[i]:self.indptr[i + 1]])
+                for i, key in enumerate(self._labels)}
+
+    def subgraph(self, index):
+        """Restrict the connectivity to a subset of atoms.
+
+        Args:
+            index (sequence): The indices of the atoms to keep.
+
+        Returns:
+            Connectivity: Bonds to atoms that are not in ``index``
+            are removed.
+        """
+        index = pd.Index(index)
+        rows = self.index.get_indexer(index)
+        if (rows == -1).any():
+            raise KeyError('index contains atoms that are not in self.index')
+        new_position = np.full(len(self), -1, dtype='i8')
+        new_position[rows] = np.arange(len(rows))
+        positions, lengths = _gather_rows(self.indptr, rows)
+        indices = new_position[self.indices[positions]]
+        keep = indices != -1
+        row_of_entry = np.repeat(np.arange(len(rows), dtype='i8'), lengths)
+        indptr = np.zeros(len(rows) + 1, dtype='i8')
+        np.cumsum(np.bincount(row_of_entry[keep], minlength=len(rows)),
+                  out=indptr[1:])
+        return self.__class__(index, indptr, indices[keep])
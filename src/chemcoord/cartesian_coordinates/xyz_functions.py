@@ -15,7 +15,15 @@ import numpy as np
 import pandas as pd
 import sympy
 from chemcoord.configuration import settings
+from chemcoord.exceptions import (ERR_CODE_InvalidReference, InvalidReference,
+                                  UndefinedCoordinateSystem)
+from chemcoord.utilities._cache import ArrayCache
 from numba import jit
+from scipy.sparse import (coo_matrix, csc_matrix, csr_matrix, diags, hstack,
+                          issparse)
+from scipy.sparse.linalg import splu
+
+_grad_zmat_cache = ArrayCache('grad_cache_size')
 
 
 def view(molecule, viewer=settings['defaults']['viewer'], use_curr_dir=False):
@@ -277,6 +285,42 @@ def concat(cartesians, ignore_index=False, keys=None):
     return cartesians[0].__class__(new)
 
 
+def get_zmat_trajectory(molecule, positions, construction_table,
+                        n_jobs=None, engine='numba'):
+    """Transform a trajectory to internal coordinates.
+
+    All frames are transformed with the same construction table
+    in one compiled call, which runs in parallel over the frames.
+    Compare with :meth:`~chemcoord.Cartesian.get_zmat` and
+    :meth:`~chemcoord.Cartesian.get_zmat_plan`.
+
+    Args:
+        molecule (Cartesian): A structure with the atoms of the
+            trajectory.
+        positions (:class:`numpy.ndarray`): The coordinates as array of
+            shape ``(n_frames, n_atoms, 3)``. The atoms are in the order
+            of ``molecule.index``.
+        construction_table (pandas.DataFrame): Explained in
+            :meth:`~chemcoord.Cartesian.get_construction_table()`.
+        n_jobs (int): The number of threads. The default is specified in
+            ``settings['defaults']['n_jobs']``.
+        engine (str): Either ``'numba'`` or ``'numpy'``.
+            Explained in :meth:`~chemcoord.ZmatPlan.get_zmat_values`.
+
+    Returns:
+        :class:`numpy.ndarray`: An array of shape
+        ``(n_frames, n_atoms, 3)``. The columns contain bond lengths,
+        angles and dihedrals in degrees and the rows follow the
+        order of ``construction_table``.
+    """
+    positions = np.asarray(positions, dtype='f8')
+    if positions.ndim != 3:
+        raise ValueError('positions has to be of shape '
+                         '(n_frames, n_atoms, 3)')
+    plan = molecule.get_zmat_plan(construction_table)
+    return plan.get_zmat_values(positions, n_jobs=n_jobs, engine=engine)
+
+
 def dot(A, B):
     """Matrix multiplication between A and B
 
@@ -442,11 +486,34 @@ def get_kabsch_rotation(Q, P):
     return np.linalg.multi_dot((W, np.diag([1., 1., d]), V.T))
 
 
+def get_grad_zmat_cache_info():
+    """Return the statistics of the cache of gradients.
+
+    The cache is used by :meth:`~chemcoord.Cartesian.get_grad_zmat`,
+    if ``settings['defaults']['grad_cache_size']`` is positive.
+
+    Returns:
+        namedtuple: With the fields ``hits``, ``misses``, ``n_entries``,
+        ``currsize`` and ``maxsize``. The sizes are in bytes.
+    """
+    return _grad_zmat_cache.info()
+
+
+def clear_grad_zmat_cache():
+    """Remove all cached gradients and reset the statistics.
+
+    Returns:
+        None:
+    """
+    _grad_zmat_cache.clear()
+
+
 def apply_grad_zmat_tensor(grad_C, construction_table, cart_dist):
     """Apply the gradient for transformation to Zmatrix space onto cart_dist.
 
     Args:
-        grad_C (:class:`numpy.ndarray`): A ``(3, n, n, 3)`` array.
+        grad_C (:class:`numpy.ndarray`): A ``(3, n, n, 3)`` array
+            or a sparse ``(3 n, 3 n)`` matrix.
             The mathematical details of the index layout is explained in
             :meth:`~chemcoord.Cartesian.get_grad_zmat()`.
         construction_table (pandas.DataFrame): Explained in
@@ -460,8 +527,12 @@ def apply_grad_zmat_tensor(grad_C, construction_table, cart_dist):
     if (construction_table.index != cart_dist.index).any():
         message = "construction_table and cart_dist must use the same index"
         raise ValueError(message)
-    X_dist = cart_dist.loc[:, ['x', 'y', 'z']].values.T
-    C_dist = np.tensordot(grad_C, X_dist, axes=([3, 2], [0, 1])).T
+    if issparse(grad_C):
+        X_dist = cart_dist.loc[:, ['x', 'y', 'z']].values
+        C_dist = grad_C.dot(X_dist.ravel()).reshape(X_dist.shape)
+    else:
+        X_dist = cart_dist.loc[:, ['x', 'y', 'z']].values.T
+        C_dist = np.tensordot(grad_C, X_dist, axes=([3, 2], [0, 1])).T
     if C_dist.dtype == np.dtype('i8'):
         C_dist = C_dist.astype('f8')
     try:
@@ -469,6 +540,15 @@ def apply_grad_zmat_tensor(grad_C, construction_table, cart_dist):
     except AttributeError:
         C_dist[:, [1, 2]] = sympy.deg(C_dist[:, [1, 2]])
 
+    return _give_zmat_dist(construction_table, cart_dist, C_dist)
+
+
+def _give_zmat_dist(construction_table, cart_dist, C_dist):
+    """Create a Zmatrix of distortions.
+
+    ``construction_table``, ``cart_dist`` and the rows of ``C_dist``
+    have to be in the same order.
+    """
     from chemcoord.internal_coordinates.zmat_class_main import Zmat
     cols = ['atom', 'b', 'bond', 'a', 'angle', 'd', 'dihedral']
     dtypes = ['O', 'i8', 'f8', 'i8', 'f8', 'i8', 'f8']
@@ -479,3 +559,295 @@ def apply_grad_zmat_tensor(grad_C, construction_table, cart_dist):
     new.loc[:, 'atom'] = cart_dist.loc[:, 'atom']
     new.loc[:, ['bond', 'angle', 'dihedral']] = C_dist
     return Zmat(new, _metadata={'last_valid_cartesian': cart_dist})
+
+
+def _give_grad_zmat_arguments(molecule, construction_table):
+    """Return the arguments for the gradient kernels of the
+    transformation to Zmatrix space.
+
+    Returns:
+        tuple: ``(X, c_table, order)``. Compare with
+        :meth:`~chemcoord.Cartesian._give_positional_c_table`.
+    """
+    order, c_table = molecule._give_positional_c_table(construction_table)
+    X = molecule.loc[:, ['x', 'y', 'z']].values.astype('f8')[order].T
+    return np.ascontiguousarray(X), c_table, order
+
+
+def _raise_invalid_reference(construction_table, row):
+    i = construction_table.index[row]
+    b, a, d = construction_table.loc[i, ['b', 'a', 'd']]
+    raise InvalidReference(i=i, b=b, a=a, d=d)
+
+
+def apply_grad_zmat(molecule, construction_table, cart_dist):
+    """Apply the gradient for transformation to Zmatrix space onto cart_dist.
+
+    The result is the same as applying
+    :meth:`~chemcoord.Cartesian.get_grad_zmat`,
+    but the gradient is never built.
+    The derivatives for each atom are calculated and applied one after
+    the other, which needs time and memory proportional to the number
+    of atoms.
+
+    Args:
+        molecule (:class:`~chemcoord.Cartesian`): The structure for
+            which the gradient is evaluated.
+        construction_table (pandas.DataFrame): Explained in
+            :meth:`~chemcoord.Cartesian.get_construction_table()`.
+        cart_dist (:class:`~chemcoord.Cartesian`):
+            Distortions in cartesian space.
+
+    Returns:
+        :class:`Zmat`: Distortions in Zmatrix space.
+    """
+    import chemcoord.cartesian_coordinates._cart_transformation as \
+        transformation
+    X, c_table, order = _give_grad_zmat_arguments(molecule,
+                                                  construction_table)
+    X_dist = cart_dist.loc[molecule.index[order], ['x', 'y', 'z']]
+    X_dist = np.ascontiguousarray(X_dist.values.astype('f8').T)
+    err, row, C_dist = transformation.apply_grad_C(X, c_table, X_dist)
+    if err == ERR_CODE_InvalidReference:
+        _raise_invalid_reference(construction_table, row)
+    C_dist[[1, 2], :] = np.rad2deg(C_dist[[1, 2], :])
+    return _give_zmat_dist(construction_table,
+                           cart_dist.loc[construction_table.index], C_dist.T)
+
+
+def apply_grad_zmat_transpose(molecule, construction_table, zmat_grad):
+    """Transform a gradient in Zmatrix space to cartesian space.
+
+    If ``zmat_grad`` contains the derivatives of a function for the
+    bond lengths, angles and dihedrals, the result contains its
+    derivatives for the cartesian coordinates of ``molecule``.
+    Since angles are given in degrees, the derivatives in ``zmat_grad``
+    are expected per degree.
+
+    The transposed gradient of :meth:`~chemcoord.Cartesian.get_grad_zmat`
+    is applied without building it, which needs time and memory
+    proportional to the number of atoms.
+
+    Args:
+        molecule (:class:`~chemcoord.Cartesian`): The structure for
+            which the gradient is evaluated.
+        construction_table (pandas.DataFrame): Explained in
+            :meth:`~chemcoord.Cartesian.get_construction_table()`.
+        zmat_grad (:class:`~chemcoord.Zmat`): Derivatives for the
+            internal coordinates.
+
+    Returns:
+        :class:`~chemcoord.Cartesian`: Derivatives for the cartesian
+        coordinates.
+    """
+    import chemcoord.cartesian_coordinates._cart_transformation as \
+        transformation
+    X, c_table, order = _give_grad_zmat_arguments(molecule,
+                                                  construction_table)
+    C_grad = zmat_grad.loc[construction_table.index,
+                           ['bond', 'angle', 'dihedral']]
+    C_grad = np.ascontiguousarray(C_grad.values.astype('f8').T)
+    C_grad[[1, 2], :] = np.degrees(C_grad[[1, 2], :])
+    err, row, X_grad = transformation.apply_grad_C_transpose(X, c_table,
+                                                             C_grad)
+    if err == ERR_CODE_InvalidReference:
+        _raise_invalid_reference(construction_table, row)
+    coords = np.empty((len(molecule), 3))
+    coords[order] = X_grad.T
+    return molecule.__class__(atoms=molecule.loc[:, 'atom'], coords=coords,
+                              index=molecule.index)
+
+
+def _give_flat_order(order):
+    """Return the positions of the row wise flattened coordinates
+    of the atoms at ``order``.
+    """
+    return (3 * np.asarray(order)[:, None] + np.arange(3)).ravel()
+
+
+def _give_grad_hess_C(molecule, construction_table, X, c_table):
+    """Return the gradient of the transformation to Zmatrix space as
+    ``(3 n, 3 n)`` sparse matrix and the second derivatives as blocks
+    explained in ``get_hess_C_blocks``.
+
+    The atoms are in the order of ``construction_table``
+    and angles in radians.
+    """
+    import chemcoord.cartesian_coordinates._cart_transformation as \
+        transformation
+    if len(construction_table) != len(molecule):
+        raise ValueError('construction_table has to contain all atoms '
+                         'of molecule')
+    err, row, grad_blocks = transformation.get_grad_C_blocks(X, c_table)
+    if err == ERR_CODE_InvalidReference:
+        _raise_invalid_reference(construction_table, row)
+    hess_blocks = transformation.get_hess_C_blocks(X, c_table)[2]
+    grad_C = molecule._give_sparse_grad_C(grad_blocks, c_table)
+    return grad_C, hess_blocks
+
+
+def _solve_sparse(lu, B, block_size=256):
+    """Solve with the factorization ``lu`` for the sparse matrix ``B``.
+
+    The columns of ``B`` are solved in dense blocks of ``block_size``,
+    which bounds the memory and reuses the factorization
+    instead of factorizing again as :func:`scipy.sparse.linalg.spsolve`.
+
+    Returns:
+        :class:`scipy.sparse.csc_matrix`
+    """
+    B = csc_matrix(B)
+    return hstack([csc_matrix(lu.solve(B[:, i:i + block_size].toarray()))
+                   for i in range(0, B.shape[1], block_size)], format='csc')
+
+
+def _contract_hess_C(hess_blocks, c_table, C_grad):
+    """Contract the second derivatives of the internal coordinates
+    with ``C_grad``.
+
+    Args:
+        hess_blocks (:class:`numpy.ndarray`): The second derivatives
+            from ``get_hess_C_blocks``.
+        c_table (:class:`numpy.ndarray`): The positional construction table.
+        C_grad (:class:`numpy.ndarray`): The weights of shape ``(3, n)``.
+
+    Returns:
+        :class:`scipy.sparse.csr_matrix`: A ``(3 n, 3 n)`` matrix
+        in the order of ``c_table``.
+    """
+    import chemcoord.constants as constants
+    n_atoms = len(hess_blocks)
+    weighted = np.einsum('ij,jiklmn->jklmn', C_grad, hess_blocks)
+    atoms = np.vstack([np.arange(n_atoms), c_table]).T
+    is_atom = atoms > constants.keys_below_are_abs_refs
+    rows = (3 * atoms[:, :, None] + np.arange(3)).reshape(n_atoms, 12)
+    is_atom = np.repeat(is_atom, 3, axis=1)
+    weighted = weighted.reshape(n_atoms, 12, 12)
+    keep = is_atom[:, :, None] & is_atom[:, None, :]
+    row_index = np.broadcast_to(rows[:, :, None], keep.shape)[keep]
+    col_index = np.broadcast_to(rows[:, None, :], keep.shape)[keep]
+    return coo_matrix((weighted[keep], (row_index, col_index)),
+                      shape=(3 * n_atoms, 3 * n_atoms)).tocsr()
+
+
+def apply_hess_zmat(molecule, construction_table, zmat_grad):
+    r"""Contract the second derivatives of the transformation to
+    Zmatrix space with ``zmat_grad``.
+
+    If :math:`q_k` are the internal coordinates and
+    :math:`g_k` the values of ``zmat_grad``, the result is
+
+    .. math::
+
+        \sum_k g_k \frac{\partial^2 q_k}{\partial x_i \partial x_j}
+
+    This is the term which distinguishes the transformation of Hessians
+    from the transformation of gradients
+    (compare with :func:`~chemcoord.xyz_functions.transform_hess_to_zmat`).
+    Since the internal coordinates of an atom depend only on the
+    atom itself and its three references, each of them contributes
+    at most 16 blocks of ``3 x 3`` and the result is sparse.
+    Since angles are given in degrees, the values in ``zmat_grad``
+    are expected per degree.
+
+    Args:
+        molecule (:class:`~chemcoord.Cartesian`): The structure for
+            which the derivatives are evaluated.
+        construction_table (pandas.DataFrame): Explained in
+            :meth:`~chemcoord.Cartesian.get_construction_table()`.
+            It has to contain all atoms of ``molecule``.
+        zmat_grad (:class:`~chemcoord.Zmat`): Derivatives for the
+            internal coordinates.
+
+    Returns:
+        :class:`scipy.sparse.bsr_matrix`: A ``(3 n, 3 n)`` matrix
+        for the cartesian coordinates flattened row wise in the order of
+        ``molecule.index``.
+    """
+    X, c_table, order = _give_grad_zmat_arguments(molecule,
+                                                  construction_table)
+    hess_blocks = _give_grad_hess_C(molecule, construction_table,
+                                    X, c_table)[1]
+    C_grad = zmat_grad.loc[construction_table.index,
+                           ['bond', 'angle', 'dihedral']]
+    C_grad = C_grad.values.astype('f8').T
+    C_grad[[1, 2], :] = np.degrees(C_grad[[1, 2], :])
+    hess = _contract_hess_C(hess_blocks, c_table, C_grad)
+    inverse = np.argsort(_give_flat_order(order))
+    return hess[inverse][:, inverse].tobsr(blocksize=(3, 3))
+
+
+def transform_hess_to_zmat(molecule, construction_table, cart_hess,
+                           cart_grad=None):
+    r"""Transform a Hessian in cartesian space to Zmatrix space.
+
+    With the gradient :math:`B` of the transformation to Zmatrix space
+    (see :meth:`~chemcoord.Cartesian.get_grad_zmat`) and the
+    contraction :math:`K(g)` of
+    :func:`~chemcoord.xyz_functions.apply_hess_zmat`
+    the Hessian for the internal coordinates is
+
+    .. math::
+
+        H_q = B^{-T} \left(H_x - K(g_q)\right) B^{-1}
+        \qquad g_q = B^{-T} g_x
+
+    The second derivatives are calculated analytically, and
+    :math:`B` is only factorised as a sparse matrix, but never inverted.
+    Since angles are given in degrees, the result is per degree.
+
+    Args:
+        molecule (:class:`~chemcoord.Cartesian`): The structure for
+            which the Hessian is given.
+        construction_table (pandas.DataFrame): Explained in
+            :meth:`~chemcoord.Cartesian.get_construction_table()`.
+            It has to contain all atoms of ``molecule``, which may not
+            be in a degenerate position relative to the absolute
+            references, e.g. the first atom at the origin.
+        cart_hess (:class:`numpy.ndarray`): The ``(3 n, 3 n)`` Hessian
+            for the cartesian coordinates flattened row wise
+            in the order of ``molecule.index``.
+            Sparse matrices are accepted as well and give a sparse result.
+        cart_grad (:class:`~chemcoord.Cartesian`): The derivatives for
+            the cartesian coordinates. The default ``None`` is only
+            correct at stationary points.
+
+    Returns:
+        :class:`numpy.ndarray` or :class:`scipy.sparse.csr_matrix`:
+        The ``(3 n, 3 n)`` Hessian for the bond
+        lengths, angles and dihedrals flattened row wise in the order of
+        ``construction_table.index``.
+        It is sparse, if ``cart_hess`` is sparse.
+        Since every atom depends on all atoms of its construction
+        chain, it is usually less sparse than ``cart_hess``.
+    """
+    X, c_table, order = _give_grad_zmat_arguments(molecule,
+                                                  construction_table)
+    grad_C, hess_blocks = _give_grad_hess_C(molecule, construction_table,
+                                            X, c_table)
+    flat_order = _give_flat_order(order)
+    sparse = issparse(cart_hess)
+    if sparse:
+        hess = csr_matrix(cart_hess, dtype='f8')[flat_order][:, flat_order]
+    else:
+        hess = np.asarray(cart_hess, dtype='f8')[np.ix_(flat_order,
+                                                        flat_order)]
+    try:
+        transposed = splu(grad_C.T.tocsc())
+    except RuntimeError:
+        raise UndefinedCoordinateSystem(
+            'The gradient of the transformation is singular. '
+            'This happens, if the first atoms are in a degenerate position '
+            'relative to the absolute references, e.g. at the origin.')
+    if cart_grad is not None:
+        X_grad = cart_grad.loc[molecule.index[order], ['x', 'y', 'z']]
+        C_grad = transposed.solve(X_grad.values.astype('f8').ravel())
+        contraction = _contract_hess_C(hess_blocks, c_table,
+                                       C_grad.reshape(-1, 3).T)
+        hess = hess - (contraction if sparse else contraction.toarray())
+    scale = np.tile([1., np.radians(1.), np.radians(1.)], len(molecule))
+    if sparse:
+        hess = _solve_sparse(transposed, _solve_sparse(transposed, hess).T).T
+        return csr_matrix(diags(scale).dot(hess).dot(diags(scale)))
+    hess = transposed.solve(transposed.solve(hess).T).T
+    return hess * scale[:, None] * scale[None, :]
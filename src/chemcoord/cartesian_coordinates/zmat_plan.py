@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, with_statement)
+
+import numpy as np
+
+import chemcoord.cartesian_coordinates._cart_transformation as transformation
+from chemcoord import export
+from chemcoord.exceptions import ERR_CODE_OK, InvalidReference
+from chemcoord.utilities._parallel import numba_threads
+
+
+@export
+class ZmatPlan(object):
+    """Conversion of many structures with a fixed construction table.
+
+    Converting e.g. the frames of a trajectory with
+    :meth:`~chemcoord.Cartesian.get_zmat` repeats the same translation of
+    the construction table and allocation of DataFrames for every frame.
+    A :class:`ZmatPlan` does this work once and afterwards maps
+    raw coordinate arrays directly to bond lengths, angles and dihedrals.
+
+    Use :meth:`~chemcoord.Cartesian.get_zmat_plan` to create an instance.
+
+    Args:
+        zmat (Zmat): The Zmatrix of the reference structure.
+        index (pd.Index): The index of the reference structure.
+            Coordinate arrays are expected in this order of atoms.
+        order (:class:`numpy.ndarray`): The positions in ``index`` of the
+            atoms of the construction table followed by the remaining
+            atoms.
+        c_table (:class:`numpy.ndarray`): Integer array of shape
+            ``(3, len(zmat))``, which references the atoms by their
+            position in ``order``.
+    """
+    def __init__(self, zmat, index, order, c_table):
+        self.zmat = zmat
+        self.index = index
+        self._order = order
+        self._c_table = c_table
+
+    def __repr__(self):
+        return '{}(n_atoms={})'.format(self.__class__.__name__,
+                                       len(self.index))
+
+    @property
+    def construction_table(self):
+        """The construction table of the plan."""
+        return self.zmat.loc[:, ['b', 'a', 'd']]
+
+    def _give_positions(self, cartesian):
+        from chemcoord.cartesian_coordinates.cartesian_class_main import \
+            Cartesian
+        if isinstance(cartesian, Cartesian):
+            return cartesian.loc[self.index, ['x', 'y', 'z']].values
+        positions = np.asarray(cartesian, dtype='f8')
+        if positions.shape[-2:] != (len(self.index), 3):
+            raise ValueError('The coordinates have to be of shape '
+                             '(n_frames, n_atoms, 3) or (n_atoms, 3)')
+        return positions
+
+    def get_zmat_values(self, positions, n_jobs=None, engine='numba'):
+        """Return bond lengths, angles and dihedrals.
+
+        Args:
+            positions (Cartesian or :class:`numpy.ndarray`): A Cartesian
+                or the coordinates as array of shape ``(n_atoms, 3)``.
+                Several structures can be passed as array of shape
+                ``(n_frames, n_atoms, 3)``.
+                The atoms of an array have to be in the order of
+                :attr:`index`.
+            n_jobs (int): The number of threads to use for several
+                structures. The default is specified in
+                ``settings['defaults']['n_jobs']``.
+            engine (str): Either ``'numba'`` or ``'numpy'``.
+                The ``'numba'`` engine transforms the structures in
+                compiled loops, the ``'numpy'`` engine transforms
+                all atoms of all structures at once with array
+                operations, which is faster for many small structures.
+
+        Returns:
+            :class:`numpy.ndarray`: An array of shape ``(n_atoms, 3)``
+            or ``(n_frames, n_atoms, 3)``. The columns contain bond
+            lengths, angles and dihedrals in degrees and the rows follow
+            the order of the construction table.
+        """
+        positions = self._give_positions(positions)
+        X = np.ascontiguousarray(
+            np.swapaxes(positions[..., self._order, :], -1, -2))
+        if engine == 'numpy':
+            err, C = transformation.get_C_batched(X, self._c_table)
+            err = np.atleast_1d(err)
+        elif engine != 'numba':
+            raise ValueError("engine has to be one of 'numba' or 'numpy'")
+        elif X.ndim == 2:
+            err, C = transformation.get_C(X, self._c_table)
+            err = np.array([err])
+        else:
+            with numba_threads(n_jobs):
+                err, C = transformation.get_C_trajectory(X, self._c_table)
+        if X.ndim == 2:
+            if err[0] != ERR_CODE_OK:
+                raise InvalidReference('The construction table uses an '
+                                       'invalid reference')
+            C[[1, 2], :] = np.rad2deg(C[[1, 2], :])
+            return C.T
+        invalid_frames = np.nonzero(err != ERR_CODE_OK)[0]
+        if len(invalid_frames):
+            raise InvalidReference(
+                'The construction table uses an invalid reference in the '
+                'frames {}'.format(list(invalid_frames)))
+        C[:, [1, 2], :] = np.rad2deg(C[:, [1, 2], :])
+        return np.swapaxes(C, 1, 2)
+
+    def get_zmat(self, cartesian):
+        """Transform a structure to internal coordinates.
+
+        This is equivalent to :meth:`~chemcoord.Cartesian.get_zmat`
+        with the construction table of the plan.
+
+        Args:
+            cartesian (Cartesian or :class:`numpy.ndarray`): A Cartesian
+                or the coordinates as array of shape ``(n_atoms, 3)``.
+
+        Returns:
+            Zmat: A new instance of :class:`~chemcoord.Zmat`.
+        """
+        from chemcoord.cartesian_coordinates.cartesian_class_main import \
+            Cartesian
+        if not isinstance(cartesian, Cartesian):
+            positions = self._give_positions(cartesian)
+            cartesian = self.zmat._metadata['last_valid_cartesian'].copy()
+            cartesian.loc[self.index, ['x', 'y', 'z']] = positions
+        zmat = self.zmat.copy()
+        zmat.unsafe_loc[:, ['bond', 'angle', 'dihedral']] = \
+            self.get_zmat_values(cartesian)
+        zmat._metadata['last_valid_cartesian'] = cartesian.copy()
+        return zmat
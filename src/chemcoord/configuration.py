@@ -17,11 +17,15 @@ def _give_default_file_path():
 def provide_default_settings():
     settings = {}
     # The Cartesian().get_bonds() method will use or not use a lookup.
-    # Greatly increases performance if True, but could introduce bugs
-    # if the Cartesian().xyz_frame is changed manually.
+    # Greatly increases performance if True. The lookup is invalidated
+    # automatically, if the Cartesian is changed in place.
     settings['defaults'] = {}
-    settings['defaults']['use_lookup'] = False
+    settings['defaults']['use_lookup'] = True
     settings['defaults']['atomic_radius_data'] = 'atomic_radius_cc'
+    settings['defaults']['bond_engine'] = 'cell_list'
+    settings['defaults']['n_jobs'] = 1
+    # Memory bound in bytes for cached gradients, zero disables the cache.
+    settings['defaults']['grad_cache_size'] = 0
     settings['defaults']['viewer'] = 'gv.exe'
     # settings['viewer'] = 'avogadro'
     # settings['viewer'] = 'molden'
@@ -80,7 +84,7 @@ def read_configuration_file(filepath=_give_default_file_path()):
         def getstring(section, key, config):
             return config[section][key]
 
-        def getinteger(section, key, config):  # pylint:disable=unused-variable
+        def getinteger(section, key, config):
             return config[section].getint(key)
 
         def getboolean(section, key, config):
@@ -91,6 +95,8 @@ def read_configuration_file(filepath=_give_default_file_path()):
         special_actions = {}  # Something different than a string is expected
         special_actions['defaults'] = {}
         special_actions['defaults']['use_lookup'] = getboolean
+        special_actions['defaults']['n_jobs'] = getinteger
+        special_actions['defaults']['grad_cache_size'] = getinteger
         try:
             return special_actions[section][key](section, key, config)
         except KeyError:
@@ -11,12 +11,16 @@ import chemcoord.internal_coordinates._indexers as indexers
 import chemcoord.internal_coordinates._zmat_transformation as transformation
 import numpy as np
 import pandas as pd
+from scipy.sparse import bsr_matrix
 from chemcoord._generic_classes.generic_core import GenericCore
 from chemcoord.exceptions import (ERR_CODE_OK, ERR_CODE_InvalidReference,
+                                  IllegalArgumentCombination,
                                   InvalidReference, PhysicalMeaning)
 from chemcoord.internal_coordinates._zmat_class_pandas_wrapper import \
     PandasWrapper
+from chemcoord.internal_coordinates.zmat_array import ZmatArray
 from chemcoord.utilities import _decorators
+from chemcoord.utilities._parallel import get_n_jobs, numba_threads
 
 append_indexer_docstring = _decorators.Appender(
     """In the case of obtaining elements, the indexing behaves like
@@ -147,6 +151,8 @@ and assigning values safely.
             raise PhysicalMeaning(message)
 
     def __add__(self, other):
+        if isinstance(other, ZmatArray):
+            return NotImplemented
         coords = ['bond', 'angle', 'dihedral']
         if isinstance(other, ZmatCore):
             self._test_if_can_be_added(other)
@@ -164,6 +170,8 @@ and assigning values safely.
         return self + other
 
     def __sub__(self, other):
+        if isinstance(other, ZmatArray):
+            return NotImplemented
         coords = ['bond', 'angle', 'dihedral']
         if isinstance(other, ZmatCore):
             self._test_if_can_be_added(other)
@@ -192,6 +200,8 @@ and assigning values safely.
         return new
 
     def __mul__(self, other):
+        if isinstance(other, ZmatArray):
+            return NotImplemented
         coords = ['bond', 'angle', 'dihedral']
         if isinstance(other, ZmatCore):
             self._test_if_can_be_added(other)
@@ -209,6 +219,8 @@ and assigning values safely.
         return self * other
 
     def __truediv__(self, other):
+        if isinstance(other, ZmatArray):
+            return NotImplemented
         coords = ['bond', 'angle', 'dihedral']
         if isinstance(other, ZmatCore):
             self._test_if_can_be_added(other)
@@ -356,6 +368,8 @@ and assigning values safely.
         because going from :math:`5^\circ` to :math:`355^\circ` is
         :math:`350^\circ` in this case and not :math:`-10^\circ` as
         in ``zmats2`` which is the desired :math:`\Delta` in most cases.
+        :func:`~chemcoord.zmat_functions.interpolate` builds the
+        movement of ``zmats2`` for all steps at once.
 
         Args:
             None
@@ -617,6 +631,30 @@ and assigning values safely.
             zmat = zmat._insert_dummy_zmat(exception, inplace=False)
             return zmat._remove_dummies(inplace=False)
 
+    def _give_positional_c_table(self):
+        """Return the construction table with references by position.
+
+        Returns:
+            :class:`numpy.ndarray`: Integer array of shape ``(3, n_atoms)``.
+        """
+        c_table = self.loc[:, ['b', 'a', 'd']]
+        c_table = c_table.replace(constants.int_label)
+        c_table = c_table.replace({k: v for v, k in enumerate(c_table.index)})
+        return c_table.values.astype('i8').T
+
+    def get_zmat_array(self):
+        """Return the bond lengths, angles and dihedrals as array.
+
+        The arithmetic of :class:`~chemcoord.ZmatArray` avoids the copies
+        and tests of :class:`~chemcoord.Zmat` for every operation,
+        which is faster e.g. for interpolations with many steps.
+
+        Returns:
+            ZmatArray: A new instance of :class:`~chemcoord.ZmatArray`.
+        """
+        coords = ['bond', 'angle', 'dihedral']
+        return ZmatArray(self, self.loc[:, coords].values.astype('f8'))
+
     def get_cartesian(self):
         """Return the molecule in cartesian coordinates.
 
@@ -639,10 +677,7 @@ and assigning values safely.
             cartesian = Cartesian(xyz_frame, metadata=self.metadata)
             return cartesian
 
-        c_table = self.loc[:, ['b', 'a', 'd']]
-        c_table = c_table.replace(constants.int_label)
-        c_table = c_table.replace({k: v for v, k in enumerate(c_table.index)})
-        c_table = c_table.values.astype('i8').T
+        c_table = self._give_positional_c_table()
 
         C = self.loc[:, ['bond', 'angle', 'dihedral']].values.T
         C[[1, 2], :] = np.radians(C[[1, 2], :])
@@ -660,8 +695,49 @@ and assigning values safely.
         elif err == ERR_CODE_OK:
             return create_cartesian(positions, row + 1)
 
+    def _give_non_dummies(self, drop_auto_dummies=True):
+        """Return a boolean mask, which is False for automatically
+        created dummies, if ``drop_auto_dummies`` is True."""
+        included = np.full(len(self), True)
+        if drop_auto_dummies:
+            rename = dict(zip(self.index, range(len(self))))
+            dummies = [rename[v['dummy_d']] for v in
+                       self._metadata['has_dummies'].values()]
+            included[dummies] = False
+        return included
+
+    def _give_grad_X_blocks(self, drop_auto_dummies=True, n_jobs=None):
+        """Return the local derivatives of the transformation to
+        cartesian space.
+
+        Args:
+            drop_auto_dummies (bool):
+            n_jobs (int): The number of threads used for the calculation.
+
+        Returns:
+            tuple: ``(blocks, c_table, included)``, where ``blocks`` is
+            explained in ``get_grad_X_blocks``, ``c_table`` is the
+            positional construction table and ``included`` the mask of
+            :meth:`~Zmat._give_non_dummies`.
+        """
+        c_table = self._give_positional_c_table()
+        C = self.loc[:, ['bond', 'angle', 'dihedral']].values.T.astype('f8')
+        C[[1, 2], :] = np.radians(C[[1, 2], :])
+        if get_n_jobs(n_jobs) > 1:
+            with numba_threads(n_jobs):
+                err, row, _, blocks = \
+                    transformation.get_grad_X_blocks_parallel(C, c_table)
+        else:
+            err, row, _, blocks = transformation.get_grad_X_blocks(C, c_table)
+        if err == ERR_CODE_InvalidReference:
+            i = self.index[row]
+            b, a, d = self.loc[i, ['b', 'a', 'd']]
+            raise InvalidReference(i=i, b=b, a=a, d=d)
+        return blocks, c_table, self._give_non_dummies(drop_auto_dummies)
+
     def get_grad_cartesian(self, as_function=True, chain=True,
-                           drop_auto_dummies=True):
+                           drop_auto_dummies=True, sparse=False,
+                           matrix_free=False, n_jobs=None):
         r"""Return the gradient for the transformation to a Cartesian.
 
         If ``as_function`` is True, a function is returned that can be directly
@@ -730,6 +806,26 @@ and assigning values safely.
             =
             \frac{\partial \mathbf{X}_{i, j}}{\partial \mathbf{C}_{l, k}}
 
+        The position of an atom depends only on the internal coordinates
+        of the atoms, which are directly or indirectly used as its
+        references. For large molecules ``sparse=True`` should be used,
+        which returns a :class:`scipy.sparse.bsr_matrix` of shape
+        ``(3 n, 3 n)`` with ``3 x 3`` blocks, where
+
+        .. math::
+
+            \left(
+                \frac{\partial \mathbf{X}}{\partial \mathbf{C}}
+            \right)_{3 j + i, 3 k + l}
+            =
+            \frac{\partial \mathbf{X}_{i, j}}{\partial \mathbf{C}_{l, k}}
+
+        If the gradient has to be applied only onto distortions,
+        ``matrix_free=True`` returns a function, that propagates
+        the distortions along the construction table.
+        This needs time and memory proportional to the number of atoms
+        and never builds the gradient.
+
         Args:
             construction_table (pandas.DataFrame):
             as_function (bool): Return a tensor or
@@ -740,6 +836,19 @@ and assigning values safely.
                 dummies from the gradient.
                 This means, that only changes in regularly placed atoms are
                 considered for the gradient.
+            sparse (bool): Return a sparse matrix instead of a dense
+                tensor.
+            matrix_free (bool): Return a function, which applies the
+                gradient without building it.
+                Requires ``as_function=True`` and ``chain=True``.
+            n_jobs (int): The number of threads used for the calculation.
+                If more than one thread is used, the local derivatives
+                of the atoms are calculated in parallel.
+                The chaining and the propagation of distortions treat
+                the atoms in parallel, which have the same
+                depth in the construction table.
+                The default is specified in
+                ``settings['defaults']['n_jobs']``.
 
         Returns:
             (func, :class:`numpy.ndarray`): Depending on ``as_function``
@@ -747,29 +856,58 @@ and assigning values safely.
             :func:`~chemcoord.zmat_functions.apply_grad_cartesian_tensor`
             with partially replaced arguments.
         """
-        zmat = self.change_numbering()
-        c_table = zmat.loc[:, ['b', 'a', 'd']]
-        c_table = c_table.replace(constants.int_label).values.T
-        C = zmat.loc[:, ['bond', 'angle', 'dihedral']].values.T
-        if C.dtype == np.dtype('i8'):
-            C = C.astype('f8')
-        C[[1, 2], :] = np.radians(C[[1, 2], :])
-
-        grad_X = transformation.get_grad_X(C, c_table, chain=chain)
-
-        if drop_auto_dummies:
-            def drop_dummies(grad_X, zmolecule):
-                rename = dict(zip(zmolecule.index, range(len(zmolecule))))
-                dummies = [rename[v['dummy_d']] for v in
-                           self._metadata['has_dummies'].values()]
-                excluded = np.full(grad_X.shape[1], True)
-                excluded[dummies] = False
+        if matrix_free and not (as_function and chain):
+            raise IllegalArgumentCombination(
+                'matrix_free requires as_function=True and chain=True')
+        parallel = get_n_jobs(n_jobs) > 1
+        if matrix_free or sparse:
+            blocks, c_table, included = self._give_grad_X_blocks(
+                drop_auto_dummies, n_jobs=n_jobs)
+        else:
+            zmat = self.change_numbering()
+            c_table = zmat.loc[:, ['b', 'a', 'd']]
+            c_table = c_table.replace(constants.int_label).values.T
+            C = zmat.loc[:, ['bond', 'angle', 'dihedral']].values.T
+            if C.dtype == np.dtype('i8'):
+                C = C.astype('f8')
+            C[[1, 2], :] = np.radians(C[[1, 2], :])
+            included = self._give_non_dummies(drop_auto_dummies)
+
+        if matrix_free:
+            from chemcoord.internal_coordinates.zmat_functions import (
+                _apply_grad_cartesian_blocks)
+            return partial(_apply_grad_cartesian_blocks, blocks, c_table,
+                           included, n_jobs=n_jobs)
+
+        if sparse:
+            n_atoms = len(self)
+            if chain and parallel:
+                with numba_threads(n_jobs):
+                    indptr, indices, data = \
+                        transformation.chain_grad_X_blocks_parallel(
+                            blocks, c_table)
+            elif chain:
+                indptr, indices, data = transformation.chain_grad_X_blocks(
+                    blocks, c_table)
+            else:
+                indptr, indices = np.arange(n_atoms + 1), np.arange(n_atoms)
+                data = blocks[:, :, 0, :].copy()
+            grad_X = bsr_matrix((data, indices, indptr),
+                                shape=(3 * n_atoms, 3 * n_atoms))
+            if not included.all():
+                kept = np.repeat(included, 3)
+                grad_X = grad_X.tocsr()[kept][:, kept].tobsr(blocksize=(3, 3))
+        else:
+            if parallel:
+                with numba_threads(n_jobs):
+                    grad_X = transformation.get_grad_X_parallel(
+                        C, c_table, chain=chain)
+            else:
+                grad_X = transformation.get_grad_X(C, c_table, chain=chain)
+            if not included.all():
                 coord_rows = np.full(3, True)
-                selection = np.ix_(coord_rows, excluded, excluded, coord_rows)
-                return grad_X[selection]
-
-            grad_X = drop_dummies(grad_X, self)
-
+                grad_X = grad_X[np.ix_(coord_rows, included, included,
+                                       coord_rows)]
         if as_function:
             from chemcoord.internal_coordinates.zmat_functions import (
                 apply_grad_cartesian_tensor)
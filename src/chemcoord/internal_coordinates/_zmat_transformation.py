@@ -11,7 +11,7 @@ from numba import jit
 import chemcoord.constants as constants
 from chemcoord.cartesian_coordinates.xyz_functions import _jit_isclose
 from chemcoord.cartesian_coordinates._cart_transformation import (
-    get_B, get_grad_B, get_ref_pos)
+    get_B, get_B_batched, get_grad_B, get_ref_pos, get_ref_pos_batched)
 from chemcoord.exceptions import ERR_CODE_OK, ERR_CODE_InvalidReference
 
 
@@ -65,33 +65,368 @@ def get_X(C, c_table):
     return (ERR_CODE_OK, j, X)  # pylint:disable=undefined-loop-variable
 
 
+@jit(nopython=True, parallel=True, cache=True)
+def get_X_trajectory(C, c_table):
+    """Apply :func:`get_X` to each frame of ``C``.
+
+    ``C`` has the shape ``(n_frames, 3, n_atoms)``.
+    Returns for each frame an error code and the last built row,
+    and the positions of shape ``(n_frames, 3, n_atoms)``.
+    """
+    n_frames = C.shape[0]
+    err = np.empty(n_frames, dtype=nb.int64)
+    rows = np.empty(n_frames, dtype=nb.int64)
+    X = np.empty_like(C)
+    for frame in nb.prange(n_frames):
+        frame_err, row, frame_X = get_X(C[frame], c_table)
+        err[frame] = frame_err
+        rows[frame] = row
+        X[frame] = frame_X
+    return err, rows, X
+
+
 @jit(nopython=True, cache=True)
-def chain_grad(X, grad_X, C, c_table, j, l):
-    if j < constants.keys_below_are_abs_refs:
-        new_grad_X = np.zeros((3, 3))
-    else:
-        grad_B = get_grad_B(X, c_table, j)
-        S = get_S(C, j)
-        new_grad_X = grad_X[:, c_table[0, j], l, :].copy()
+def get_grad_X_block(C, X, c_table, j):
+    """Return the local derivatives of ``X[:, j]``.
 
-        for m_2 in range(3):
-            for m_1 in range(3):
-                for k in range(3):
-                    if c_table[k, j] > constants.keys_below_are_abs_refs:
-                        new_grad_X += (S[m_2]
-                                       * grad_B[:, m_2, k, m_1]
-                                       * grad_X[m_1, c_table[k, j], l, :])
-    return new_grad_X
+    ``X`` are the positions calculated by :func:`get_X`.
+    The index layout is explained in :func:`get_grad_X_blocks`.
+    """
+    block = np.zeros((3, 4, 3))
+    block[:, 0, :] = np.dot(get_B(X, c_table, j)[1], get_grad_S(C, j))
+    S = get_S(C, j)
+    grad_B = get_grad_B(X, c_table, j)
+    for k in range(3):
+        if c_table[k, j] > constants.keys_below_are_abs_refs:
+            for m_2 in range(3):
+                block[:, k + 1, :] += S[m_2] * grad_B[:, m_2, k, :]
+    if c_table[0, j] > constants.keys_below_are_abs_refs:
+        for m in range(3):
+            block[m, 1, m] += 1.
+    return block
 
 
 @jit(nopython=True, cache=True)
-def get_grad_X(C, c_table, chain=True):
+def get_grad_X_blocks(C, c_table):
+    """Return the local derivatives of :func:`get_X`.
+
+    The position of the j-th atom depends directly only on ``C[:, j]``
+    and on the positions of its references b, a and d.
+    ``blocks[j, :, 0, :]`` contains the derivatives of ``X[:, j]``
+    for ``C[:, j]`` and ``blocks[j, :, k + 1, :]`` the derivatives
+    for the position of the k-th reference with fixed ``C[:, j]``.
+    Blocks for absolute references are zero.
+    """
+    n_atoms = C.shape[1]
+    blocks = np.zeros((n_atoms, 3, 4, 3))
+    err, row, X = get_X(C, c_table)
+    if err == ERR_CODE_InvalidReference:
+        return (err, row, X, blocks)
+    for j in range(n_atoms):
+        blocks[j] = get_grad_X_block(C, X, c_table, j)
+    return (err, row, X, blocks)
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_grad_X_blocks_parallel(C, c_table):
+    """Parallel version of :func:`get_grad_X_blocks`.
+
+    The positions are built serially by :func:`get_X`.
+    Afterwards the local derivatives of the atoms are independent
+    and distributed over the threads set by :func:`numba.set_num_threads`.
+    """
     n_atoms = C.shape[1]
+    blocks = np.zeros((n_atoms, 3, 4, 3))
+    err, row, X = get_X(C, c_table)
+    if err == ERR_CODE_InvalidReference:
+        return (err, row, X, blocks)
+    for j in nb.prange(n_atoms):
+        blocks[j] = get_grad_X_block(C, X, c_table, j)
+    return (err, row, X, blocks)
+
+
+@jit(nopython=True, cache=True)
+def get_construction_levels(c_table):
+    """Group the atoms by their depth in the construction table.
+
+    Atoms without relative references are in the zeroth level,
+    every other atom is one level above its highest reference.
+    Hence the atoms of one level are independent of each other,
+    once all lower levels are known.
+    Returns ``(level_ptr, order)``, where the atoms of the l-th level
+    are ``order[level_ptr[l]:level_ptr[l + 1]]``.
+    """
+    n_atoms = c_table.shape[1]
+    level = np.zeros(n_atoms, dtype=nb.int64)
+    n_levels = 0
+    for j in range(n_atoms):
+        for k in range(3):
+            r = c_table[k, j]
+            if r > constants.keys_below_are_abs_refs:
+                level[j] = max(level[j], level[r] + 1)
+        n_levels = max(n_levels, level[j] + 1)
+    level_ptr = np.zeros(n_levels + 1, dtype=nb.int64)
+    for j in range(n_atoms):
+        level_ptr[level[j] + 1] += 1
+    for l in range(n_levels):
+        level_ptr[l + 1] += level_ptr[l]
+    order = np.argsort(level, kind='mergesort')
+    return level_ptr, order
+
+
+@jit(nopython=True, cache=True)
+def get_chain_pattern(c_table):
+    """Return the sparsity pattern of :func:`chain_grad_X_blocks`.
+
+    The pattern is returned as ``(indptr, indices)`` with sorted
+    indices in each row.
+    """
+    n_atoms = c_table.shape[1]
+    indptr = np.zeros(n_atoms + 1, dtype=nb.int64)
+    indices = np.empty(4 * n_atoms, dtype=nb.int64)
+    last_row = np.full(n_atoms, -1, dtype=nb.int64)
+    for j in range(n_atoms):
+        start = indptr[j]
+        max_length = 1
+        for k in range(3):
+            r = c_table[k, j]
+            if r > constants.keys_below_are_abs_refs:
+                max_length += indptr[r + 1] - indptr[r]
+        if start + max_length > len(indices):
+            new_indices = np.empty(max(2 * len(indices), start + max_length),
+                                   dtype=nb.int64)
+            new_indices[:start] = indices[:start]
+            indices = new_indices
+        end = start
+        indices[end] = j
+        last_row[j] = j
+        end += 1
+        for k in range(3):
+            r = c_table[k, j]
+            if r > constants.keys_below_are_abs_refs:
+                for l in indices[indptr[r]:indptr[r + 1]]:
+                    if last_row[l] != j:
+                        last_row[l] = j
+                        indices[end] = l
+                        end += 1
+        indices[start:end] = np.sort(indices[start:end])
+        indptr[j + 1] = end
+    return indptr, indices[:indptr[n_atoms]].copy()
+
+
+@jit(nopython=True, cache=True)
+def chain_grad_X_blocks(blocks, c_table):
+    """Chain the local derivatives along the construction table.
+
+    The position of the j-th atom depends only on the internal
+    coordinates of the atoms, which are used as references
+    directly or indirectly.
+    Returns the derivatives of the positions for the internal
+    coordinates in block sparse row format ``(indptr, indices, data)``,
+    where ``data`` contains ``3 x 3`` blocks with the index layout of
+    :func:`get_grad_X`.
+    """
+    n_atoms = blocks.shape[0]
+    indptr, indices = get_chain_pattern(c_table)
+    data = np.zeros((len(indices), 3, 3))
+    entry = np.full(n_atoms, -1, dtype=nb.int64)
+    for j in range(n_atoms):
+        for e in range(indptr[j], indptr[j + 1]):
+            entry[indices[e]] = e
+        data[entry[j]] += blocks[j, :, 0, :]
+        for k in range(3):
+            r = c_table[k, j]
+            if r > constants.keys_below_are_abs_refs:
+                local = blocks[j, :, k + 1, :].copy()
+                for e in range(indptr[r], indptr[r + 1]):
+                    data[entry[indices[e]]] += np.dot(local, data[e])
+        for e in range(indptr[j], indptr[j + 1]):
+            entry[indices[e]] = -1
+    return indptr, indices, data
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def chain_grad_X_blocks_parallel(blocks, c_table):
+    """Parallel version of :func:`chain_grad_X_blocks`.
+
+    The levels of :func:`get_construction_levels` are processed
+    one after the other and the atoms of each level in parallel.
+    Every atom writes only into its own row, so no locking is required.
+    """
+    indptr, indices = get_chain_pattern(c_table)
+    level_ptr, order = get_construction_levels(c_table)
+    data = np.zeros((len(indices), 3, 3))
+    for l in range(len(level_ptr) - 1):
+        for q in nb.prange(level_ptr[l], level_ptr[l + 1]):
+            j = order[q]
+            start, end = indptr[j], indptr[j + 1]
+            row = indices[start:end]
+            data[start + np.searchsorted(row, j)] += blocks[j, :, 0, :]
+            for k in range(3):
+                r = c_table[k, j]
+                if r > constants.keys_below_are_abs_refs:
+                    local = blocks[j, :, k + 1, :].copy()
+                    for e in range(indptr[r], indptr[r + 1]):
+                        f = start + np.searchsorted(row, indices[e])
+                        data[f] += np.dot(local, data[e])
+    return indptr, indices, data
+
+
+@jit(nopython=True, cache=True)
+def apply_grad_X_blocks(blocks, c_table, C_dist):
+    """Apply the gradient of :func:`get_X` onto ``C_dist``.
+
+    The distortions are propagated along the construction table using
+    the local derivatives of :func:`get_grad_X_blocks`, without
+    building the gradient.
+    """
+    n_atoms = blocks.shape[0]
+    X_dist = np.zeros((3, n_atoms))
+    for j in range(n_atoms):
+        for m in range(3):
+            for n in range(3):
+                X_dist[m, j] += blocks[j, m, 0, n] * C_dist[n, j]
+        for k in range(3):
+            r = c_table[k, j]
+            if r > constants.keys_below_are_abs_refs:
+                for m in range(3):
+                    for n in range(3):
+                        X_dist[m, j] += blocks[j, m, k + 1, n] * X_dist[n, r]
+    return X_dist
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def apply_grad_X_blocks_parallel(blocks, c_table, C_dist):
+    """Parallel version of :func:`apply_grad_X_blocks`.
+
+    The levels of :func:`get_construction_levels` are processed
+    one after the other and the atoms of each level in parallel.
+    """
+    level_ptr, order = get_construction_levels(c_table)
+    X_dist = np.zeros((3, blocks.shape[0]))
+    for l in range(len(level_ptr) - 1):
+        for q in nb.prange(level_ptr[l], level_ptr[l + 1]):
+            j = order[q]
+            for m in range(3):
+                for n in range(3):
+                    X_dist[m, j] += blocks[j, m, 0, n] * C_dist[n, j]
+            for k in range(3):
+                r = c_table[k, j]
+                if r > constants.keys_below_are_abs_refs:
+                    for m in range(3):
+                        for n in range(3):
+                            X_dist[m, j] += (blocks[j, m, k + 1, n]
+                                             * X_dist[n, r])
+    return X_dist
+
+
+@jit(nopython=True, cache=True)
+def apply_grad_X_blocks_transpose(blocks, c_table, X_grad):
+    """Apply the transposed gradient of :func:`get_X` onto ``X_grad``.
+
+    The gradient is propagated backwards along the construction table
+    using the local derivatives of :func:`get_grad_X_blocks`, without
+    building the gradient.
+    """
+    n_atoms = blocks.shape[0]
+    X_grad = X_grad.copy()
+    C_grad = np.zeros((3, n_atoms))
+    for j in range(n_atoms - 1, -1, -1):
+        for m in range(3):
+            for n in range(3):
+                C_grad[n, j] += blocks[j, m, 0, n] * X_grad[m, j]
+        for k in range(3):
+            r = c_table[k, j]
+            if r > constants.keys_below_are_abs_refs:
+                for m in range(3):
+                    for n in range(3):
+                        X_grad[n, r] += blocks[j, m, k + 1, n] * X_grad[m, j]
+    return C_grad
+
+
+@jit(nopython=True, cache=True)
+def get_dense_grad_X(indptr, indices, data):
+    """Scatter the block sparse rows of :func:`chain_grad_X_blocks`
+    into the dense tensor of :func:`get_grad_X`.
+    """
+    n_atoms = len(indptr) - 1
     grad_X = np.zeros((3, n_atoms, n_atoms, 3))
-    X = get_X(C, c_table)[2]
     for j in range(n_atoms):
-        grad_X[:, j, j, :] = np.dot(get_B(X, c_table, j)[1], get_grad_S(C, j))
-        if chain:
-            for l in range(j):
-                grad_X[:, j, l, :] = chain_grad(X, grad_X, C, c_table, j, l)
+        for e in range(indptr[j], indptr[j + 1]):
+            grad_X[:, j, indices[e], :] = data[e]
     return grad_X
+
+
+@jit(nopython=True, cache=True)
+def get_grad_X(C, c_table, chain=True):
+    blocks = get_grad_X_blocks(C, c_table)[3]
+    if chain:
+        indptr, indices, data = chain_grad_X_blocks(blocks, c_table)
+        return get_dense_grad_X(indptr, indices, data)
+    else:
+        n_atoms = blocks.shape[0]
+        return get_dense_grad_X(np.arange(n_atoms + 1), np.arange(n_atoms),
+                                blocks[:, :, 0, :].copy())
+
+
+@jit(nopython=True, cache=True)
+def get_grad_X_parallel(C, c_table, chain=True):
+    """Parallel version of :func:`get_grad_X`.
+
+    The blocks are calculated by :func:`get_grad_X_blocks_parallel`
+    and chained by :func:`chain_grad_X_blocks_parallel`.
+    """
+    blocks = get_grad_X_blocks_parallel(C, c_table)[3]
+    if chain:
+        indptr, indices, data = chain_grad_X_blocks_parallel(blocks, c_table)
+        return get_dense_grad_X(indptr, indices, data)
+    else:
+        n_atoms = blocks.shape[0]
+        return get_dense_grad_X(np.arange(n_atoms + 1), np.arange(n_atoms),
+                                blocks[:, :, 0, :].copy())
+
+
+def get_S_batched(C):
+    """Array version of :func:`get_S` for all atoms of a batch.
+
+    ``C`` has the shape ``(..., 3, n_atoms)``.
+    """
+    r, alpha, delta = C[..., 0, :], C[..., 1, :], C[..., 2, :]
+    S = np.stack([r * np.sin(alpha) * np.cos(delta),
+                  -r * np.sin(alpha) * np.sin(delta),
+                  -r * np.cos(alpha)], axis=-2)
+    is_pi = np.isclose(alpha, np.pi, atol=1e-5, rtol=1e-8)
+    is_zero = np.isclose(alpha, 0., atol=1e-5, rtol=1e-8)
+    on_axis = (is_pi | is_zero)[..., None, :]
+    S[..., :2, :] = np.where(on_axis, 0., S[..., :2, :])
+    S[..., 2, :] = np.where(is_pi, r, np.where(is_zero, -r, S[..., 2, :]))
+    return S
+
+
+def get_X_batched(C, c_table):
+    """Array version of :func:`get_X` for a batch of structures.
+
+    ``C`` has the shape ``(..., 3, n_atoms)``.
+    The levels of :func:`get_construction_levels` are built one after
+    the other, and all atoms of a level in all structures at once
+    with array operations.
+    Returns for each structure an error code and the first row with an
+    invalid reference (or the last row), and the positions of shape
+    ``(..., 3, n_atoms)``.
+    """
+    n_atoms = C.shape[-1]
+    level_ptr, order = get_construction_levels(c_table)
+    S = get_S_batched(C)
+    X = np.zeros_like(C)
+    invalid = np.zeros(C.shape[:-2] + (n_atoms,), dtype=bool)
+    for l in range(len(level_ptr) - 1):
+        atoms = order[level_ptr[l]:level_ptr[l + 1]]
+        b, a, d = [get_ref_pos_batched(X, c_table[k, atoms])
+                   for k in range(3)]
+        B, invalid[..., atoms] = get_B_batched(b, a, d)
+        X[..., atoms] = np.einsum('...ikj,...kj->...ij',
+                                  B, S[..., atoms]) + b
+    has_invalid = invalid.any(axis=-1)
+    err = np.where(has_invalid, ERR_CODE_InvalidReference, ERR_CODE_OK)
+    rows = np.where(has_invalid, invalid.argmax(axis=-1), n_atoms - 1)
+    return err, rows, X
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, with_statement)
+
+import operator
+
+import numpy as np
+
+from chemcoord import export
+
+
+@export
+class ZmatArray(object):
+    """Bond lengths, angles and dihedrals of many Zmatrices in one array.
+
+    Arithmetic with :class:`~chemcoord.Zmat` copies the metadata and
+    recalculates the cartesian coordinates for every operation.
+    A :class:`ZmatArray` stores only the values in a contiguous array
+    and shares the atoms and the construction table of a reference
+    Zmatrix.
+    The arithmetic operators ``+ - * / **`` and the unary operators
+    ``+ - abs`` are applied directly to the array and follow the
+    broadcasting rules of numpy, without any test for valid references.
+    The values are tested only when they are converted back with
+    :meth:`get_zmat` or :meth:`get_cartesian`.
+
+    Several structures are stored along a leading axis, e.g.
+    an interpolation between two Zmatrices in ``n`` steps is::
+
+        za1, za2 = zm1.get_zmat_array(), zm2.get_zmat_array()
+        steps = np.linspace(0, 1, n)[:, None, None]
+        frames = za1 + (za2 - za1) * steps
+
+    Use :meth:`~chemcoord.Zmat.get_zmat_array` to create an instance.
+
+    Args:
+        zmat (Zmat): The reference Zmatrix, which defines the atoms and
+            the construction table.
+        values (:class:`numpy.ndarray`): Bond lengths, angles and
+            dihedrals in degrees as array of shape ``(n_atoms, 3)`` or
+            ``(n_frames, n_atoms, 3)``. The rows follow the order of
+            ``zmat.index``.
+    """
+    # Let numpy arrays defer to the reflected operators of this class
+    __array_ufunc__ = None
+    __array_priority__ = 1000
+
+    def __init__(self, zmat, values):
+        values = np.asarray(values, dtype='f8')
+        if values.ndim not in (2, 3) or values.shape[-2:] != (len(zmat), 3):
+            raise ValueError('values has to be of shape '
+                             '(n_atoms, 3) or (n_frames, n_atoms, 3)')
+        self.zmat = zmat
+        self.values = values
+
+    def __repr__(self):
+        return '{}(shape={})'.format(self.__class__.__name__,
+                                     self.values.shape)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, key):
+        """Select frames of an array with several structures."""
+        if self.values.ndim == 2:
+            raise TypeError('Only arrays with several structures '
+                            'can be indexed')
+        return self.__class__(self.zmat, self.values[key])
+
+    @property
+    def index(self):
+        """The index of the atoms."""
+        return self.zmat.index
+
+    @property
+    def shape(self):
+        """The shape of :attr:`values`."""
+        return self.values.shape
+
+    def _give_other_values(self, other):
+        if isinstance(other, ZmatArray):
+            if other.zmat is not self.zmat:
+                self.zmat._test_if_can_be_added(other.zmat)
+            return other.values
+        if hasattr(other, 'get_zmat_array'):
+            self.zmat._test_if_can_be_added(other)
+            return other.get_zmat_array().values
+        return np.asarray(other)
+
+    def _binary_operation(self, operation, other, reflected=False):
+        other = self._give_other_values(other)
+        if reflected:
+            values = operation(other, self.values)
+        else:
+            values = operation(self.values, other)
+        return self.__class__(self.zmat, values)
+
+    def __add__(self, other):
+        return self._binary_operation(operator.add, other)
+
+    def __radd__(self, other):
+        return self._binary_operation(operator.add, other, reflected=True)
+
+    def __sub__(self, other):
+        return self._binary_operation(operator.sub, other)
+
+    def __rsub__(self, other):
+        return self._binary_operation(operator.sub, other, reflected=True)
+
+    def __mul__(self, other):
+        return self._binary_operation(operator.mul, other)
+
+    def __rmul__(self, other):
+        return self._binary_operation(operator.mul, other, reflected=True)
+
+    def __truediv__(self, other):
+        return self._binary_operation(operator.truediv, other)
+
+    def __rtruediv__(self, other):
+        return self._binary_operation(operator.truediv, other,
+                                      reflected=True)
+
+    __div__ = __truediv__
+    __rdiv__ = __rtruediv__
+
+    def __pow__(self, other):
+        return self._binary_operation(operator.pow, other)
+
+    def __pos__(self):
+        return self.__class__(self.zmat, self.values.copy())
+
+    def __neg__(self):
+        return self.__class__(self.zmat, -self.values)
+
+    def __abs__(self):
+        return self.__class__(self.zmat, np.abs(self.values))
+
+    def minimize_dihedrals(self):
+        """Give a representation of the dihedral with minimized absolute value.
+
+        This is the array version of
+        :meth:`~chemcoord.Zmat.minimize_dihedrals`.
+
+        Returns:
+            ZmatArray: A new instance with dihedrals between -180 and 180.
+        """
+        values = self.values.copy()
+        r = values[..., 2] % 360
+        values[..., 2] = r - (r // 180) * 360
+        return self.__class__(self.zmat, values)
+
+    def get_cartesian(self, n_jobs=None, engine='numba'):
+        """Return the cartesian coordinates of all structures.
+
+        Args:
+            n_jobs (int): The number of threads. The default is specified
+                in ``settings['defaults']['n_jobs']``.
+            engine (str): Explained in
+                :func:`~chemcoord.zmat_functions.get_cartesian_trajectory`.
+
+        Returns:
+            :class:`numpy.ndarray`: The coordinates as array of shape
+            ``(n_atoms, 3)`` or ``(n_frames, n_atoms, 3)`` in the order
+            of :attr:`index`.
+
+        Raises:
+            :class:`~chemcoord.exceptions.InvalidReference`: If a
+            structure uses an invalid reference.
+        """
+        from chemcoord.internal_coordinates.zmat_functions import \
+            get_cartesian_trajectory
+        values = self.values.reshape((-1, ) + self.values.shape[-2:])
+        positions = get_cartesian_trajectory(self.zmat, values,
+                                             n_jobs=n_jobs, engine=engine)
+        return positions.reshape(self.values.shape)
+
+    def get_zmat(self, frame=None):
+        """Convert a structure back to a :class:`~chemcoord.Zmat`.
+
+        The values are assigned with :meth:`~chemcoord.Zmat.safe_loc`,
+        if :attr:`~chemcoord.Zmat.test_operators` of the reference
+        Zmatrix is True, and with :meth:`~chemcoord.Zmat.unsafe_loc`
+        otherwise.
+
+        Args:
+            frame (int): The position of the structure, if there are
+                several.
+
+        Returns:
+            Zmat: A new instance of :class:`~chemcoord.Zmat`.
+        """
+        if self.values.ndim == 3:
+            if frame is None:
+                raise ValueError('frame has to be given for an array '
+                                 'with several structures')
+            values = self.values[frame]
+        elif frame is not None:
+            raise ValueError('There is only one structure')
+        else:
+            values = self.values
+        coords = ['bond', 'angle', 'dihedral']
+        new = self.zmat.copy()
+        if self.zmat.test_operators:
+            new.safe_loc[:, coords] = values
+        else:
+            new.unsafe_loc[:, coords] = values
+        return new
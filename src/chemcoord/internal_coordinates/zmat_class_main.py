@@ -40,6 +40,11 @@ class Zmat(ZmatIO):
     ``shape=(len(Zmat), 3)`` which is again added elementwise.
     The same rules are true for subtraction, division and multiplication.
 
+    Every operation copies the Zmatrix and tests the new references.
+    For many operations, e.g. interpolations with many steps, use
+    :meth:`~chemcoord.Zmat.get_zmat_array` and the plain array
+    arithmetic of :class:`~chemcoord.ZmatArray`.
+
     **Indexing**:
 
     The indexing behaves like Indexing and Selecting data in
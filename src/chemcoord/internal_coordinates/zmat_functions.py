@@ -4,9 +4,13 @@ from __future__ import (absolute_import, division, print_function,
 
 import numpy as np
 import sympy
+from scipy.sparse import csr_matrix, diags, issparse
 
+import chemcoord.internal_coordinates._zmat_transformation as transformation
 from chemcoord import export
+from chemcoord.exceptions import ERR_CODE_InvalidReference, InvalidReference
 from chemcoord.internal_coordinates.zmat_class_main import Zmat
+from chemcoord.utilities._parallel import get_n_jobs, numba_threads
 
 
 @export
@@ -76,9 +80,10 @@ def apply_grad_cartesian_tensor(grad_X, zmat_dist):
     """Apply the gradient for transformation to cartesian space onto zmat_dist.
 
     Args:
-        grad_X (:class:`numpy.ndarray`): A ``(3, n, n, 3)`` array.
+        grad_X (:class:`numpy.ndarray`): A ``(3, n, n, 3)`` array
+            or a sparse ``(3 n, 3 n)`` matrix.
             The mathematical details of the index layout is explained in
-            :meth:`~chemcoord.Cartesian.get_grad_zmat()`.
+            :meth:`~chemcoord.Zmat.get_grad_cartesian()`.
         zmat_dist (:class:`~chemcoord.Zmat`):
             Distortions in Zmatrix space.
 
@@ -92,7 +97,299 @@ def apply_grad_cartesian_tensor(grad_X, zmat_dist):
         C_dist[[1, 2], :] = np.radians(C_dist[[1, 2], :])
     except (TypeError, AttributeError):
         C_dist[[1, 2], :] = sympy.rad(C_dist[[1, 2], :])
-    cart_dist = np.tensordot(grad_X, C_dist, axes=([3, 2], [0, 1])).T
+    if issparse(grad_X):
+        cart_dist = grad_X.dot(C_dist.T.ravel()).reshape((-1, 3))
+    else:
+        cart_dist = np.tensordot(grad_X, C_dist, axes=([3, 2], [0, 1])).T
     from chemcoord.cartesian_coordinates.cartesian_class_main import Cartesian
     return Cartesian(atoms=zmat_dist['atom'],
                      coords=cart_dist, index=zmat_dist.index)
+
+
+def _apply_grad_cartesian_blocks(blocks, c_table, included, zmat_dist,
+                                 n_jobs=None):
+    """Apply the gradient for transformation to cartesian space onto
+    zmat_dist without building it.
+
+    Args:
+        blocks (:class:`numpy.ndarray`): The local derivatives from
+            ``get_grad_X_blocks``.
+        c_table (:class:`numpy.ndarray`): The positional construction table.
+        included (:class:`numpy.ndarray`): Boolean mask of the atoms in
+            ``zmat_dist``. The other atoms are not distorted.
+        zmat_dist (:class:`~chemcoord.Zmat`):
+            Distortions in Zmatrix space.
+        n_jobs (int): The number of threads. The atoms with the same
+            depth in the construction table are treated in parallel,
+            if more than one thread is used.
+
+    Returns:
+        :class:`~chemcoord.Cartesian`: Distortions in cartesian space.
+    """
+    columns = ['bond', 'angle', 'dihedral']
+    C_dist = np.zeros((3, len(included)))
+    C_dist[:, included] = zmat_dist.loc[:, columns].values.T
+    C_dist[[1, 2], :] = np.radians(C_dist[[1, 2], :])
+    if get_n_jobs(n_jobs) > 1:
+        with numba_threads(n_jobs):
+            cart_dist = transformation.apply_grad_X_blocks_parallel(
+                blocks, c_table, C_dist)
+    else:
+        cart_dist = transformation.apply_grad_X_blocks(blocks, c_table,
+                                                       C_dist)
+    from chemcoord.cartesian_coordinates.cartesian_class_main import Cartesian
+    return Cartesian(atoms=zmat_dist['atom'],
+                     coords=cart_dist[:, included].T, index=zmat_dist.index)
+
+
+def apply_grad_cartesian(zmolecule, zmat_dist):
+    """Apply the gradient for transformation to cartesian space onto zmat_dist.
+
+    The result is the same as applying
+    :meth:`~chemcoord.Zmat.get_grad_cartesian`, but the distortions are
+    propagated along the construction table without building the
+    gradient. This needs time and memory proportional to the number
+    of atoms.
+
+    Args:
+        zmolecule (:class:`~chemcoord.Zmat`): The structure for which
+            the gradient is evaluated.
+        zmat_dist (:class:`~chemcoord.Zmat`):
+            Distortions in Zmatrix space.
+
+    Returns:
+        :class:`~chemcoord.Cartesian`: Distortions in cartesian space.
+    """
+    blocks, c_table, included = zmolecule._give_grad_X_blocks()
+    return _apply_grad_cartesian_blocks(blocks, c_table, included, zmat_dist)
+
+
+def apply_grad_cartesian_transpose(zmolecule, cart_grad):
+    """Transform a gradient in cartesian space to Zmatrix space.
+
+    If ``cart_grad`` contains the derivatives of a function for the
+    cartesian coordinates, the result contains its derivatives for the
+    bond lengths, angles and dihedrals of ``zmolecule``.
+    Since angles are given in degrees, the derivatives are per degree.
+
+    The transposed gradient of :meth:`~chemcoord.Zmat.get_grad_cartesian`
+    is applied by propagating ``cart_grad`` backwards along the
+    construction table without building the gradient.
+    This needs time and memory proportional to the number of atoms.
+
+    Args:
+        zmolecule (:class:`~chemcoord.Zmat`): The structure for which
+            the gradient is evaluated.
+        cart_grad (:class:`~chemcoord.Cartesian`): Derivatives for the
+            cartesian coordinates.
+
+    Returns:
+        :class:`~chemcoord.Zmat`: Derivatives for the internal coordinates.
+        Automatically created dummy atoms are included, since their
+        internal coordinates determine the position of other atoms.
+    """
+    blocks, c_table, included = zmolecule._give_grad_X_blocks()
+    atoms = zmolecule.index[included]
+    X_grad = np.zeros((3, len(zmolecule)))
+    X_grad[:, included] = cart_grad.loc[atoms, ['x', 'y', 'z']].values.T
+    C_grad = transformation.apply_grad_X_blocks_transpose(
+        blocks, c_table, X_grad)
+    C_grad[[1, 2], :] = np.radians(C_grad[[1, 2], :])
+
+    zmat_grad = zmolecule.copy()
+    zmat_grad.unsafe_loc[:, ['bond', 'angle', 'dihedral']] = C_grad.T
+    return zmat_grad
+
+
+def transform_hess_to_cartesian(zmolecule, zmat_hess, zmat_grad=None):
+    r"""Transform a Hessian in Zmatrix space to cartesian space.
+
+    With the gradient :math:`B` of the transformation to Zmatrix space
+    and the contraction :math:`K(g)` of
+    :func:`~chemcoord.xyz_functions.apply_hess_zmat`
+    the Hessian for the cartesian coordinates is
+
+    .. math::
+
+        H_x = B^T H_q B + K(g_q)
+
+    This is the inverse of
+    :func:`~chemcoord.xyz_functions.transform_hess_to_zmat`.
+    Since angles are given in degrees, ``zmat_hess`` and ``zmat_grad``
+    are expected per degree.
+
+    Args:
+        zmolecule (:class:`~chemcoord.Zmat`): The structure for which
+            the Hessian is given.
+        zmat_hess (:class:`numpy.ndarray`): The ``(3 n, 3 n)`` Hessian
+            for the bond lengths, angles and dihedrals flattened row wise
+            in the order of ``zmolecule.index``.
+            Sparse matrices are accepted as well and give a sparse result.
+        zmat_grad (:class:`~chemcoord.Zmat`): The derivatives for the
+            internal coordinates. The default ``None`` is only
+            correct at stationary points.
+
+    Returns:
+        :class:`numpy.ndarray` or :class:`scipy.sparse.csr_matrix`:
+        The ``(3 n, 3 n)`` Hessian for the
+        cartesian coordinates flattened row wise
+        in the order of ``zmolecule.index``.
+        It is sparse, if ``zmat_hess`` is sparse.
+        Automatically created dummy atoms are included.
+    """
+    from chemcoord.cartesian_coordinates.xyz_functions import (
+        _contract_hess_C, _give_grad_hess_C, _give_grad_zmat_arguments)
+    molecule = zmolecule.get_cartesian()
+    construction_table = zmolecule.loc[:, ['b', 'a', 'd']]
+    X, c_table, _ = _give_grad_zmat_arguments(molecule, construction_table)
+    grad_C, hess_blocks = _give_grad_hess_C(molecule, construction_table,
+                                            X, c_table)
+    scale = np.tile([1., np.degrees(1.), np.degrees(1.)], len(zmolecule))
+    sparse = issparse(zmat_hess)
+    if sparse:
+        hess = diags(scale).dot(csr_matrix(zmat_hess, dtype='f8')).dot(
+            diags(scale))
+        hess = csr_matrix(grad_C.T.dot(hess).dot(grad_C))
+    else:
+        hess = (np.asarray(zmat_hess, dtype='f8')
+                * scale[:, None] * scale[None, :])
+        hess = grad_C.T.dot(grad_C.T.dot(hess).T)
+    if zmat_grad is not None:
+        C_grad = zmat_grad.loc[zmolecule.index, ['bond', 'angle', 'dihedral']]
+        C_grad = C_grad.values.astype('f8').T
+        C_grad[[1, 2], :] = np.degrees(C_grad[[1, 2], :])
+        contraction = _contract_hess_C(hess_blocks, c_table, C_grad)
+        hess = hess + (contraction if sparse else contraction.toarray())
+    return hess
+
+
+def get_cartesian_trajectory(zmolecule, zmat_values, n_jobs=None,
+                             engine='numba'):
+    """Transform many Zmatrices with the same references to cartesians.
+
+    All frames share the atoms and the construction table of
+    ``zmolecule`` and are transformed in one compiled call,
+    which runs in parallel over the frames.
+    Compare with :meth:`~chemcoord.Zmat.get_cartesian`.
+
+    Args:
+        zmolecule (:class:`~chemcoord.Zmat`): Defines the atoms and
+            the construction table.
+        zmat_values (:class:`numpy.ndarray`): Bond lengths, angles and
+            dihedrals in degrees as array of shape
+            ``(n_frames, n_atoms, 3)``. The atoms are in the order of
+            ``zmolecule.index``.
+        n_jobs (int): The number of threads. The default is specified in
+            ``settings['defaults']['n_jobs']``.
+        engine (str): Either ``'numba'`` or ``'numpy'``.
+            The ``'numba'`` engine builds the frames in compiled loops.
+            The ``'numpy'`` engine builds the atoms of one level of the
+            construction table in all frames at once with array
+            operations, which is faster for many small molecules.
+
+    Returns:
+        :class:`numpy.ndarray`: The coordinates as array of shape
+        ``(n_frames, n_atoms, 3)`` in the order of ``zmolecule.index``.
+
+    Raises:
+        :class:`~chemcoord.exceptions.InvalidReference`: If a frame
+        uses an invalid reference. The message lists all invalid frames,
+        the attributes refer to the first one.
+    """
+    err, rows, positions = _give_cartesian_trajectory(
+        zmolecule, zmat_values, n_jobs, engine)
+    invalid_frames = np.nonzero(err == ERR_CODE_InvalidReference)[0]
+    if len(invalid_frames):
+        atoms = zmolecule.index[rows[invalid_frames]]
+        message = ('Invalid references in the frames {} for the atoms {}'
+                   .format(list(invalid_frames), list(atoms)))
+        b, a, d = zmolecule.loc[atoms[0], ['b', 'a', 'd']]
+        raise InvalidReference(message=message, i=atoms[0], b=b, a=a, d=d)
+    return positions
+
+
+def _give_cartesian_trajectory(zmolecule, zmat_values, n_jobs, engine):
+    """Return the error codes, the failing rows and the positions
+    of :func:`get_cartesian_trajectory` without raising
+    for invalid frames."""
+    zmat_values = np.asarray(zmat_values, dtype='f8')
+    if zmat_values.ndim != 3 or zmat_values.shape[1:] != (len(zmolecule), 3):
+        raise ValueError('zmat_values has to be of shape '
+                         '(n_frames, n_atoms, 3)')
+    c_table = zmolecule._give_positional_c_table()
+    C = np.swapaxes(zmat_values, 1, 2).copy()
+    C[:, [1, 2], :] = np.radians(C[:, [1, 2], :])
+
+    if engine == 'numba':
+        with numba_threads(n_jobs):
+            err, rows, X = transformation.get_X_trajectory(C, c_table)
+    elif engine == 'numpy':
+        err, rows, X = transformation.get_X_batched(C, c_table)
+    else:
+        raise ValueError("engine has to be one of 'numba' or 'numpy'")
+    return err, rows, np.swapaxes(X, 1, 2)
+
+
+def interpolate(zm1, zm2, n, minimize_dihedrals=True, as_cartesians=True,
+                n_jobs=None, engine='numba'):
+    """Interpolate linearly between two Zmatrices.
+
+    The internal coordinates of all ``n`` structures are calculated
+    as one array with :class:`~chemcoord.ZmatArray` and transformed
+    to cartesian coordinates in one batched call of
+    :func:`get_cartesian_trajectory`.
+    Compare with the list comprehension of Zmat arithmetic
+    in :meth:`~chemcoord.Zmat.minimize_dihedrals`, which copies and
+    tests every intermediate Zmatrix.
+
+    The result can be written directly as a movie, e.g. with
+    :func:`~chemcoord.xyz_functions.to_molden`.
+
+    Args:
+        zm1 (:class:`~chemcoord.Zmat`): The first structure.
+        zm2 (:class:`~chemcoord.Zmat`): The last structure.
+            It has to use the same atoms and construction table as
+            ``zm1``.
+        n (int): The number of structures including both ends.
+        minimize_dihedrals (bool): Use the change in the dihedrals with
+            the smallest absolute value. Explained in
+            :meth:`~chemcoord.Zmat.minimize_dihedrals`.
+        as_cartesians (bool): Return a list of
+            :class:`~chemcoord.Cartesian` or a single array of
+            coordinates.
+        n_jobs (int): The number of threads. The default is specified in
+            ``settings['defaults']['n_jobs']``.
+        engine (str): Explained in :func:`get_cartesian_trajectory`.
+
+    Returns:
+        list: A list of :class:`~chemcoord.Cartesian` or, if
+        ``as_cartesians`` is False, a :class:`numpy.ndarray` of shape
+        ``(n, n_atoms, 3)`` in the order of ``zm1.index``.
+
+    Raises:
+        :class:`~chemcoord.exceptions.InvalidReference`: If an
+        intermediate structure uses an invalid reference, that can not
+        be replaced by dummy atoms.
+    """
+    za1 = zm1.get_zmat_array()
+    D = zm2.get_zmat_array() - za1
+    if minimize_dihedrals:
+        D = D.minimize_dihedrals()
+    frames = za1 + D * np.linspace(0., 1., n)[:, None, None]
+    err, _, positions = _give_cartesian_trajectory(
+        frames.zmat, frames.values, n_jobs, engine)
+    # Frames with invalid references are built one by one with dummy atoms
+    for frame in np.nonzero(err == ERR_CODE_InvalidReference)[0]:
+        zmat = zm1.copy()
+        zmat.safe_loc[zm1.index, ['bond', 'angle', 'dihedral']] = \
+            frames.values[frame]
+        positions[frame] = zmat.get_cartesian().loc[
+            zm1.index, ['x', 'y', 'z']].values
+    if not as_cartesians:
+        return positions
+    from chemcoord.cartesian_coordinates.cartesian_class_main import \
+        Cartesian
+    atoms = zm1['atom'].values
+    return [Cartesian(atoms=atoms, coords=frame_positions, index=zm1.index,
+                      metadata=zm1.metadata)
+            for frame_positions in positions]
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, with_statement)
+
+import hashlib
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from scipy.sparse import issparse
+
+from chemcoord.configuration import settings
+
+CacheInfo = namedtuple('CacheInfo',
+                       ['hits', 'misses', 'n_entries', 'currsize', 'maxsize'])
+
+
+def give_array_key(*args):
+    """Return a hash of arrays and hashable parameters.
+
+    Arrays are hashed by their dtype, shape and content.
+    """
+    sha = hashlib.sha1()
+    for arg in args:
+        if isinstance(arg, np.ndarray):
+            arg = np.ascontiguousarray(arg)
+            sha.update(repr((arg.dtype.str, arg.shape)).encode())
+            sha.update(arg.data)
+        else:
+            sha.update(repr(arg).encode())
+    return sha.hexdigest()
+
+
+def _give_nbytes(value):
+    if issparse(value):
+        return sum(getattr(value, attr).nbytes
+                   for attr in ['data', 'indices', 'indptr'])
+    return value.nbytes
+
+
+def _set_read_only(value):
+    if issparse(value):
+        value.data.flags.writeable = False
+    else:
+        value.flags.writeable = False
+
+
+class ArrayCache(object):
+    """Least recently used cache for arrays with a memory bound.
+
+    The memory bound in bytes is read from ``settings['defaults'][setting]``
+    on every insertion, so the cache can be resized and switched off
+    at runtime. A bound of zero disables the cache.
+    Cached arrays are returned without copying and are read only.
+
+    Args:
+        setting (str): The key in ``settings['defaults']``.
+    """
+    def __init__(self, setting):
+        self.setting = setting
+        self._entries = OrderedDict()
+        self._currsize = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self):
+        return settings['defaults'][self.setting]
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def get(self, key):
+        """Return the cached value for ``key`` or None."""
+        try:
+            value, nbytes = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries[key] = (value, nbytes)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Cache ``value`` and evict the least recently used values."""
+        nbytes = _give_nbytes(value)
+        if key in self._entries:
+            self._currsize -= self._entries.pop(key)[1]
+        while self._entries and self._currsize + nbytes > self.maxsize:
+            self._currsize -= self._entries.popitem(last=False)[1][1]
+        if nbytes <= self.maxsize:
+            _set_read_only(value)
+            self._entries[key] = (value, nbytes)
+            self._currsize += nbytes
+
+    def info(self):
+        """Return the statistics of the cache as :class:`CacheInfo`."""
+        return CacheInfo(self.hits, self.misses, len(self._entries),
+                         self._currsize, self.maxsize)
+
+    def clear(self):
+        """Remove all entries and reset the statistics."""
+        self._entries.clear()
+        self._currsize = 0
+        self.hits = 0
+        self.misses = 0
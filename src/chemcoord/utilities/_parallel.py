@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, with_statement)
+
+from contextlib import contextmanager
+
+import numba as nb
+
+from chemcoord.configuration import settings
+
+
+def get_n_jobs(n_jobs=None):
+    """Return the number of threads to use.
+
+    Args:
+        n_jobs (int): The number of threads. Negative values count
+            backwards from the number of available cores, i.e. ``-1``
+            uses all cores, ``-2`` all but one...
+            The default is specified in ``settings['defaults']['n_jobs']``.
+
+    Returns:
+        int: A number between 1 and the number of available cores.
+    """
+    if n_jobs is None:
+        n_jobs = settings['defaults']['n_jobs']
+    n_cores = nb.config.NUMBA_NUM_THREADS
+    if n_jobs < 0:
+        n_jobs = n_cores + 1 + n_jobs
+    return max(1, min(n_jobs, n_cores))
+
+
+@contextmanager
+def numba_threads(n_jobs=None):
+    """Set the number of threads used by parallel numba kernels.
+
+    The previous number of threads is restored on exit.
+    numba<0.49 can not change the number of threads at runtime,
+    so there all ``NUMBA_NUM_THREADS`` are used.
+    """
+    if not hasattr(nb, 'set_num_threads'):
+        yield
+        return
+    old_n_threads = nb.get_num_threads()
+    nb.set_num_threads(get_n_jobs(n_jobs))
+    try:
+        yield
+    finally:
+        nb.set_num_threads(old_n_threads)
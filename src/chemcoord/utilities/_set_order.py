@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Iteration order of python sets for arrays of keys.
+
+Former pure python implementations iterated over sets, so results
+depended on the order of the set iteration, if there were ties.
+The functions in this module reproduce this order for keys,
+that are given by their position, and the hashes of their labels.
+They follow the hash table of CPython's ``setobject.c``.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, with_statement)
+
+import numpy as np
+from numba import jit
+
+_MIN_SIZE = 8
+_LINEAR_PROBES = 9
+_PERTURB_SHIFT = 5
+
+
+def give_hashes(labels):
+    """Return the hashes of ``labels`` as unsigned 64 bit integers."""
+    return np.array([hash(label) for label in labels],
+                    dtype='i8').view('u8')
+
+
+@jit(nopython=True, cache=True)
+def _insert_clean(table, hashes, key):
+    mask = np.uint64(len(table) - 1)
+    perturb = hashes[key]
+    i = perturb & mask
+    while True:
+        if table[i] == -1:
+            table[i] = key
+            return
+        if i + np.uint64(_LINEAR_PROBES) <= mask:
+            for j in range(1, _LINEAR_PROBES + 1):
+                if table[i + np.uint64(j)] == -1:
+                    table[i + np.uint64(j)] = key
+                    return
+        perturb >>= np.uint64(_PERTURB_SHIFT)
+        i = (i * np.uint64(5) + np.uint64(1) + perturb) & mask
+
+
+@jit(nopython=True, cache=True)
+def _give_table(keys, hashes, size):
+    table = np.full(size, -1, dtype=np.int64)
+    for key in keys:
+        _insert_clean(table, hashes, key)
+    return table
+
+
+@jit(nopython=True, cache=True)
+def _give_table_size(min_used):
+    size = _MIN_SIZE
+    while size <= min_used:
+        size *= 2
+    return size
+
+
+@jit(nopython=True, cache=True)
+def set_order(keys, hashes):
+    """Emulate ``set(keys)`` for distinct keys.
+
+    Returns:
+        tuple: The keys in iteration order and the size of the table.
+    """
+    table = np.full(_MIN_SIZE, -1, dtype=np.int64)
+    fill = 0
+    for key in keys:
+        _insert_clean(table, hashes, key)
+        fill += 1
+        if fill * 5 >= (len(table) - 1) * 3:
+            min_used = fill * 4 if fill <= 50000 else fill * 2
+            table = _give_table(table[table != -1], hashes,
+                                _give_table_size(min_used))
+    return table[table != -1], len(table)
+
+
+@jit(nopython=True, cache=True)
+def copy_order(keys, size, hashes):
+    """Emulate ``set().update(other)``.
+
+    ``other`` iterates as ``keys`` and has a table of ``size``.
+
+    Returns:
+        tuple: The keys in iteration order and the size of the table.
+    """
+    new_size = _MIN_SIZE
+    if len(keys) * 5 >= (_MIN_SIZE - 1) * 3:
+        new_size = _give_table_size(2 * len(keys))
+    if new_size == size:
+        return keys, size
+    table = _give_table(keys, hashes, new_size)
+    return table[table != -1], new_size
+
+
+@jit(nopython=True, cache=True)
+def difference_order(keys, size, keep, n_other, hashes):
+    """Emulate ``so - other``.
+
+    ``so`` iterates as ``keys`` and has a table of ``size``,
+    ``keep`` marks the keys not in ``other``
+    and ``n_other`` is the length of ``other``.
+
+    Returns:
+        tuple: The keys in iteration order and the size of the table.
+    """
+    if (len(keys) >> 2) > n_other:
+        # so is copied and the common keys are discarded
+        discarded = keys[~keep]
+        keys, size = copy_order(keys, size, hashes)
+        keep = np.ones(len(keys), dtype=np.bool_)
+        for i in range(len(keys)):
+            for key in discarded:
+                if keys[i] == key:
+                    keep[i] = False
+        return keys[keep], size
+    return set_order(keys[keep], hashes)
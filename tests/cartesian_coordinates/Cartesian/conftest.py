@@ -0,0 +1,21 @@
+from __future__ import with_statement
+from __future__ import division
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import chemcoord as cc
+import pytest
+
+
+@pytest.fixture
+def give_two_copies():
+    def give_two_copies(molecule):
+        """Return a copy of molecule, shifted by 50 Angstrom along x
+        and indexed after molecule, and the concatenation of both.
+        """
+        shifted = molecule.copy()
+        shifted.index = shifted.index + len(molecule)
+        shifted.loc[:, 'x'] += 50.
+        return shifted, cc.xyz_functions.concat([molecule, shifted])
+    return give_two_copies
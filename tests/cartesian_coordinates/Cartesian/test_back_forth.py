@@ -103,3 +103,85 @@ def test_issue_18():
 
     for i, j in itertools.product(structures, structures):
         assert cc.xyz_functions.allclose(i, j, align=False)
+
+
+def test_correct_dihedral():
+    path = os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz')
+    molecule = cc.Cartesian.read_xyz(path, start_index=1)
+    c_table = molecule.get_construction_table(perform_checks=False)
+    # Use a reference atom on the line through b and a for every dihedral.
+    for i in c_table.index[3:]:
+        c_table.loc[i, 'd'] = c_table.loc[i, 'b']
+    c_table = molecule.correct_dihedral(c_table)
+    angles = molecule.get_angle_degrees(
+        c_table.loc[c_table.index[3:], ['b', 'a', 'd']].values)
+    assert ((5 < angles) & (angles < 175)).all()
+    zmolecule = molecule.get_zmat(c_table)
+    assert allclose(molecule, zmolecule.get_cartesian(), align=False,
+                    atol=1e-6)
+
+
+def test_construction_table_is_stable():
+    # Ties between bonded atoms of equal valency are broken as in
+    # previous versions.
+    path = os.path.join(STRUCTURE_PATH, 'ruthenium.xyz')
+    c_table = cc.Cartesian.read_xyz(path).get_construction_table()
+    assert list(c_table.index) == [
+        0, 1, 5, 9, 13, 17, 21, 2, 3, 4, 8, 6, 7, 10, 11, 12, 16, 14,
+        15, 18, 19, 20, 22, 23, 24, 25, 26, 27, 28, 29, 30]
+    assert c_table.values.tolist() == [
+        ['origin', 'e_z', 'e_x'],
+        [0, 'e_z', 'e_x'],
+        [0, 1, 'e_x'],
+        [0, 1, 5],
+        [0, 1, 5],
+        [0, 1, 13],
+        [0, 1, 5],
+        [1, 0, 5],
+        [1, 0, 5],
+        [1, 0, 5],
+        [5, 0, 1],
+        [5, 0, 1],
+        [5, 0, 1],
+        [9, 0, 17],
+        [9, 0, 17],
+        [9, 0, 17],
+        [13, 0, 1],
+        [13, 0, 1],
+        [13, 0, 1],
+        [17, 0, 1],
+        [17, 0, 1],
+        [17, 0, 1],
+        [21, 0, 1],
+        [21, 0, 1],
+        [22, 21, 0],
+        [22, 21, 0],
+        [23, 21, 0],
+        [23, 21, 0],
+        [26, 23, 21],
+        [24, 22, 21],
+        [26, 23, 21]]
+
+
+def test_construction_table_of_fragments():
+    # Fragments of the same size are in the order of their first atom.
+    path = os.path.join(STRUCTURE_PATH, 'Cd_lattice.xyz')
+    c_table = cc.Cartesian.read_xyz(path).get_construction_table()
+    assert list(c_table.index) == [
+        7, 24, 27, 44, 36, 51, 0, 1, 2, 3, 4, 5, 6, 8, 9, 10, 11, 12,
+        13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 25, 26, 28, 29,
+        30, 31, 32, 33, 34, 35, 37, 38, 39, 40, 41, 42, 43, 45, 46,
+        47, 48, 49, 50, 52, 53, 54, 55]
+    assert c_table.values.tolist() == [
+        ['origin', 'e_z', 'e_x'], [7, 'e_z', 'e_x'], [7, 24, 'e_x'],
+        [27, 7, 24], [24, 7, 27], [36, 24, 7], [24, 7, 27], [7, 27, 44],
+        [7, 27, 44], [7, 27, 44], [27, 7, 24], [27, 7, 24], [24, 7, 27],
+        [7, 27, 44], [0, 24, 7], [36, 24, 7], [4, 27, 7], [27, 7, 24],
+        [0, 24, 7], [3, 7, 27], [7, 27, 44], [24, 7, 27], [36, 24, 7],
+        [14, 3, 7], [2, 7, 27], [6, 24, 7], [6, 24, 7], [4, 27, 7], [8, 7, 27],
+        [11, 4, 27], [6, 24, 7], [12, 27, 7], [2, 7, 27], [10, 36, 24],
+        [13, 0, 24], [1, 7, 27], [15, 7, 27], [9, 0, 24], [11, 4, 27],
+        [8, 7, 27], [3, 7, 27], [10, 36, 24], [12, 27, 7], [2, 7, 27],
+        [4, 27, 7], [1, 7, 27], [9, 0, 24], [13, 0, 24], [3, 7, 27],
+        [18, 14, 3], [15, 7, 27], [13, 0, 24], [17, 36, 24], [18, 14, 3],
+        [14, 3, 7], [18, 14, 3]]
@@ -175,6 +175,33 @@ def test_cut_sphere():
                                        outside_sliced=False).index))
 
 
+def test_cut_spheres():
+    sphere_7 = set(molecule.cut_sphere(radius=3, origin=7).index)
+    sphere_30 = set(molecule.cut_sphere(radius=3, origin=30).index)
+    assert (sphere_7 | sphere_30
+            == set(molecule.cut_spheres(radius=3, origins=[7, 30]).index))
+    origins = molecule.loc[[7, 30], ['x', 'y', 'z']].values
+    assert (set(molecule.index) - sphere_7 - sphere_30
+            == set(molecule.cut_spheres(radius=3, origins=origins,
+                                        outside_sliced=False).index))
+    assert np.alltrue(
+        molecule == molecule.cut_spheres(radius=3, origins=[7, 30],
+                                         preserve_bonds=True))
+
+    # A one dimensional float array of length three is one position
+    assert sphere_7 == set(molecule.cut_spheres(
+        radius=3, origins=molecule.loc[7, ['x', 'y', 'z']].values).index)
+    assert sphere_7 == set(molecule.cut_spheres(
+        radius=3, origins=list(origins[0].astype('f8'))).index)
+    # Three integers are still indices
+    sphere_31 = set(molecule.cut_sphere(radius=3, origin=31).index)
+    assert (sphere_7 | sphere_30 | sphere_31
+            == set(molecule.cut_spheres(radius=3,
+                                        origins=[7, 30, 31]).index))
+    with pytest.raises(ValueError):
+        molecule.cut_spheres(radius=3, origins=origins.reshape((1, 2, 3)))
+
+
 def test_cut_cuboid():
     expected = {3, 4, 5, 6, 7, 15, 16, 17, 32, 35, 37, 38, 47, 52, 53, 55, 56}
     assert expected == set(molecule.cut_cuboid(a=2, origin=7).index)
@@ -232,6 +259,87 @@ def test_partition_chem_env():
     assert xpctd == molecule.partition_chem_env()
 
 
+def test_partition_chem_env_hashed():
+    shuffled = molecule.copy()
+    np.random.seed(77)
+    shuffled.index = np.random.permutation(molecule.index)
+    for n_sphere in [1, 2, 4]:
+        partition = molecule.partition_chem_env(n_sphere, engine='hash')
+        spheres = molecule.partition_chem_env(n_sphere).items()
+        for (element, _), indices in partition.items():
+            assert set(molecule.loc[indices, 'atom']) == {element}
+            assert any(indices <= other for _, other in spheres)
+
+        renamed = dict(zip(shuffled.index, molecule.index))
+        shuffled_partition = shuffled.partition_chem_env(
+            n_sphere, engine='hash')
+        assert partition.keys() == shuffled_partition.keys()
+        for key in partition:
+            assert partition[key] == {
+                renamed[i] for i in shuffled_partition[key]}
+
+    # The keys do not depend on the numpy version
+    water = cc.Cartesian.read_xyz(get_complete_path('water.xyz'),
+                                  start_index=1)
+    assert water.partition_chem_env(0, engine='hash') == {
+        ('O', 624052897831729513): {1, 4},
+        ('H', 9003123316927157634): {2, 3, 5, 6}}
+
+    assert cc.xyz_functions.allclose(
+        molecule, molecule.reindex_similar(shuffled))
+    with pytest.raises(ValueError):
+        molecule.partition_chem_env(engine='unknown')
+
+
+def test_reindex_similar_assignment():
+    def total_distance(reindexed):
+        return np.linalg.norm(
+            (reindexed.loc[molecule.index, ['x', 'y', 'z']]
+             - molecule.loc[:, ['x', 'y', 'z']]).values.astype('f8'),
+            axis=1).sum()
+
+    np.random.seed(3)
+    shuffled = molecule.copy()
+    shuffled.index = np.random.permutation(molecule.index)
+    for assignment in ['optimal', 'greedy']:
+        assert cc.xyz_functions.allclose(
+            molecule, molecule.reindex_similar(shuffled,
+                                               assignment=assignment))
+
+    # With n_sphere=0 the atoms are only partitioned by their element,
+    # so large displacements give ambiguous nearest neighbours
+    shuffled.loc[:, ['x', 'y', 'z']] += np.random.normal(
+        scale=1., size=(len(molecule), 3))
+    optimal = molecule.reindex_similar(shuffled, n_sphere=0)
+    greedy = molecule.reindex_similar(shuffled, n_sphere=0,
+                                      assignment='greedy')
+    assert set(optimal.index) == set(molecule.index)
+    assert total_distance(optimal) < total_distance(greedy)
+
+    # Same total distance as the assignment on the dense distance matrices
+    from scipy.optimize import linear_sum_assignment
+    from scipy.spatial.distance import cdist
+    expected = 0.
+    for element in set(molecule['atom']):
+        distances = cdist(
+            molecule.loc[molecule['atom'] == element,
+                         ['x', 'y', 'z']].values.astype('f8'),
+            shuffled.loc[shuffled['atom'] == element,
+                         ['x', 'y', 'z']].values.astype('f8'))
+        rows, cols = linear_sum_assignment(distances)
+        expected += distances[rows, cols].sum()
+    assert np.isclose(total_distance(optimal), expected)
+
+    # Atoms at the same position give a cutoff of zero at first
+    stacked = cc.Cartesian(atoms=['H'] * 9, coords=np.zeros((9, 3)))
+    other = stacked.copy()
+    other.loc[0, 'x'] = 1.
+    assert set(stacked.reindex_similar(other, n_sphere=0).index) == set(
+        range(9))
+    with pytest.raises(ValueError):
+        molecule.reindex_similar(shuffled, assignment='unknown')
+
+
 def test_change_numbering():
     molecule2 = molecule.copy()
     molecule2.index = reversed(molecule.index)
@@ -53,6 +53,21 @@ def test_fragmentate():
     assert np.alltrue(fragments[0] == molecule)
 
 
+def test_fragmentate_several_fragments(give_two_copies):
+    shifted, molecules = give_two_copies(molecule)
+    fragments = molecules.fragmentate()
+    assert [set(fragment.index) for fragment in fragments] == [
+        set(molecule.index), set(shifted.index)]
+    assert molecules.fragmentate(give_only_index=True) == [
+        set(molecule.index), set(shifted.index)]
+    assert fragments[0].get_bonds(use_lookup=True) == molecule.get_bonds()
+
+    without = molecules.get_without(fragments[1])
+    assert len(without) == 1
+    assert set(without[0].index) == set(molecule.index)
+    assert without[0].get_bonds(use_lookup=True) == molecule.get_bonds()
+
+
 def test_get_shortest_distance():
     i, j, d = molecule.get_shortest_distance(molecule + [0, 0, 10])
     assert (i, j) == (27, 24)
@@ -34,3 +34,162 @@ def test_water():
     molecule = molecule - molecule.loc[5, ['x', 'y', 'z']]
     expected = {1: {2, 3}, 2: {1}, 3: {1}, 4: {5, 6}, 5: {4}, 6: {4}}
     assert molecule.get_bonds() == expected
+
+
+def test_engines():
+    for name in ['MIL53_small.xyz', 'MIL53_middle.xyz', 'nasty_cube.xyz']:
+        molecule = cc.Cartesian.read_xyz(os.path.join(STRUCTURES, name))
+        expected = molecule.get_bonds(engine='blocks')
+        assert molecule.get_bonds(engine='cell_list') == expected
+        for key in expected:
+            assert molecule.get_bonds(
+                engine='cell_list', self_bonding_allowed=True)[key] \
+                == expected[key] | {key}
+    with pytest.raises(ValueError):
+        molecule.get_bonds(engine='unknown')
+
+
+def test_connectivity():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'MIL53_small.xyz'), start_index=1)
+    bond_dict = molecule.get_bonds()
+    connectivity = molecule.get_connectivity()
+    assert isinstance(connectivity, cc.Connectivity)
+    assert molecule.get_connectivity(use_lookup=True) is connectivity
+    assert connectivity == bond_dict
+    assert connectivity.to_bond_dict() == bond_dict
+    assert cc.Connectivity.from_bond_dict(bond_dict) == bond_dict
+    assert connectivity.n_bonds == sum(map(len, bond_dict.values())) // 2
+    adjacency = connectivity.get_adjacency_matrix()
+    assert (adjacency != adjacency.T).nnz == 0
+    assert adjacency.sum() == len(connectivity.indices)
+
+    fragment = molecule.get_coordination_sphere(
+        1, n_sphere=2, only_surface=False)
+    assert (connectivity.subgraph(fragment.index)
+            == fragment.restrict_bond_dict(bond_dict))
+    assert fragment.get_connectivity(use_lookup=True) == fragment.get_bonds()
+
+
+def test_fragment_labels(give_two_copies):
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'MIL53_small.xyz'), start_index=1)
+    shifted, both = give_two_copies(molecule)
+    connectivity = both.get_connectivity()
+
+    labels = connectivity.get_fragment_labels()
+    assert (labels == np.repeat([0, 1], len(molecule))).all()
+    parts = connectivity.split(labels)
+    assert [list(part.index) for part in parts] == [
+        list(molecule.index), list(shifted.index)]
+    assert parts[0] == connectivity.subgraph(molecule.index)
+    assert parts[1] == connectivity.subgraph(shifted.index)
+
+
+def test_bond_preserving_mask(give_two_copies):
+    connectivity = cc.Connectivity.from_bond_dict(
+        {0: {1}, 1: {0, 2}, 2: {1, 3}, 3: {2, 4}, 4: {3}, 5: set(),
+         6: {7}, 7: {6}})
+    mask = connectivity.index.isin([2])
+    assert (connectivity.get_bond_preserving_mask(mask)
+            == [True] * 5 + [False] * 3).all()
+    mask = connectivity.index.isin([5, 7])
+    assert (connectivity.get_bond_preserving_mask(mask)
+            == [False] * 5 + [True] * 3).all()
+
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'MIL53_small.xyz'), start_index=1)
+    shifted, both = give_two_copies(molecule)
+    assert set(both.cut_sphere(radius=3, origin=7, preserve_bonds=True).index
+               ) == set(molecule.index)
+
+
+def test_coordination_spheres():
+    from scipy.sparse.csgraph import shortest_path
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'nasty_cube.xyz'), start_index=1)
+    connectivity = molecule.get_connectivity()
+    distances = shortest_path(connectivity.get_adjacency_matrix(),
+                              unweighted=True)
+    centres = [1, 7, 20]
+    rows = molecule.index.get_indexer(centres)
+    for n_sphere in range(4):
+        sphere_ptr, spheres = molecule.get_coordination_spheres(
+            centres, n_sphere=n_sphere)
+        assert len(sphere_ptr) == len(centres) + 1
+        full_ptr, full = molecule.get_coordination_spheres(
+            centres, n_sphere=n_sphere, only_surface=False)
+        for k, (i, row) in enumerate(zip(centres, rows)):
+            surface = set(spheres[sphere_ptr[k]:sphere_ptr[k + 1]])
+            ball = full[full_ptr[k]:full_ptr[k + 1]]
+            assert surface == set(
+                molecule.index[distances[row] == n_sphere])
+            assert set(ball) == set(
+                molecule.index[distances[row] <= n_sphere])
+            assert ball[0] == i
+            assert surface == set(
+                molecule.get_coordination_sphere(i, n_sphere=n_sphere).index)
+
+    excluded = [2, 3]
+    adjacency = connectivity.get_adjacency_matrix().tolil()
+    adjacency[molecule.index.get_indexer(excluded), :] = 0
+    adjacency[:, molecule.index.get_indexer(excluded)] = 0
+    distances = shortest_path(adjacency.tocsr(), unweighted=True)
+    sphere_ptr, spheres = molecule.get_coordination_spheres(
+        [1], n_sphere=np.inf, only_surface=False, exclude=set(excluded))
+    assert set(spheres) == set(
+        molecule.index[np.isfinite(distances[0])])
+    with pytest.raises(KeyError):
+        molecule.get_coordination_spheres([0])
+
+
+def test_n_jobs():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'MIL53_middle.xyz'))
+    expected = molecule.get_bonds(n_jobs=1)
+    for engine in ['cell_list', 'blocks']:
+        assert molecule.get_bonds(engine=engine, n_jobs=-1) == expected
+
+
+def test_update_connectivity():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'MIL53_middle.xyz'), start_index=1)
+    molecule.get_bonds()
+    unchanged = molecule.get_connectivity(use_lookup=True)
+    assert molecule.update_connectivity() is unchanged
+
+    np.random.seed(0)
+    moved = np.random.choice(molecule.index, 20, replace=False)
+    molecule.loc[moved, ['x', 'y', 'z']] += np.random.normal(
+        scale=0.5, size=(20, 3))
+    molecule.loc[moved[:3], 'atom'] = 'H'
+    molecule.update_connectivity()
+    updated = molecule.get_bonds(use_lookup=True)
+    assert updated == molecule.get_bonds()
+    assert molecule.update_connectivity() == updated
+
+    # Few moved atoms reuse the cached search tree of earlier updates
+    for _ in range(5):
+        moved = np.random.choice(molecule.index, 2, replace=False)
+        molecule.loc[moved, ['x', 'y', 'z']] += np.random.normal(
+            scale=0.5, size=(2, 3))
+        assert molecule.update_connectivity() == molecule.get_bonds()
+
+
+def test_lookup_invalidation():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'water.xyz'), start_index=1)
+    bond_dict = molecule.get_bonds(use_lookup=True)
+    assert molecule.get_bonds(use_lookup=True) is bond_dict
+    assert molecule.copy().get_bonds(use_lookup=True) == bond_dict
+
+    molecule.loc[2, 'x'] += 5
+    changed = molecule.get_bonds(use_lookup=True)
+    assert changed[1] == {3}
+    assert changed == molecule.get_bonds(use_lookup=False)
+
+    molecule.index = range(6)
+    assert set(molecule.get_bonds(use_lookup=True)) == set(range(6))
+
+    modified = molecule.get_bonds(modified_properties={0: 0.})
+    assert modified != molecule.get_bonds(use_lookup=True)
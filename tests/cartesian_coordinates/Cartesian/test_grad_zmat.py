@@ -12,6 +12,7 @@ import pytest
 import sympy
 from chemcoord.exceptions import UndefinedCoordinateSystem
 from chemcoord.xyz_functions import allclose
+from scipy.sparse import issparse
 
 
 def get_script_path():
@@ -55,3 +56,176 @@ def test_grad_zmat():
     assert moved_atoms[0] == 13
     assert np.alltrue(
         moved_atoms[1:] == c_table.index[(c_table == 13).any(axis=1)])
+
+
+def test_sparse_grad_zmat():
+    path = os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz')
+    molecule = cc.Cartesian.read_xyz(path, start_index=1)
+    c_table = molecule.get_construction_table()
+    molecule = molecule.loc[c_table.index]
+    n_atoms = len(molecule)
+
+    dense = molecule.get_grad_zmat(c_table, as_function=False)
+    sparse = molecule.get_grad_zmat(c_table, as_function=False, sparse=True)
+    assert sparse.shape == (3 * n_atoms, 3 * n_atoms)
+    assert sparse.nnz <= 4 * 9 * n_atoms
+    assert np.allclose(
+        sparse.toarray(),
+        dense.transpose(1, 0, 2, 3).reshape(3 * n_atoms, 3 * n_atoms))
+
+    dist_mol = molecule.copy()
+    dist_mol.loc[:, ['x', 'y', 'z']] = np.random.RandomState(4).normal(
+        size=(n_atoms, 3))
+    coords = ['bond', 'angle', 'dihedral']
+    expected = molecule.get_grad_zmat(c_table)(dist_mol).loc[:, coords]
+    result = molecule.get_grad_zmat(c_table, sparse=True)(dist_mol)
+    assert np.allclose(result.loc[:, coords].values.astype('f8'),
+                       expected.values.astype('f8'))
+
+
+def test_apply_grad_zmat():
+    path = os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz')
+    molecule = cc.Cartesian.read_xyz(path, start_index=1)
+    c_table = molecule.get_construction_table()
+    molecule = molecule.loc[c_table.index]
+    zmolecule = molecule.get_zmat(c_table)
+    random = np.random.RandomState(6)
+    coords = ['bond', 'angle', 'dihedral']
+
+    dist_mol = molecule.copy()
+    dist_mol.loc[:, ['x', 'y', 'z']] = random.normal(size=(len(molecule), 3))
+    expected = molecule.get_grad_zmat(c_table)(dist_mol).loc[:, coords]
+    result = cc.xyz_functions.apply_grad_zmat(molecule, c_table, dist_mol)
+    assert np.allclose(result.loc[:, coords].values.astype('f8'),
+                       expected.values.astype('f8'))
+
+    zmat_grad = zmolecule.copy()
+    zmat_grad.unsafe_loc[:, coords] = random.normal(size=(len(molecule), 3))
+    cart_grad = cc.xyz_functions.apply_grad_zmat_transpose(
+        molecule, c_table, zmat_grad)
+    assert np.isclose(
+        (cart_grad.loc[:, ['x', 'y', 'z']].values
+         * dist_mol.loc[:, ['x', 'y', 'z']].values).sum(),
+        (zmat_grad.loc[:, coords].values.astype('f8')
+         * result.loc[:, coords].values.astype('f8')).sum())
+
+
+def test_grad_B():
+    from chemcoord.cartesian_coordinates._cart_transformation import (
+        get_B, get_grad_B)
+    X = np.random.RandomState(8).normal(size=(3, 4))
+    c_table = np.array([[1], [2], [3]])
+    grad_B = get_grad_B(X, c_table, 0)
+    h = 1e-6
+    for m, l in itertools.product(range(3), range(3)):
+        X_plus, X_minus = X.copy(), X.copy()
+        X_plus[l, m + 1] += h
+        X_minus[l, m + 1] -= h
+        expected = (get_B(X_plus, c_table, 0)[1]
+                    - get_B(X_minus, c_table, 0)[1]) / (2 * h)
+        assert np.allclose(grad_B[:, :, m, l], expected, atol=1e-6)
+
+
+def test_grad_B_regression():
+    # Values of the fully expanded expressions, generated with
+    # dev/grad_B_expanded.py
+    from chemcoord.cartesian_coordinates._cart_transformation import \
+        get_grad_B
+    reference = np.load(os.path.join(STRUCTURE_PATH, 'grad_B_reference.npz'))
+    c_table = np.array([[1], [2], [3]])
+    for X, expected in zip(reference['X'], reference['grad_B']):
+        # Entries close to zero suffer from cancellation, so the
+        # tolerance is relative to the largest entry.
+        scale = np.abs(expected).max()
+        assert np.allclose(get_grad_B(X, c_table, 0) / scale,
+                           expected / scale, rtol=1e-14, atol=1e-14)
+
+
+def test_parallel_grad_zmat():
+    path = os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz')
+    molecule = cc.Cartesian.read_xyz(path, start_index=1)
+    c_table = molecule.get_construction_table()
+    molecule = molecule.loc[c_table.index]
+
+    serial = molecule.get_grad_zmat(c_table, as_function=False)
+    parallel = molecule.get_grad_zmat(c_table, as_function=False, n_jobs=2)
+    assert np.allclose(serial, parallel)
+    serial = molecule.get_grad_zmat(c_table, as_function=False, sparse=True)
+    parallel = molecule.get_grad_zmat(c_table, as_function=False,
+                                      sparse=True, n_jobs=2)
+    assert np.allclose(serial.toarray(), parallel.toarray())
+
+
+def test_grad_zmat_cache():
+    path = os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz')
+    molecule = cc.Cartesian.read_xyz(path, start_index=1)
+    c_table = molecule.get_construction_table()
+    molecule = molecule.loc[c_table.index]
+    expected = molecule.get_grad_zmat(c_table, as_function=False)
+
+    old_size = cc.settings['defaults']['grad_cache_size']
+    cc.settings['defaults']['grad_cache_size'] = 2 * expected.nbytes
+    cc.xyz_functions.clear_grad_zmat_cache()
+    try:
+        grad_C = molecule.get_grad_zmat(c_table, as_function=False)
+        assert np.allclose(grad_C, expected)
+        assert molecule.get_grad_zmat(c_table, as_function=False) is grad_C
+        assert not grad_C.flags.writeable
+        info = cc.xyz_functions.get_grad_zmat_cache_info()
+        assert (info.hits, info.misses, info.n_entries) == (1, 1, 1)
+
+        sparse = molecule.get_grad_zmat(c_table, as_function=False,
+                                        sparse=True)
+        assert np.allclose(
+            sparse.toarray(),
+            expected.transpose(1, 0, 2, 3).reshape(sparse.shape))
+
+        moved = molecule.copy()
+        moved.loc[:, ['x', 'y', 'z']] *= 1.01
+        assert moved.get_grad_zmat(c_table, as_function=False) is not grad_C
+        info = cc.xyz_functions.get_grad_zmat_cache_info()
+        assert info.misses == 3
+        assert info.currsize <= info.maxsize
+        # The least recently used dense gradient was removed
+        assert molecule.get_grad_zmat(c_table, as_function=False) \
+            is not grad_C
+    finally:
+        cc.settings['defaults']['grad_cache_size'] = old_size
+        cc.xyz_functions.clear_grad_zmat_cache()
+
+
+def test_apply_hess_zmat():
+    path = os.path.join(STRUCTURE_PATH, 'water.xyz')
+    molecule = cc.Cartesian.read_xyz(path, start_index=1)
+    rotation = cc.xyz_functions.get_rotation_matrix([1., 2., 3.], 0.7)
+    molecule = cc.xyz_functions.dot(rotation, molecule) + [0.5, -1.2, 2.]
+    c_table = molecule.get_construction_table()
+    zmat_grad = molecule.get_zmat(c_table)
+    zmat_grad.unsafe_loc[:, ['bond', 'angle', 'dihedral']] = \
+        np.random.RandomState(10).normal(size=(len(molecule), 3))
+
+    hess = cc.xyz_functions.apply_hess_zmat(molecule, c_table, zmat_grad)
+    assert hess.shape == (3 * len(molecule), 3 * len(molecule))
+
+    h = 1e-5
+    expected = np.empty(hess.shape)
+    for k, (i, coord) in enumerate(itertools.product(molecule.index, 'xyz')):
+        cart_grads = []
+        for step in [h, -h]:
+            moved = molecule.copy()
+            moved.loc[i, coord] += step
+            cart_grad = cc.xyz_functions.apply_grad_zmat_transpose(
+                moved, c_table, zmat_grad)
+            cart_grads.append(cart_grad.loc[:, ['x', 'y', 'z']].values)
+        expected[:, k] = (cart_grads[0] - cart_grads[1]).ravel() / (2 * h)
+    assert np.allclose(hess.toarray(), expected, atol=1e-6)
+
+    cart_grad = cc.xyz_functions.apply_grad_zmat_transpose(
+        molecule, c_table, zmat_grad)
+    zmat_hess = cc.xyz_functions.transform_hess_to_zmat(
+        molecule, c_table, hess, cart_grad)
+    assert issparse(zmat_hess)
+    assert np.allclose(zmat_hess.toarray(), 0.)
+    assert np.allclose(
+        cc.xyz_functions.transform_hess_to_zmat(
+            molecule, c_table, hess.toarray(), cart_grad), 0.)
@@ -0,0 +1,105 @@
+from __future__ import with_statement
+from __future__ import division
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import chemcoord as cc
+from chemcoord.exceptions import InvalidReference
+import pytest
+import numpy as np
+import os
+import sys
+
+
+def get_script_path():
+    return os.path.dirname(os.path.realpath(__file__))
+
+
+def get_structure_path(script_path):
+    test_path = os.path.join(script_path)
+    while True:
+        structure_path = os.path.join(test_path, 'structures')
+        if os.path.exists(structure_path):
+            return structure_path
+        else:
+            test_path = os.path.join(test_path, '..')
+
+
+STRUCTURES = get_structure_path(get_script_path())
+
+
+def test_zmat_values():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'MIL53_small.xyz'), start_index=1)
+    plan = molecule.get_zmat_plan()
+    c_table = plan.construction_table
+    coords = ['bond', 'angle', 'dihedral']
+
+    frames = (molecule.loc[:, ['x', 'y', 'z']].values[None, :, :]
+              + np.random.RandomState(1).normal(scale=0.05,
+                                                size=(4, len(molecule), 3)))
+    values = plan.get_zmat_values(frames)
+    assert values.shape == (4, len(molecule), 3)
+    for positions, frame_values in zip(frames, values):
+        frame = molecule.copy()
+        frame.loc[:, ['x', 'y', 'z']] = positions
+        expected = frame.get_zmat(c_table).loc[:, coords].values
+        assert np.allclose(plan.get_zmat_values(frame), expected)
+        assert np.allclose(frame_values, expected)
+
+    zmolecule = plan.get_zmat(frames[0])
+    assert (zmolecule.index == c_table.index).all()
+    assert np.allclose(
+        zmolecule.get_cartesian().loc[molecule.index, ['x', 'y', 'z']],
+        frames[0])
+
+
+def test_invalid_reference():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'water.xyz'), start_index=1)
+    plan = molecule.get_zmat_plan()
+    positions = molecule.loc[:, ['x', 'y', 'z']].values
+    positions[:] = 0.
+    with pytest.raises(InvalidReference):
+        plan.get_zmat_values(positions)
+    with pytest.raises(ValueError):
+        plan.get_zmat_values(positions[:2])
+
+
+def test_get_zmat_trajectory():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'MIL53_small.xyz'), start_index=1)
+    c_table = molecule.get_construction_table()
+    frames = (molecule.loc[:, ['x', 'y', 'z']].values[None, :, :]
+              + np.random.RandomState(2).normal(scale=0.05,
+                                                size=(6, len(molecule), 3)))
+    values = cc.xyz_functions.get_zmat_trajectory(molecule, frames, c_table)
+    plan = molecule.get_zmat_plan(c_table)
+    for positions, frame_values in zip(frames, values):
+        assert np.allclose(plan.get_zmat_values(positions), frame_values)
+
+    frames[[1, 4]] = 0.
+    with pytest.raises(InvalidReference) as excinfo:
+        cc.xyz_functions.get_zmat_trajectory(molecule, frames, c_table)
+    assert '[1, 4]' in excinfo.value.message
+
+
+def test_numpy_engine():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'MIL53_small.xyz'), start_index=1)
+    plan = molecule.get_zmat_plan()
+    frames = (molecule.loc[:, ['x', 'y', 'z']].values[None, :, :]
+              + np.random.RandomState(4).normal(scale=0.05,
+                                                size=(3, len(molecule), 3)))
+    assert np.allclose(plan.get_zmat_values(frames, engine='numpy'),
+                       plan.get_zmat_values(frames))
+    assert np.allclose(plan.get_zmat_values(frames[0], engine='numpy'),
+                       plan.get_zmat_values(frames[0]))
+
+    frames[1] = 0.
+    with pytest.raises(InvalidReference) as excinfo:
+        plan.get_zmat_values(frames, engine='numpy')
+    assert '[1]' in excinfo.value.message
+    with pytest.raises(ValueError):
+        plan.get_zmat_values(frames, engine='fortran')
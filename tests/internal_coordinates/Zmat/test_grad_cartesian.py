@@ -11,6 +11,7 @@ import pandas as pd
 import pytest
 from chemcoord.exceptions import UndefinedCoordinateSystem
 from chemcoord.xyz_functions import allclose
+from scipy.sparse import csr_matrix, issparse
 
 
 def get_script_path():
@@ -57,3 +58,119 @@ def test_grad_cartesian():
     index = new.index[~np.isclose(new, 0.).all(axis=1)]
     assert (index
             == [3, 17, 60, 6, 19, 62, 38, 37, 81, 80, 7, 39, 82, 10]).all()
+
+
+def test_grad_cartesian_finite_differences():
+    path = os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz')
+    zmolecule = cc.Cartesian.read_xyz(path, start_index=1).get_zmat()
+    coords = ['bond', 'angle', 'dihedral']
+    dist_zmol = zmolecule.copy()
+    dist_zmol.unsafe_loc[:, coords] = np.random.RandomState(5).normal(
+        scale=0.1, size=(len(zmolecule), 3))
+
+    h = 1e-5
+    moved = zmolecule.copy()
+    moved.unsafe_loc[:, coords] = (zmolecule.loc[:, coords].values
+                                   + h * dist_zmol.loc[:, coords].values)
+    expected = ((moved.get_cartesian() - zmolecule.get_cartesian()) / h)
+    expected = expected.loc[zmolecule.index, ['x', 'y', 'z']].values
+
+    for kwargs in [{}, {'sparse': True}, {'matrix_free': True}]:
+        result = zmolecule.get_grad_cartesian(**kwargs)(dist_zmol)
+        assert np.allclose(result.loc[:, ['x', 'y', 'z']], expected,
+                           atol=1e-4)
+
+    n_atoms = len(zmolecule)
+    dense = zmolecule.get_grad_cartesian(as_function=False)
+    sparse = zmolecule.get_grad_cartesian(as_function=False, sparse=True)
+    assert np.allclose(
+        sparse.toarray(),
+        dense.transpose(1, 0, 2, 3).reshape(3 * n_atoms, 3 * n_atoms))
+
+
+def test_apply_grad_cartesian():
+    path = os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz')
+    molecule = cc.Cartesian.read_xyz(path, start_index=1)
+    zmolecule = molecule.get_zmat()
+    random = np.random.RandomState(7)
+    coords = ['bond', 'angle', 'dihedral']
+
+    dist_zmol = zmolecule.copy()
+    dist_zmol.unsafe_loc[:, coords] = random.normal(size=(len(molecule), 3))
+    expected = zmolecule.get_grad_cartesian()(dist_zmol)
+    result = cc.zmat_functions.apply_grad_cartesian(zmolecule, dist_zmol)
+    assert np.allclose(result.loc[expected.index, ['x', 'y', 'z']],
+                       expected.loc[:, ['x', 'y', 'z']])
+
+    cart_grad = molecule.copy()
+    cart_grad.loc[:, ['x', 'y', 'z']] = random.normal(size=(len(molecule), 3))
+    zmat_grad = cc.zmat_functions.apply_grad_cartesian_transpose(
+        zmolecule, cart_grad)
+    assert np.isclose(
+        (zmat_grad.loc[zmolecule.index, coords].values.astype('f8')
+         * dist_zmol.loc[:, coords].values.astype('f8')).sum(),
+        (cart_grad.loc[result.index, ['x', 'y', 'z']].values
+         * result.loc[:, ['x', 'y', 'z']].values).sum())
+
+
+def test_parallel_grad_cartesian():
+    path = os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz')
+    zmolecule = cc.Cartesian.read_xyz(path, start_index=1).get_zmat()
+    coords = ['bond', 'angle', 'dihedral']
+    dist_zmol = zmolecule.copy()
+    dist_zmol.unsafe_loc[:, coords] = np.random.RandomState(9).normal(
+        size=(len(zmolecule), 3))
+
+    for chain in [True, False]:
+        serial = zmolecule.get_grad_cartesian(as_function=False, chain=chain)
+        parallel = zmolecule.get_grad_cartesian(as_function=False,
+                                                chain=chain, n_jobs=2)
+        assert np.allclose(serial, parallel)
+        serial = zmolecule.get_grad_cartesian(as_function=False, chain=chain,
+                                              sparse=True)
+        parallel = zmolecule.get_grad_cartesian(
+            as_function=False, chain=chain, sparse=True, n_jobs=2)
+        assert np.allclose(serial.toarray(), parallel.toarray())
+
+    serial = zmolecule.get_grad_cartesian(matrix_free=True)(dist_zmol)
+    parallel = zmolecule.get_grad_cartesian(matrix_free=True,
+                                            n_jobs=2)(dist_zmol)
+    assert np.allclose(serial.loc[:, ['x', 'y', 'z']],
+                       parallel.loc[:, ['x', 'y', 'z']])
+
+
+def test_transform_hess():
+    path = os.path.join(STRUCTURE_PATH, 'temp_lig.xyz')
+    molecule = cc.Cartesian.read_xyz(path, start_index=1)
+    rotation = cc.xyz_functions.get_rotation_matrix([1., 2., 3.], 0.7)
+    molecule = cc.xyz_functions.dot(rotation, molecule) + [0.5, -1.2, 2.]
+    c_table = molecule.get_construction_table()
+    molecule = molecule.loc[c_table.index]
+    zmolecule = molecule.get_zmat(c_table)
+    random = np.random.RandomState(11)
+    n_atoms = len(zmolecule)
+
+    zmat_grad = zmolecule.copy()
+    zmat_grad.unsafe_loc[:, ['bond', 'angle', 'dihedral']] = random.normal(
+        size=(n_atoms, 3))
+    zmat_hess = random.normal(size=(3 * n_atoms, 3 * n_atoms))
+    zmat_hess = zmat_hess + zmat_hess.T
+
+    cart_hess = cc.zmat_functions.transform_hess_to_cartesian(
+        zmolecule, zmat_hess, zmat_grad)
+    assert np.allclose(cart_hess, cart_hess.T)
+    cart_grad = cc.xyz_functions.apply_grad_zmat_transpose(
+        molecule, c_table, zmat_grad)
+    assert np.allclose(
+        cc.xyz_functions.transform_hess_to_zmat(
+            molecule, c_table, cart_hess, cart_grad),
+        zmat_hess)
+
+    sparse_cart_hess = cc.zmat_functions.transform_hess_to_cartesian(
+        zmolecule, csr_matrix(zmat_hess), zmat_grad)
+    assert issparse(sparse_cart_hess)
+    assert np.allclose(sparse_cart_hess.toarray(), cart_hess)
+    sparse_zmat_hess = cc.xyz_functions.transform_hess_to_zmat(
+        molecule, c_table, sparse_cart_hess, cart_grad)
+    assert issparse(sparse_zmat_hess)
+    assert np.allclose(sparse_zmat_hess.toarray(), zmat_hess)
@@ -0,0 +1,139 @@
+from __future__ import with_statement
+from __future__ import division
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import chemcoord as cc
+from chemcoord.exceptions import InvalidReference, PhysicalMeaning
+import pytest
+import numpy as np
+import os
+
+
+def get_script_path():
+    return os.path.dirname(os.path.realpath(__file__))
+
+
+def get_structure_path(script_path):
+    test_path = os.path.join(script_path)
+    while True:
+        structure_path = os.path.join(test_path, 'structures')
+        if os.path.exists(structure_path):
+            return structure_path
+        else:
+            test_path = os.path.join(test_path, '..')
+
+
+STRUCTURE_PATH = get_structure_path(get_script_path())
+
+
+def test_arithmetic():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz'), start_index=1)
+    zm1 = molecule.get_zmat()
+    zm2 = zm1.copy()
+    zm2.safe_loc[zm1.index[10], 'dihedral'] += 20.
+    coords = ['bond', 'angle', 'dihedral']
+    za1, za2 = zm1.get_zmat_array(), zm2.get_zmat_array()
+
+    assert np.allclose((za1 + zm2).values,
+                       (zm1 + zm2).loc[:, coords].values.astype('f8'))
+    assert np.allclose((zm1 + za2).values, (za1 + za2).values)
+    assert np.allclose((2 * za1).values, (za1 * 2).values)
+    assert np.allclose((-za1).values, -zm1.loc[:, coords].values.astype('f8'))
+    assert np.allclose((za1 / 2).values, (0.5 * za1).values)
+    assert np.allclose((abs(-za1) ** 2).values, (za1 * za1).values)
+
+    steps = np.linspace(0., 1., 5)[:, None, None]
+    frames = za1 + (za2 - za1) * steps
+    assert frames.shape == (5, len(zm1), 3)
+    assert np.allclose(frames[-1].values, za2.values)
+
+    other = zm1.copy()
+    other.unsafe_loc[zm1.index[10], 'd'] = zm1.index[0]
+    with pytest.raises(PhysicalMeaning):
+        za1 + other
+
+
+def test_conversion():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz'), start_index=1)
+    zmolecule = molecule.get_zmat()
+    za = zmolecule.get_zmat_array()
+    frames = za + np.random.RandomState(6).uniform(
+        0., 0.1, size=(3, len(zmolecule), 3))
+
+    positions = frames.get_cartesian()
+    assert positions.shape == (3, len(zmolecule), 3)
+    for i, frame_positions in enumerate(positions):
+        new = frames.get_zmat(i)
+        assert np.allclose(
+            new.loc[:, ['bond', 'angle', 'dihedral']].values.astype('f8'),
+            frames.values[i])
+        expected = new.get_cartesian().loc[zmolecule.index, ['x', 'y', 'z']]
+        assert np.allclose(frame_positions, expected)
+    assert np.allclose(frames[0].get_cartesian(), positions[0])
+
+    with pytest.raises(ValueError):
+        frames.get_zmat()
+    frames.values[1, 1, 0] = 0.
+    with pytest.raises(InvalidReference):
+        frames.get_cartesian()
+
+
+def test_interpolate():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz'), start_index=1)
+    zm1 = molecule.get_zmat()
+    zm2 = zm1.copy()
+    i = zm1.index[10]
+    zm2.safe_loc[i, 'dihedral'] = zm1.loc[i, 'dihedral'] + 340.
+
+    cartesians = cc.zmat_functions.interpolate(zm1, zm2, 5)
+    assert len(cartesians) == 5
+    assert cc.xyz_functions.allclose(cartesians[0],
+                                     zm1.get_cartesian().loc[zm1.index])
+    assert cc.xyz_functions.allclose(cartesians[-1],
+                                     zm2.get_cartesian().loc[zm1.index])
+    middle = cartesians[2].get_zmat(zm1.loc[:, ['b', 'a', 'd']])
+    assert np.isclose(middle.loc[i, 'dihedral'] % 360.,
+                      (zm1.loc[i, 'dihedral'] - 10.) % 360.)
+
+    positions = cc.zmat_functions.interpolate(
+        zm1, zm2, 5, minimize_dihedrals=False, as_cartesians=False)
+    expected = zm1.copy()
+    expected.safe_loc[i, 'dihedral'] = zm1.loc[i, 'dihedral'] + 170.
+    assert np.allclose(positions[2], expected.get_cartesian().loc[
+        zm1.index, ['x', 'y', 'z']])
+
+
+def test_interpolate_through_linear_reference():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz'), start_index=1)
+    zm1 = molecule.get_zmat()
+    c_table = zm1.loc[:, ['b', 'a', 'd']]
+    # Atom 3 uses the angle of atom 6 as angle between its references
+    assert (c_table.loc[3, 'b'] == 6
+            and c_table.loc[6, 'b'] == c_table.loc[3, 'a']
+            and c_table.loc[6, 'a'] == c_table.loc[3, 'd'])
+    zm2 = zm1.copy()
+    zm2.unsafe_loc[6, 'angle'] = 360. - zm1.loc[6, 'angle']
+
+    frames = zm1.get_zmat_array() + (
+        (zm2.get_zmat_array() - zm1.get_zmat_array())
+        * np.linspace(0., 1., 3)[:, None, None])
+    with pytest.raises(InvalidReference):
+        frames.get_cartesian()
+
+    with pytest.warns(UserWarning, match='dummy atom'):
+        positions = cc.zmat_functions.interpolate(
+            zm1, zm2, 3, minimize_dihedrals=False, as_cartesians=False)
+    assert positions.shape == (3, len(zm1), 3)
+    assert np.isfinite(positions).all()
+    assert np.allclose(positions[0], zm1.get_cartesian().loc[
+        zm1.index, ['x', 'y', 'z']])
+    middle = cc.Cartesian(atoms=zm1['atom'].values, coords=positions[1],
+                          index=zm1.index)
+    assert np.isclose(middle.get_angle_degrees(
+        [[6, c_table.loc[6, 'b'], c_table.loc[6, 'a']]])[0], 180.)
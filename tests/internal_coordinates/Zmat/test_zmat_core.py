@@ -8,6 +8,7 @@ import chemcoord as cc
 from chemcoord.xyz_functions import allclose
 import pytest
 from chemcoord.exceptions import UndefinedCoordinateSystem, InvalidReference
+import numpy as np
 import os
 import sys
 from sympy import Symbol
@@ -47,3 +48,51 @@ def test_addition_with_sympy():
 
     zmolecule = zmolecule + zmolecule2
     zmolecule.subs(x, 3)
+
+
+def test_get_cartesian_trajectory():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz'), start_index=1)
+    zmolecule = molecule.get_zmat()
+    coords = ['bond', 'angle', 'dihedral']
+    values = (zmolecule.loc[:, coords].values.astype('f8')[None, :, :]
+              + np.random.RandomState(3).uniform(
+                  0., 0.1, size=(5, len(zmolecule), 3)))
+
+    positions = cc.zmat_functions.get_cartesian_trajectory(zmolecule, values)
+    assert positions.shape == (5, len(zmolecule), 3)
+    for frame_values, frame_positions in zip(values, positions):
+        frame = zmolecule.copy()
+        frame.unsafe_loc[:, coords] = frame_values
+        expected = frame.get_cartesian().loc[zmolecule.index, ['x', 'y', 'z']]
+        assert np.allclose(frame_positions, expected)
+
+    values[[1, 3], 1, 0] = 0.
+    with pytest.raises(InvalidReference) as excinfo:
+        cc.zmat_functions.get_cartesian_trajectory(zmolecule, values)
+    assert 'frames [1, 3]' in excinfo.value.message
+
+
+def test_get_cartesian_trajectory_numpy_engine():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz'), start_index=1)
+    zmolecule = molecule.get_zmat()
+    coords = ['bond', 'angle', 'dihedral']
+    values = (zmolecule.loc[:, coords].values.astype('f8')[None, :, :]
+              + np.random.RandomState(5).uniform(
+                  0., 0.1, size=(4, len(zmolecule), 3)))
+
+    positions = cc.zmat_functions.get_cartesian_trajectory(
+        zmolecule, values, engine='numpy')
+    assert np.allclose(
+        positions, cc.zmat_functions.get_cartesian_trajectory(zmolecule,
+                                                              values))
+
+    values[2, 1, 0] = 0.
+    with pytest.raises(InvalidReference) as excinfo:
+        cc.zmat_functions.get_cartesian_trajectory(zmolecule, values,
+                                                   engine='numpy')
+    assert 'frames [2]' in excinfo.value.message
+    with pytest.raises(ValueError):
+        cc.zmat_functions.get_cartesian_trajectory(zmolecule, values,
+                                                   engine='fortran')